@@ -17,6 +17,7 @@ from homeassistant import config as conf_util, config_entries, core, loader
 from homeassistant.components import http
 from homeassistant.const import REQUIRED_NEXT_PYTHON_DATE, REQUIRED_NEXT_PYTHON_VER
 from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import template
 from homeassistant.helpers.typing import ConfigType
 from homeassistant.setup import (
     DATA_SETUP,
@@ -231,6 +232,10 @@ async def async_from_config_dict(
         )
         return None
 
+    # Load the templates compiled by the previous run before the
+    # integrations validate theirs.
+    await template.async_load_bytecode_cache(hass)
+
     await _async_set_up_integrations(hass, config)
 
     stop = monotonic()
@@ -12,6 +12,7 @@ from homeassistant.auth.permissions.const import POLICY_READ
 from homeassistant.bootstrap import DATA_LOGGING
 from homeassistant.components.http import HomeAssistantView
 from homeassistant.const import (
+    CONTENT_TYPE_JSON,
     EVENT_HOMEASSISTANT_STOP,
     EVENT_TIME_CHANGED,
     HTTP_BAD_REQUEST,
@@ -34,7 +35,12 @@ from homeassistant.const import (
 import homeassistant.core as ha
 from homeassistant.exceptions import ServiceNotFound, TemplateError, Unauthorized
 from homeassistant.helpers import template
-from homeassistant.helpers.json import JSONEncoder
+from homeassistant.helpers.json import (
+    JSONEncoder,
+    state_json,
+    states_json,
+    states_snapshot_json,
+)
 from homeassistant.helpers.network import NoURLAvailableError, get_url
 from homeassistant.helpers.service import async_get_all_descriptions
 from homeassistant.helpers.state import AsyncTrackStates
@@ -223,13 +229,20 @@ class APIStatesView(HomeAssistantView):
     def get(self, request):
         """Get current states."""
         user = request["hass_user"]
-        entity_perm = user.permissions.check_entity
-        states = [
-            state
-            for state in request.app["hass"].states.async_all()
-            if entity_perm(state.entity_id, "read")
-        ]
-        return self.json(states)
+        snapshot = request.app["hass"].states.async_snapshot()
+        if user.permissions.access_all_entities("read"):
+            states = snapshot
+            encode = states_snapshot_json
+        else:
+            entity_perm = user.permissions.check_entity
+            states = [
+                state for state in snapshot if entity_perm(state.entity_id, "read")
+            ]
+            encode = states_json
+        try:
+            return _json_response(encode(states))
+        except (ValueError, TypeError):
+            return self.json(list(states))
 
 
 class APIEntityStateView(HomeAssistantView):
@@ -246,9 +259,12 @@ class APIEntityStateView(HomeAssistantView):
             raise Unauthorized(entity_id=entity_id)
 
         state = request.app["hass"].states.get(entity_id)
-        if state:
+        if not state:
+            return self.json_message("Entity not found.", HTTP_NOT_FOUND)
+        try:
+            return _json_response(state_json(state))
+        except (ValueError, TypeError):
             return self.json(state)
-        return self.json_message("Entity not found.", HTTP_NOT_FOUND)
 
     async def post(self, request, entity_id):
         """Update state of entity."""
@@ -443,3 +459,10 @@ def async_events_json(hass):
         {"event": key, "listener_count": value}
         for key, value in hass.bus.async_listeners().items()
     ]
+
+
+def _json_response(text):
+    """Return a response for JSON which is already encoded."""
+    response = web.Response(text=text, content_type=CONTENT_TYPE_JSON, status=HTTP_OK)
+    response.enable_compression()
+    return response
@@ -15,6 +15,7 @@ from homeassistant.const import (
     EVENT_HOMEASSISTANT_STOP,
     EVENT_STATE_CHANGED,
 )
+from homeassistant.core import callback
 from homeassistant.helpers import state
 import homeassistant.helpers.config_validation as cv
 
@@ -76,7 +77,9 @@ class GraphiteFeeder(threading.Thread):
 
         hass.bus.listen_once(EVENT_HOMEASSISTANT_START, self.start_listen)
         hass.bus.listen_once(EVENT_HOMEASSISTANT_STOP, self.shutdown)
-        hass.bus.listen(EVENT_STATE_CHANGED, self.event_listener)
+        self._remove_batch_listener = hass.bus.listen_batch(
+            EVENT_STATE_CHANGED, self.event_listener
+        )
         _LOGGER.debug("Graphite feeding to %s:%i initialized", self._host, self._port)
 
     def start_listen(self, event):
@@ -88,15 +91,18 @@ class GraphiteFeeder(threading.Thread):
     def shutdown(self, event):
         """Signal shutdown of processing event."""
         _LOGGER.debug("Event processing signaled exit")
+        # Removing the listener queues the events still waiting for a batch
+        self._remove_batch_listener()
         self._queue.put(self._quit_object)
 
-    def event_listener(self, event):
-        """Queue an event for processing."""
+    @callback
+    def event_listener(self, events):
+        """Queue a batch of events for processing."""
         if self.is_alive() or not self._we_started:
-            _LOGGER.debug("Received event")
-            self._queue.put(event)
+            _LOGGER.debug("Received %d events", len(events))
+            self._queue.put(events)
         else:
-            _LOGGER.error("Graphite feeder thread has died, not queuing event")
+            _LOGGER.error("Graphite feeder thread has died, not queuing events")
 
     def _send_to_graphite(self, data):
         """Send data to Graphite."""
@@ -107,60 +113,71 @@ class GraphiteFeeder(threading.Thread):
         sock.send(b"\n")
         sock.close()
 
-    def _report_attributes(self, entity_id, new_state):
-        """Report the attributes."""
+    def _report_attributes(self, states):
+        """Report the attributes of the states in one write."""
         now = time.time()
+        lines = []
+        for entity_id, new_state in states:
+            try:
+                lines.extend(self._state_lines(entity_id, new_state, now))
+            except Exception:  # pylint: disable=broad-except
+                # Only skip the state that failed, not the whole batch
+                _LOGGER.exception("Failed to process state of %s", entity_id)
+        if not lines:
+            return
+        _LOGGER.debug("Sending to graphite: %s", lines)
+        try:
+            self._send_to_graphite("\n".join(lines))
+        except socket.gaierror:
+            _LOGGER.error("Unable to connect to host %s", self._host)
+        except OSError:
+            _LOGGER.exception("Failed to send data to graphite")
+
+    def _state_lines(self, entity_id, new_state, now):
+        """Return the lines reporting the attributes of a state."""
         things = dict(new_state.attributes)
         try:
             things["state"] = state.state_as_number(new_state)
         except ValueError:
             pass
-        lines = [
+        return [
             "%s.%s.%s %f %i"
             % (self._prefix, entity_id, key.replace(" ", "_"), value, now)
             for key, value in things.items()
             if isinstance(value, (float, int))
         ]
-        if not lines:
-            return
-        _LOGGER.debug("Sending to graphite: %s", lines)
-        try:
-            self._send_to_graphite("\n".join(lines))
-        except socket.gaierror:
-            _LOGGER.error("Unable to connect to host %s", self._host)
-        except OSError:
-            _LOGGER.exception("Failed to send data to graphite")
 
     def run(self):
         """Run the process to export the data."""
         while True:
-            event = self._queue.get()
-            if event == self._quit_object:
+            events = self._queue.get()
+            if events == self._quit_object:
                 _LOGGER.debug("Event processing thread stopped")
                 self._queue.task_done()
                 return
-            if event.event_type == EVENT_STATE_CHANGED:
+            states = []
+            for event in events:
+                if event.event_type != EVENT_STATE_CHANGED:
+                    _LOGGER.warning(
+                        "Processing unexpected event type %s", event.event_type
+                    )
+                    continue
                 if not event.data.get("new_state"):
                     _LOGGER.debug(
                         "Skipping %s without new_state for %s",
                         event.event_type,
                         event.data["entity_id"],
                     )
-                    self._queue.task_done()
                     continue
+                states.append((event.data["entity_id"], event.data["new_state"]))
 
-                _LOGGER.debug(
-                    "Processing STATE_CHANGED event for %s", event.data["entity_id"]
-                )
+            if states:
+                _LOGGER.debug("Processing %d STATE_CHANGED events", len(states))
                 try:
-                    self._report_attributes(
-                        event.data["entity_id"], event.data["new_state"]
-                    )
+                    self._report_attributes(states)
                 except Exception:  # pylint: disable=broad-except
                     # Catch this so we can avoid the thread dying and
                     # make it visible.
-                    _LOGGER.exception("Failed to process STATE_CHANGED event")
-            else:
-                _LOGGER.warning("Processing unexpected event type %s", event.event_type)
+                    _LOGGER.exception("Failed to process STATE_CHANGED events")
 
             self._queue.task_done()
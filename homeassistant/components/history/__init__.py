@@ -1,38 +1,54 @@
 """Provide pre-made queries on top of the recorder component."""
+import asyncio
 from collections import defaultdict
 from datetime import datetime as dt, timedelta
-from itertools import groupby
+from itertools import chain, groupby
 import json
 import logging
+import math
+from operator import attrgetter
+import threading
 import time
 from typing import Iterable, Optional, cast
 
 from aiohttp import web
-from sqlalchemy import and_, bindparam, func, not_, or_
+from aiohttp.hdrs import CONTENT_TYPE
+from sqlalchemy import and_, bindparam, func, not_, or_, select
 from sqlalchemy.ext import baked
 import voluptuous as vol
 
-from homeassistant.components import recorder
+from homeassistant.components import recorder, websocket_api
 from homeassistant.components.http import HomeAssistantView
+from homeassistant.components.recorder import statistics
 from homeassistant.components.recorder.models import (
+    StateAttributes,
     States,
+    StatesMeta,
     process_timestamp,
-    process_timestamp_to_utc_isoformat,
+    timestamp_to_utc_isoformat,
 )
-from homeassistant.components.recorder.util import execute, session_scope
+from homeassistant.components.recorder.util import (
+    entity_ids_filter,
+    execute,
+    get_metadata_ids,
+    session_scope,
+)
+from homeassistant.components.websocket_api.const import JSON_DUMP
 from homeassistant.const import (
     CONF_DOMAINS,
     CONF_ENTITIES,
     CONF_EXCLUDE,
     CONF_INCLUDE,
+    CONTENT_TYPE_JSON,
     HTTP_BAD_REQUEST,
 )
-from homeassistant.core import Context, State, split_entity_id
+from homeassistant.core import Context, State, callback, split_entity_id
 import homeassistant.helpers.config_validation as cv
 from homeassistant.helpers.entityfilter import (
     CONF_ENTITY_GLOBS,
     INCLUDE_EXCLUDE_BASE_FILTER_SCHEMA,
 )
+from homeassistant.helpers.event import async_track_state_change_event
 from homeassistant.helpers.typing import HomeAssistantType
 import homeassistant.util.dt as dt_util
 
@@ -79,12 +95,30 @@ QUERY_STATES = [
     States.domain,
     States.entity_id,
     States.state,
-    States.attributes,
-    States.last_changed,
-    States.last_updated,
+    # Rows written before schema 12 store their own attributes
+    func.coalesce(StateAttributes.shared_attrs, States.attributes).label("attributes"),
+    States.last_changed_ts,
+    States.last_updated_ts,
 ]
 
 HISTORY_BAKERY = "history_bakery"
+HISTORY_FILTERS = "history_filters"
+
+# States fetched and serialized together when streaming, and the number
+# of serialized chunks that may wait for the client
+STREAM_CHUNK_SIZE = 1000
+STREAM_MAX_CHUNKS = 2
+
+# With use_statistics, wider windows are served from the statistics rollups
+STATISTICS_SHORT_TERM_WINDOW = timedelta(days=1)
+STATISTICS_HOURLY_WINDOW = timedelta(days=7)
+
+
+def _query_states(session):
+    """Query the QUERY_STATES columns with the shared attributes joined in."""
+    return session.query(*QUERY_STATES).outerjoin(
+        StateAttributes, States.attributes_id == StateAttributes.attributes_id
+    )
 
 
 def get_significant_states(hass, *args, **kwargs):
@@ -113,83 +147,116 @@ def _get_significant_states(
     """
     timer_start = time.perf_counter()
 
-    baked_query = hass.data[HISTORY_BAKERY](
-        lambda session: session.query(*QUERY_STATES)
+    states = execute(
+        _significant_states_query(
+            hass,
+            session,
+            start_time,
+            end_time,
+            entity_ids,
+            filters,
+            significant_changes_only,
+        )
+    )
+
+    if _LOGGER.isEnabledFor(logging.DEBUG):
+        elapsed = time.perf_counter() - timer_start
+        _LOGGER.debug("get_significant_states took %fs", elapsed)
+
+    return _sorted_states_to_json(
+        hass,
+        session,
+        states,
+        start_time,
+        entity_ids,
+        filters,
+        include_start_time_state,
+        minimal_response,
     )
 
+
+def _significant_states_query(
+    hass,
+    session,
+    start_time,
+    end_time,
+    entity_ids,
+    filters,
+    significant_changes_only,
+):
+    """Return the query of the significant states grouped by entity.
+
+    The states of an entity are sorted by last_updated.
+    """
+    use_metadata_id = _use_metadata_id(hass)
+    baked_query = hass.data[HISTORY_BAKERY](lambda session: _query_states(session))
+
     if significant_changes_only:
         baked_query += lambda q: q.filter(
             (
                 States.domain.in_(SIGNIFICANT_DOMAINS)
-                | (States.last_changed == States.last_updated)
+                | (States.last_changed_ts == States.last_updated_ts)
             )
-            & (States.last_updated > bindparam("start_time"))
+            & (States.last_updated_ts > bindparam("start_time"))
         )
     else:
-        baked_query += lambda q: q.filter(States.last_updated > bindparam("start_time"))
-
-    if entity_ids is not None:
         baked_query += lambda q: q.filter(
-            States.entity_id.in_(bindparam("entity_ids", expanding=True))
+            States.last_updated_ts > bindparam("start_time")
         )
+
+    metadata_ids = None
+    if entity_ids is not None:
+        metadata_ids = get_metadata_ids(hass, session, entity_ids)
+        _bake_entity_ids_filter(baked_query, metadata_ids)
     else:
         baked_query += lambda q: q.filter(~States.domain.in_(IGNORE_DOMAINS))
         if filters:
-            filters.bake(baked_query)
+            filters.bake(baked_query, use_metadata_id)
 
     if end_time is not None:
-        baked_query += lambda q: q.filter(States.last_updated < bindparam("end_time"))
-
-    baked_query += lambda q: q.order_by(States.entity_id, States.last_updated)
-
-    states = execute(
-        baked_query(session).params(
-            start_time=start_time, end_time=end_time, entity_ids=entity_ids
+        baked_query += lambda q: q.filter(
+            States.last_updated_ts < bindparam("end_time")
         )
-    )
 
-    if _LOGGER.isEnabledFor(logging.DEBUG):
-        elapsed = time.perf_counter() - timer_start
-        _LOGGER.debug("get_significant_states took %fs", elapsed)
+    _bake_order_by_entity(baked_query, use_metadata_id)
 
-    return _sorted_states_to_json(
-        hass,
-        session,
-        states,
-        start_time,
-        entity_ids,
-        filters,
-        include_start_time_state,
-        minimal_response,
+    return baked_query(session).params(
+        start_time=start_time.timestamp(),
+        end_time=end_time.timestamp() if end_time is not None else None,
+        entity_ids=entity_ids,
+        metadata_ids=metadata_ids,
     )
 
 
 def state_changes_during_period(hass, start_time, end_time=None, entity_id=None):
     """Return states changes during UTC period start_time - end_time."""
     with session_scope(hass=hass) as session:
-        baked_query = hass.data[HISTORY_BAKERY](
-            lambda session: session.query(*QUERY_STATES)
-        )
+        baked_query = hass.data[HISTORY_BAKERY](lambda session: _query_states(session))
 
         baked_query += lambda q: q.filter(
-            (States.last_changed == States.last_updated)
-            & (States.last_updated > bindparam("start_time"))
+            (States.last_changed_ts == States.last_updated_ts)
+            & (States.last_updated_ts > bindparam("start_time"))
         )
 
         if end_time is not None:
             baked_query += lambda q: q.filter(
-                States.last_updated < bindparam("end_time")
+                States.last_updated_ts < bindparam("end_time")
             )
 
+        metadata_ids = None
         if entity_id is not None:
-            baked_query += lambda q: q.filter_by(entity_id=bindparam("entity_id"))
             entity_id = entity_id.lower()
+            metadata_ids = get_metadata_ids(hass, session, [entity_id])
+            _bake_entity_ids_filter(baked_query, metadata_ids)
 
-        baked_query += lambda q: q.order_by(States.entity_id, States.last_updated)
+        _bake_order_by_entity(baked_query, _use_metadata_id(hass))
 
         states = execute(
             baked_query(session).params(
-                start_time=start_time, end_time=end_time, entity_id=entity_id
+                start_time=start_time.timestamp(),
+                end_time=end_time.timestamp() if end_time is not None else None,
+                entity_ids=[entity_id],
+                metadata_ids=metadata_ids,
             )
         )
 
@@ -203,24 +270,33 @@ def get_last_state_changes(hass, number_of_states, entity_id):
     start_time = dt_util.utcnow()
 
     with session_scope(hass=hass) as session:
-        baked_query = hass.data[HISTORY_BAKERY](
-            lambda session: session.query(*QUERY_STATES)
+        baked_query = hass.data[HISTORY_BAKERY](lambda session: _query_states(session))
+        baked_query += lambda q: q.filter(
+            States.last_changed_ts == States.last_updated_ts
         )
-        baked_query += lambda q: q.filter(States.last_changed == States.last_updated)
 
+        metadata_ids = None
         if entity_id is not None:
-            baked_query += lambda q: q.filter_by(entity_id=bindparam("entity_id"))
             entity_id = entity_id.lower()
+            metadata_ids = get_metadata_ids(hass, session, [entity_id])
+            _bake_entity_ids_filter(baked_query, metadata_ids)
 
-        baked_query += lambda q: q.order_by(
-            States.entity_id, States.last_updated.desc()
-        )
+        if _use_metadata_id(hass):
+            baked_query += lambda q: q.order_by(
+                States.metadata_id, States.last_updated_ts.desc()
+            )
+        else:
+            baked_query += lambda q: q.order_by(
+                States.entity_id, States.last_updated_ts.desc()
+            )
 
         baked_query += lambda q: q.limit(bindparam("number_of_states"))
 
         states = execute(
             baked_query(session).params(
-                number_of_states=number_of_states, entity_id=entity_id
+                number_of_states=number_of_states,
+                entity_ids=[entity_id],
+                metadata_ids=metadata_ids,
             )
         )
 
@@ -236,6 +312,39 @@ def get_last_state_changes(hass, number_of_states, entity_id):
         )
 
 
+def _use_metadata_id(hass):
+    """Return if all states have a metadata_id to filter and sort them on."""
+    return hass.data[recorder.DATA_INSTANCE].states_meta_migrated
+
+
+def _bake_order_by_entity(baked_query, use_metadata_id):
+    """Sort a baked query on the entity and last_updated.
+
+    The metadata_id is indexed together with last_updated, the
+    entity_id only until all states have a metadata_id.
+    """
+    if use_metadata_id:
+        baked_query += lambda q: q.order_by(States.metadata_id, States.last_updated_ts)
+    else:
+        baked_query += lambda q: q.order_by(States.entity_id, States.last_updated_ts)
+
+
+def _bake_entity_ids_filter(baked_query, metadata_ids):
+    """Filter a baked query on the metadata_ids or entity_ids parameter.
+
+    States are filtered on the entity_id until all of them have
+    a metadata_id, see get_metadata_ids.
+    """
+    if metadata_ids is None:
+        baked_query += lambda q: q.filter(
+            States.entity_id.in_(bindparam("entity_ids", expanding=True))
+        )
+    else:
+        baked_query += lambda q: q.filter(
+            States.metadata_id.in_(bindparam("metadata_ids", expanding=True))
+        )
+
+
 def get_states(hass, utc_point_in_time, entity_ids=None, run=None, filters=None):
     """Return the states at a specific point in time."""
     if run is None:
@@ -270,19 +379,24 @@ def _get_states_with_session(
     # We have more than one entity to look at (most commonly we want
     # all entities,) so we need to do a search on all states since the
     # last recorder run started.
-    query = session.query(*QUERY_STATES)
+    query = _query_states(session)
+
+    # Group on the integer metadata_id once all states have one
+    use_metadata_id = _use_metadata_id(hass)
+    entity_column = States.metadata_id if use_metadata_id else States.entity_id
 
     most_recent_states_by_date = session.query(
-        States.entity_id.label("max_entity_id"),
-        func.max(States.last_updated).label("max_last_updated"),
+        entity_column.label("max_entity_id"),
+        func.max(States.last_updated_ts).label("max_last_updated"),
     ).filter(
-        (States.last_updated >= run.start) & (States.last_updated < utc_point_in_time)
+        (States.last_updated_ts >= process_timestamp(run.start).timestamp())
+        & (States.last_updated_ts < utc_point_in_time.timestamp())
     )
 
     if entity_ids:
         most_recent_states_by_date.filter(States.entity_id.in_(entity_ids))
 
-    most_recent_states_by_date = most_recent_states_by_date.group_by(States.entity_id)
+    most_recent_states_by_date = most_recent_states_by_date.group_by(entity_column)
 
     most_recent_states_by_date = most_recent_states_by_date.subquery()
 
@@ -291,12 +405,12 @@ def _get_states_with_session(
     ).join(
         most_recent_states_by_date,
         and_(
-            States.entity_id == most_recent_states_by_date.c.max_entity_id,
-            States.last_updated == most_recent_states_by_date.c.max_last_updated,
+            entity_column == most_recent_states_by_date.c.max_entity_id,
+            States.last_updated_ts == most_recent_states_by_date.c.max_last_updated,
         ),
     )
 
-    most_recent_state_ids = most_recent_state_ids.group_by(States.entity_id)
+    most_recent_state_ids = most_recent_state_ids.group_by(entity_column)
 
     most_recent_state_ids = most_recent_state_ids.subquery()
 
@@ -306,30 +420,35 @@ def _get_states_with_session(
     )
 
     if entity_ids is not None:
-        query = query.filter(States.entity_id.in_(entity_ids))
+        query = query.filter(entity_ids_filter(hass, session, entity_ids))
     else:
         query = query.filter(~States.domain.in_(IGNORE_DOMAINS))
         if filters:
-            query = filters.apply(query)
+            query = filters.apply(query, use_metadata_id)
 
-    return [LazyState(row) for row in execute(query)]
+    # A single state per entity, sorting them here spares the
+    # database sorting on the entity_id which is not indexed
+    return sorted(
+        (LazyState(row) for row in execute(query)), key=attrgetter("entity_id")
+    )
 
 
 def _get_single_entity_states_with_session(hass, session, utc_point_in_time, entity_id):
     # Use an entirely different (and extremely fast) query if we only
     # have a single entity id
-    baked_query = hass.data[HISTORY_BAKERY](
-        lambda session: session.query(*QUERY_STATES)
-    )
+    baked_query = hass.data[HISTORY_BAKERY](lambda session: _query_states(session))
     baked_query += lambda q: q.filter(
-        States.last_updated < bindparam("utc_point_in_time"),
-        States.entity_id == bindparam("entity_id"),
+        States.last_updated_ts < bindparam("utc_point_in_time")
     )
-    baked_query += lambda q: q.order_by(States.last_updated.desc())
+    metadata_ids = get_metadata_ids(hass, session, [entity_id])
+    _bake_entity_ids_filter(baked_query, metadata_ids)
+    baked_query += lambda q: q.order_by(States.last_updated_ts.desc())
     baked_query += lambda q: q.limit(1)
 
     query = baked_query(session).params(
-        utc_point_in_time=utc_point_in_time, entity_id=entity_id
+        utc_point_in_time=utc_point_in_time.timestamp(),
+        entity_ids=[entity_id],
+        metadata_ids=metadata_ids,
     )
 
     return [LazyState(row) for row in execute(query)]
@@ -350,7 +469,7 @@ def _sorted_states_to_json(
     This takes our state list and turns it into a JSON friendly data
     structure {'entity_id': [list of states], 'entity_id2': [list of states]}
 
-    States must be sorted by entity_id and last_updated
+    States must be grouped by entity and sorted by last_updated
 
     We also need to go back and create a synthetic zero data point for
     each list of states, otherwise our graphs won't start on the Y
@@ -377,53 +496,276 @@ def _sorted_states_to_json(
         elapsed = time.perf_counter() - timer_start
         _LOGGER.debug("getting %d first datapoints took %fs", len(result), elapsed)
 
-    # Called in a tight loop so cache the function
-    # here
-    _process_timestamp_to_utc_isoformat = process_timestamp_to_utc_isoformat
-
     # Append all changes to it
     for ent_id, group in groupby(states, lambda state: state.entity_id):
-        domain = split_entity_id(ent_id)[0]
         ent_results = result[ent_id]
-        if not minimal_response or domain in NEED_ATTRIBUTE_DOMAINS:
-            ent_results.extend(LazyState(db_state) for db_state in group)
-
-        # With minimal response we only provide a native
-        # State for the first and last response. All the states
-        # in-between only provide the "state" and the
-        # "last_changed".
-        if not ent_results:
-            ent_results.append(LazyState(next(group)))
-
-        prev_state = ent_results[-1]
-        initial_state_count = len(ent_results)
-
-        for db_state in group:
-            # With minimal response we do not care about attribute
-            # changes so we can filter out duplicate states
-            if db_state.state == prev_state.state:
-                continue
-
-            ent_results.append(
-                {
-                    STATE_KEY: db_state.state,
-                    LAST_CHANGED_KEY: _process_timestamp_to_utc_isoformat(
-                        db_state.last_changed
-                    ),
-                }
+        ent_results.extend(
+            _entity_states(
+                ent_results[0] if ent_results else None, group, minimal_response
             )
-            prev_state = db_state
-
-        if prev_state and len(ent_results) != initial_state_count:
-            # There was at least one state change
-            # replace the last minimal state with
-            # a full state
-            ent_results[-1] = LazyState(prev_state)
+        )
 
     # Filter out the empty lists if some states had 0 results.
     return {key: val for key, val in result.items() if val}
 
 
+def _stream_significant_states_json(
+    hass,
+    session,
+    start_time,
+    end_time=None,
+    entity_ids=None,
+    filters=None,
+    include_start_time_state=True,
+    significant_changes_only=True,
+    minimal_response=False,
+):
+    """Yield the significant states as JSON in chunks of STREAM_CHUNK_SIZE states.
+
+    The result is the list of per entity state lists returned by the
+    history API. The rows are fetched from a server side cursor so only
+    a chunk of them is held in memory. Entities are in the order of the
+    query, the ones without changes in the period come last.
+    """
+    start_states = {}
+    if include_start_time_state:
+        start_states = _start_time_states(
+            hass, session, start_time, entity_ids, filters
+        )
+
+    rows = _significant_states_query(
+        hass,
+        session,
+        start_time,
+        end_time,
+        entity_ids,
+        filters,
+        significant_changes_only,
+    ).with_post_criteria(lambda query: query.yield_per(STREAM_CHUNK_SIZE))
+
+    def entity_states():
+        """Yield the states of each entity."""
+        for ent_id, group in groupby(rows, lambda state: state.entity_id):
+            start_state = start_states.pop(ent_id, None)
+            states = _entity_states(start_state, group, minimal_response)
+            if start_state is not None:
+                states = chain((start_state,), states)
+            yield states
+        for start_state in start_states.values():
+            yield (start_state,)
+
+    parts = ["["]
+    pending = 0
+    for index, states in enumerate(entity_states()):
+        parts.append(",[" if index else "[")
+        chunk = []
+        separator = ""
+        for state in states:
+            chunk.append(state)
+            if pending + len(chunk) >= STREAM_CHUNK_SIZE:
+                parts.append(separator + JSON_DUMP(chunk)[1:-1])
+                yield "".join(parts)
+                parts = []
+                chunk = []
+                pending = 0
+                separator = ","
+        if chunk:
+            parts.append(separator + JSON_DUMP(chunk)[1:-1])
+            pending += len(chunk)
+        parts.append("]")
+    parts.append("]")
+    yield "".join(parts)
+
+
+def _entity_states(start_state, group, minimal_response):
+    """Yield the states of an entity following its state at the start time.
+
+    With minimal response we only provide a native State for the
+    first and last response. All the states in-between only provide
+    the "state" and the "last_changed".
+    """
+    group = iter(group)
+    first_row = next(group)
+    domain = split_entity_id(first_row.entity_id)[0]
+    if not minimal_response or domain in NEED_ATTRIBUTE_DOMAINS:
+        yield LazyState(first_row)
+        yield from (LazyState(db_state) for db_state in group)
+        return
+
+    prev_state = start_state
+    if prev_state is None:
+        prev_state = LazyState(first_row)
+        yield prev_state
+    else:
+        group = chain((first_row,), group)
+
+    # Called in a tight loop so cache the function
+    # here
+    _timestamp_to_utc_isoformat = timestamp_to_utc_isoformat
+
+    changed_state = None
+    for db_state in group:
+        # With minimal response we do not care about attribute
+        # changes so we can filter out duplicate states
+        if db_state.state == prev_state.state:
+            continue
+
+        if changed_state is not None:
+            yield {
+                STATE_KEY: changed_state.state,
+                LAST_CHANGED_KEY: _timestamp_to_utc_isoformat(
+                    changed_state.last_changed_ts
+                ),
+            }
+        changed_state = prev_state = db_state
+
+    if changed_state is not None:
+        # The last state change is a full state
+        yield LazyState(changed_state)
+
+
+def _start_time_states(hass, session, start_time, entity_ids, filters):
+    """Return the states at start_time by entity_id, sorted by entity_id."""
+    start_states = {}
+    run = recorder.run_information_from_instance(hass, start_time)
+    for state in _get_states_with_session(
+        hass, session, start_time, entity_ids, run=run, filters=filters
+    ):
+        state.last_changed = start_time
+        state.last_updated = start_time
+        start_states[state.entity_id] = state
+    return start_states
+
+
+def _get_compact_states(
+    hass,
+    session,
+    start_time,
+    end_time=None,
+    entity_ids=None,
+    filters=None,
+    include_start_time_state=True,
+    significant_changes_only=True,
+):
+    """Return the significant states in the compact format by entity_id.
+
+    See _compact_entity_states for the format.
+    """
+    rows = execute(
+        _significant_states_query(
+            hass,
+            session,
+            start_time,
+            end_time,
+            entity_ids,
+            filters,
+            significant_changes_only,
+        )
+    )
+
+    start_states = {}
+    if include_start_time_state:
+        start_states = _start_time_states(
+            hass, session, start_time, entity_ids, filters
+        )
+
+    result = {}
+    # Keep the order of the requested entities
+    for ent_id in entity_ids or ():
+        result[ent_id] = None
+    for ent_id, group in groupby(rows, lambda state: state.entity_id):
+        result[ent_id] = _compact_entity_states(start_states.pop(ent_id, None), group)
+    for ent_id, start_state in start_states.items():
+        result[ent_id] = _compact_entity_states(start_state, ())
+
+    return {ent_id: states for ent_id, states in result.items() if states}
+
+
+def _compact_entity_states(start_state, rows):
+    """Return the states of an entity as columns.
+
+    t: the last_updated times in milliseconds, the first one since the
+       epoch and each following one relative to the one before it
+    v: the states, numeric states are parsed to float
+    a: the attributes of the last state
+    av: the attributes of every state, only for the domains in
+        NEED_ATTRIBUTE_DOMAINS. The other domains only get a point
+        when the state changes.
+    """
+    times = []
+    values = []
+    attributes = []
+    last_attributes = None
+    prev_time = 0
+    prev_value = None
+
+    if start_state is not None:
+        domain = split_entity_id(start_state.entity_id)[0]
+        points = chain(
+            (
+                (
+                    start_state.state,
+                    start_state.last_updated.timestamp(),
+                    start_state.attributes,
+                ),
+            ),
+            ((row.state, row.last_updated_ts, row.attributes) for row in rows),
+        )
+    else:
+        rows = iter(rows)
+        first_row = next(rows, None)
+        if first_row is None:
+            return None
+        domain = split_entity_id(first_row.entity_id)[0]
+        points = (
+            (row.state, row.last_updated_ts, row.attributes)
+            for row in chain((first_row,), rows)
+        )
+
+    need_attributes = domain in NEED_ATTRIBUTE_DOMAINS
+    for state, last_updated_ts, state_attributes in points:
+        value = _compact_value(state)
+        if not need_attributes and times and value == prev_value:
+            last_attributes = state_attributes
+            continue
+        point_time = round(last_updated_ts * 1000)
+        times.append(point_time - prev_time)
+        values.append(value)
+        if need_attributes:
+            attributes.append(_compact_attributes(state_attributes))
+        last_attributes = state_attributes
+        prev_time = point_time
+        prev_value = value
+
+    if not times:
+        return None
+
+    result = {"t": times, "v": values, "a": _compact_attributes(last_attributes)}
+    if need_attributes:
+        result["av"] = attributes
+    return result
+
+
+def _compact_value(state):
+    """Return a numeric state as float, other states unchanged."""
+    try:
+        value = float(state)
+    except (TypeError, ValueError):
+        return state
+    return value if math.isfinite(value) else state
+
+
+def _compact_attributes(attributes):
+    """Return the attributes of a LazyState or the json of a row as dict."""
+    if isinstance(attributes, dict):
+        return attributes
+    try:
+        return json.loads(attributes)
+    except (TypeError, ValueError):
+        _LOGGER.exception("Error converting row attributes: %s", attributes)
+        return {}
+
+
 def get_state(hass, utc_point_in_time, entity_id, run=None):
     """Return a state at a specific point in time."""
     states = get_states(hass, utc_point_in_time, (entity_id,), run)
@@ -437,10 +779,13 @@ async def async_setup(hass, config):
     filters = sqlalchemy_filter_from_include_exclude_conf(conf)
 
     hass.data[HISTORY_BAKERY] = baked.bakery()
+    hass.data[HISTORY_FILTERS] = filters
 
     use_include_order = conf.get(CONF_ORDER)
 
     hass.http.register_view(HistoryPeriodView(filters, use_include_order))
+    websocket_api.async_register_command(hass, ws_history_during_period)
+    websocket_api.async_register_command(hass, ws_stream)
     hass.components.frontend.async_register_built_in_panel(
         "history", "history", "hass:poll-box"
     )
@@ -448,6 +793,183 @@ async def async_setup(hass, config):
     return True
 
 
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): "history/history_during_period",
+        vol.Required("start_time"): str,
+        vol.Optional("end_time"): str,
+        vol.Optional("entity_ids"): [cv.entity_id],
+        vol.Optional("include_start_time_state", default=True): bool,
+        vol.Optional("significant_changes_only", default=True): bool,
+        vol.Optional("minimal_response", default=False): bool,
+        vol.Optional("compact", default=False): bool,
+    }
+)
+@websocket_api.async_response
+async def ws_history_during_period(hass, connection, msg):
+    """Return the history of a period by entity_id."""
+    start_time = dt_util.parse_datetime(msg["start_time"])
+    if start_time is None:
+        connection.send_error(msg["id"], "invalid_start_time", "Invalid start_time")
+        return
+    start_time = dt_util.as_utc(start_time)
+
+    end_time = None
+    if "end_time" in msg:
+        end_time = dt_util.parse_datetime(msg["end_time"])
+        if end_time is None:
+            connection.send_error(msg["id"], "invalid_end_time", "Invalid end_time")
+            return
+        end_time = dt_util.as_utc(end_time)
+
+    if start_time > dt_util.utcnow():
+        connection.send_result(msg["id"], {})
+        return
+
+    result = await hass.async_add_executor_job(
+        _history_during_period, hass, msg, start_time, end_time
+    )
+    await connection.send_big_result(msg["id"], result)
+
+
+def _history_during_period(hass, msg, start_time, end_time):
+    """Fetch the history of a period for ws_history_during_period."""
+    entity_ids = msg.get("entity_ids")
+    filters = None if entity_ids else hass.data[HISTORY_FILTERS]
+    with session_scope(hass=hass) as session:
+        if msg["compact"]:
+            return _get_compact_states(
+                hass,
+                session,
+                start_time,
+                end_time,
+                entity_ids,
+                filters,
+                msg["include_start_time_state"],
+                msg["significant_changes_only"],
+            )
+        return _get_significant_states(
+            hass,
+            session,
+            start_time,
+            end_time,
+            entity_ids,
+            filters,
+            msg["include_start_time_state"],
+            msg["significant_changes_only"],
+            msg["minimal_response"],
+        )
+
+
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): "history/stream",
+        vol.Required("start_time"): str,
+        vol.Required("entity_ids"): [cv.entity_id],
+        vol.Optional("include_start_time_state", default=True): bool,
+        vol.Optional("significant_changes_only", default=True): bool,
+    }
+)
+@websocket_api.async_response
+async def ws_stream(hass, connection, msg):
+    """Send the history of entities since start_time followed by their changes.
+
+    The state changes are subscribed to before the history is fetched and
+    buffered until it is sent, together with the current states to cover
+    changes the recorder did not commit yet. A buffered state is only sent
+    when it is newer than the last state sent for its entity, so there is
+    no gap and no duplicate between the history and the live changes.
+    """
+    msg_id = msg["id"]
+    start_time = dt_util.parse_datetime(msg["start_time"])
+    if start_time is None:
+        connection.send_error(msg_id, "invalid_start_time", "Invalid start_time")
+        return
+    start_time = dt_util.as_utc(start_time)
+    entity_ids = msg["entity_ids"]
+    significant_changes_only = msg["significant_changes_only"]
+    pending = []
+    last_updated = {}
+
+    @callback
+    def forward_state(event):
+        """Forward a state change to websocket."""
+        new_state = event.data["new_state"]
+        if not _is_streamed(new_state, significant_changes_only):
+            return
+        if pending is not None:
+            pending.append(new_state)
+            return
+        _send_states(connection, msg_id, [new_state])
+
+    connection.subscriptions[msg_id] = async_track_state_change_event(
+        hass, entity_ids, forward_state
+    )
+    pending.extend(
+        state
+        for state in (hass.states.get(entity_id) for entity_id in entity_ids)
+        if _is_streamed(state, significant_changes_only)
+    )
+    connection.send_result(msg_id)
+
+    if start_time <= dt_util.utcnow():
+        history = await hass.async_add_executor_job(
+            _stream_history, hass, msg, start_time, last_updated
+        )
+        if msg_id not in connection.subscriptions:
+            return
+        connection.send_message(history)
+
+    buffered = [
+        state
+        for state in pending
+        if state is not None
+        and state.last_updated > last_updated.get(state.entity_id, start_time)
+    ]
+    pending = None
+    if buffered:
+        _send_states(connection, msg_id, buffered)
+
+
+def _is_streamed(state, significant_changes_only):
+    """Return if a state is sent by history/stream."""
+    return state is not None and (
+        not significant_changes_only
+        or state.domain in SIGNIFICANT_DOMAINS
+        or state.last_changed == state.last_updated
+    )
+
+
+def _stream_history(hass, msg, start_time, last_updated):
+    """Fetch the history for ws_stream as JSON.
+
+    The time of the last state of each entity is stored in last_updated.
+    """
+    with session_scope(hass=hass) as session:
+        states = _get_significant_states(
+            hass,
+            session,
+            start_time,
+            None,
+            msg["entity_ids"],
+            None,
+            msg["include_start_time_state"],
+            msg["significant_changes_only"],
+        )
+    for entity_id, entity_states in states.items():
+        last_updated[entity_id] = entity_states[-1].last_updated
+    return JSON_DUMP(websocket_api.event_message(msg["id"], {"states": states}))
+
+
+@callback
+def _send_states(connection, msg_id, states):
+    """Send states grouped by entity_id to websocket."""
+    grouped = defaultdict(list)
+    for state in states:
+        grouped[state.entity_id].append(state)
+    connection.send_message(websocket_api.event_message(msg_id, {"states": grouped}))
+
+
 class HistoryPeriodView(HomeAssistantView):
     """Handle history period requests."""
 
@@ -502,6 +1024,10 @@ class HistoryPeriodView(HomeAssistantView):
 
         minimal_response = "minimal_response" in request.query
 
+        statistics_period = None
+        if "use_statistics" in request.query and entity_ids:
+            statistics_period = _statistics_period(end_time - start_time)
+
         hass = request.app["hass"]
 
         if (
@@ -511,6 +1037,32 @@ class HistoryPeriodView(HomeAssistantView):
         ):
             return self.json([])
 
+        if "compact" in request.query:
+            return cast(
+                web.Response,
+                await hass.async_add_executor_job(
+                    self._compact_significant_states_json,
+                    hass,
+                    start_time,
+                    end_time,
+                    entity_ids,
+                    include_start_time_state,
+                    significant_changes_only,
+                ),
+            )
+
+        if "stream" in request.query and statistics_period is None:
+            return await self._stream_significant_states_json(
+                request,
+                hass,
+                start_time,
+                end_time,
+                entity_ids,
+                include_start_time_state,
+                significant_changes_only,
+                minimal_response,
+            )
+
         return cast(
             web.Response,
             await hass.async_add_executor_job(
@@ -522,9 +1074,112 @@ class HistoryPeriodView(HomeAssistantView):
                 include_start_time_state,
                 significant_changes_only,
                 minimal_response,
+                statistics_period,
             ),
         )
 
+    async def _stream_significant_states_json(
+        self,
+        request,
+        hass,
+        start_time,
+        end_time,
+        entity_ids,
+        include_start_time_state,
+        significant_changes_only,
+        minimal_response,
+    ):
+        """Stream significant states from the database as json.
+
+        The states are serialized in the executor and handed over in
+        chunks through a bounded queue, the executor waits while the
+        client is slow to read. When serializing fails the transfer is
+        aborted, the status has already been sent.
+        """
+        response = web.StreamResponse(headers={CONTENT_TYPE: CONTENT_TYPE_JSON})
+        response.enable_compression()
+        await response.prepare(request)
+
+        chunks: asyncio.Queue = asyncio.Queue(STREAM_MAX_CHUNKS)
+        stop = threading.Event()
+
+        def _produce_chunks():
+            """Serialize the states and queue them for the response."""
+            try:
+                with session_scope(hass=hass) as session:
+                    for chunk in _stream_significant_states_json(
+                        hass,
+                        session,
+                        start_time,
+                        end_time,
+                        entity_ids,
+                        self.filters,
+                        include_start_time_state,
+                        significant_changes_only,
+                        minimal_response,
+                    ):
+                        if stop.is_set():
+                            return
+                        asyncio.run_coroutine_threadsafe(
+                            chunks.put(chunk.encode("UTF-8")), hass.loop
+                        ).result()
+            finally:
+                asyncio.run_coroutine_threadsafe(chunks.put(None), hass.loop).result()
+
+        producer = hass.async_add_executor_job(_produce_chunks)
+        streamed = False
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                await response.write(chunk)
+            streamed = True
+        finally:
+            if not streamed:
+                # The client went away, stop the producer and unblock it
+                stop.set()
+                producer.cancel()
+                while not chunks.empty():
+                    chunks.get_nowait()
+
+        try:
+            await producer
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Error streaming history from %s", start_time)
+            # Ending the response would hand the client valid looking
+            # but truncated json, close the connection instead
+            if request.transport is not None:
+                request.transport.close()
+            return response
+
+        await response.write_eof()
+        return response
+
+    def _compact_significant_states_json(
+        self,
+        hass,
+        start_time,
+        end_time,
+        entity_ids,
+        include_start_time_state,
+        significant_changes_only,
+    ):
+        """Fetch significant states from the database as compact json."""
+        with session_scope(hass=hass) as session:
+            return self.json(
+                _get_compact_states(
+                    hass,
+                    session,
+                    start_time,
+                    end_time,
+                    entity_ids,
+                    self.filters,
+                    include_start_time_state,
+                    significant_changes_only,
+                )
+            )
+
     def _sorted_significant_states_json(
         self,
         hass,
@@ -534,10 +1189,25 @@ class HistoryPeriodView(HomeAssistantView):
         include_start_time_state,
         significant_changes_only,
         minimal_response,
+        statistics_period=None,
     ):
         """Fetch significant stats from the database as json."""
         timer_start = time.perf_counter()
 
+        if statistics_period is not None:
+            return self.json(
+                _statistics_and_states_json(
+                    hass,
+                    start_time,
+                    end_time,
+                    entity_ids,
+                    include_start_time_state,
+                    significant_changes_only,
+                    minimal_response,
+                    statistics_period,
+                )
+            )
+
         with session_scope(hass=hass) as session:
             result = _get_significant_states(
                 hass,
@@ -572,6 +1242,55 @@ class HistoryPeriodView(HomeAssistantView):
         return self.json(result)
 
 
+def _statistics_period(window):
+    """Return the statistics period to serve a window of history from."""
+    if window >= STATISTICS_HOURLY_WINDOW:
+        return statistics.PERIOD_HOUR
+    if window >= STATISTICS_SHORT_TERM_WINDOW:
+        return statistics.PERIOD_5MINUTE
+    return None
+
+
+def _statistics_and_states_json(
+    hass,
+    start_time,
+    end_time,
+    entity_ids,
+    include_start_time_state,
+    significant_changes_only,
+    minimal_response,
+    statistics_period,
+):
+    """Fetch the rollups of entities with statistics and states for the rest.
+
+    The result keeps the order of entity_ids.
+    """
+    result = statistics.statistics_during_period(
+        hass, start_time, end_time, entity_ids, statistics_period
+    )
+
+    state_entity_ids = [
+        entity_id for entity_id in entity_ids if entity_id not in result
+    ]
+    if state_entity_ids:
+        with session_scope(hass=hass) as session:
+            result.update(
+                _get_significant_states(
+                    hass,
+                    session,
+                    start_time,
+                    end_time,
+                    state_entity_ids,
+                    None,
+                    include_start_time_state,
+                    significant_changes_only,
+                    minimal_response,
+                )
+            )
+
+    return [result[entity_id] for entity_id in entity_ids if entity_id in result]
+
+
 def sqlalchemy_filter_from_include_exclude_conf(conf):
     """Build a sql filter from config."""
     filters = Filters()
@@ -602,12 +1321,12 @@ class Filters:
         self.included_domains = []
         self.included_entity_globs = []
 
-    def apply(self, query):
+    def apply(self, query, use_metadata_id=False):
         """Apply the entity filter."""
         if not self.has_config:
             return query
 
-        return query.filter(self.entity_filter())
+        return query.filter(self.entity_filter(use_metadata_id))
 
     @property
     def has_config(self):
@@ -624,7 +1343,7 @@ class Filters:
 
         return False
 
-    def bake(self, baked_query):
+    def bake(self, baked_query, use_metadata_id=False):
         """Update a baked query.
 
         Works the same as apply on a baked_query.
@@ -632,25 +1351,37 @@ class Filters:
         if not self.has_config:
             return
 
-        baked_query += lambda q: q.filter(self.entity_filter())
+        # The baked query caches the criteria of each lambda
+        if use_metadata_id:
+            baked_query += lambda q: q.filter(self.entity_filter(True))
+        else:
+            baked_query += lambda q: q.filter(self.entity_filter())
+
+    def entity_filter(self, use_metadata_id=False):
+        """Generate the entity filter query.
 
-    def entity_filter(self):
-        """Generate the entity filter query."""
+        With use_metadata_id the entities and globs are matched against
+        states_meta and the states are filtered on their metadata_id.
+        """
         includes = []
         if self.included_domains:
             includes.append(States.domain.in_(self.included_domains))
         if self.included_entities:
-            includes.append(States.entity_id.in_(self.included_entities))
+            includes.append(
+                _entity_ids_criterion(self.included_entities, use_metadata_id)
+            )
         for glob in self.included_entity_globs:
-            includes.append(_glob_to_like(glob))
+            includes.append(_glob_to_like(glob, use_metadata_id))
 
         excludes = []
         if self.excluded_domains:
             excludes.append(States.domain.in_(self.excluded_domains))
         if self.excluded_entities:
-            excludes.append(States.entity_id.in_(self.excluded_entities))
+            excludes.append(
+                _entity_ids_criterion(self.excluded_entities, use_metadata_id)
+            )
         for glob in self.excluded_entity_globs:
-            excludes.append(_glob_to_like(glob))
+            excludes.append(_glob_to_like(glob, use_metadata_id))
 
         if not includes and not excludes:
             return None
@@ -664,9 +1395,23 @@ class Filters:
         return or_(*includes) & not_(or_(*excludes))
 
 
-def _glob_to_like(glob_str):
+def _entity_ids_criterion(entity_ids, use_metadata_id):
+    """Match the states of entity_ids."""
+    if not use_metadata_id:
+        return States.entity_id.in_(entity_ids)
+    return States.metadata_id.in_(
+        select([StatesMeta.metadata_id]).where(StatesMeta.entity_id.in_(entity_ids))
+    )
+
+
+def _glob_to_like(glob_str, use_metadata_id=False):
     """Translate glob to sql."""
-    return States.entity_id.like(glob_str.translate(GLOB_TO_SQL_CHARS))
+    like = glob_str.translate(GLOB_TO_SQL_CHARS)
+    if not use_metadata_id:
+        return States.entity_id.like(like)
+    return States.metadata_id.in_(
+        select([StatesMeta.metadata_id]).where(StatesMeta.entity_id.like(like))
+    )
 
 
 def _entities_may_have_state_changes_after(
@@ -738,7 +1483,7 @@ class LazyState(State):
     def last_changed(self):
         """Last changed datetime."""
         if not self._last_changed:
-            self._last_changed = process_timestamp(self._row.last_changed)
+            self._last_changed = dt_util.utc_from_timestamp(self._row.last_changed_ts)
         return self._last_changed
 
     @last_changed.setter
@@ -750,7 +1495,7 @@ class LazyState(State):
     def last_updated(self):
         """Last updated datetime."""
         if not self._last_updated:
-            self._last_updated = process_timestamp(self._row.last_updated)
+            self._last_updated = dt_util.utc_from_timestamp(self._row.last_updated_ts)
         return self._last_updated
 
     @last_updated.setter
@@ -768,14 +1513,16 @@ class LazyState(State):
         if self._last_changed:
             last_changed_isoformat = self._last_changed.isoformat()
         else:
-            last_changed_isoformat = process_timestamp_to_utc_isoformat(
-                self._row.last_changed
+            last_changed_isoformat = timestamp_to_utc_isoformat(
+                self._row.last_changed_ts
             )
         if self._last_updated:
             last_updated_isoformat = self._last_updated.isoformat()
+        elif self._row.last_updated_ts == self._row.last_changed_ts:
+            last_updated_isoformat = last_changed_isoformat
         else:
-            last_updated_isoformat = process_timestamp_to_utc_isoformat(
-                self._row.last_updated
+            last_updated_isoformat = timestamp_to_utc_isoformat(
+                self._row.last_updated_ts
             )
         return {
             "entity_id": self.entity_id,
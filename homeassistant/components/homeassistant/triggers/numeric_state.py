@@ -1,5 +1,9 @@
 """Offer numeric state listening automation rules."""
+from bisect import bisect_left, bisect_right
+import itertools
 import logging
+from operator import attrgetter
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
 import voluptuous as vol
 
@@ -12,8 +16,10 @@ from homeassistant.const import (
     CONF_FOR,
     CONF_PLATFORM,
     CONF_VALUE_TEMPLATE,
+    STATE_UNAVAILABLE,
+    STATE_UNKNOWN,
 )
-from homeassistant.core import CALLBACK_TYPE, HassJob, callback
+from homeassistant.core import CALLBACK_TYPE, Event, HassJob, State, callback
 from homeassistant.helpers import condition, config_validation as cv, template
 from homeassistant.helpers.event import (
     async_track_same_state,
@@ -61,6 +67,177 @@ TRIGGER_SCHEMA = vol.All(
 
 _LOGGER = logging.getLogger(__name__)
 
+DATA_NUMERIC_STATE_INDEX = "numeric_state_trigger_index"
+
+_TRIGGER_ORDER = itertools.count()
+
+
+class _IndexedTrigger:
+    """A numeric_state trigger with fixed thresholds."""
+
+    __slots__ = ("below", "above", "triggered", "action", "order", "attached")
+
+    def __init__(
+        self,
+        below: Optional[float],
+        above: Optional[float],
+        triggered: Set[str],
+        action: Callable[[Event, bool], None],
+    ) -> None:
+        """Initialize the trigger.
+
+        triggered is the set of entities the trigger currently matches and
+        action is called with the event when an entity starts or stops
+        matching.
+        """
+        self.below = below
+        self.above = above
+        self.triggered = triggered
+        self.action = action
+        self.order = next(_TRIGGER_ORDER)
+        self.attached = True
+
+    def matches(self, value: Optional[float]) -> bool:
+        """Return True if the value is between the thresholds."""
+        return (
+            value is not None
+            and (self.below is None or value < self.below)
+            and (self.above is None or value > self.above)
+        )
+
+
+class _NumericStateIndex:
+    """The numeric_state triggers with fixed thresholds of one entity.
+
+    The state is parsed once per change for all triggers. The thresholds
+    are kept sorted: a trigger can only start or stop matching when one of
+    its thresholds lies between the previous and the new value, so only
+    those triggers are checked.
+    """
+
+    def __init__(self, entity_id: str, attribute: Optional[str]) -> None:
+        """Initialize the index."""
+        self.entity_id = entity_id
+        self.attribute = attribute
+        self.thresholds: List[float] = []
+        self.triggers: List[_IndexedTrigger] = []
+        self.value: Optional[float] = None
+        # Triggers whose matching entities may not follow the last value
+        self.unchecked: Set[_IndexedTrigger] = set()
+        self.unsub: Optional[CALLBACK_TYPE] = None
+
+    def add(self, trigger: _IndexedTrigger) -> None:
+        """Add a trigger to the index."""
+        for threshold in (trigger.below, trigger.above):
+            if threshold is None:
+                continue
+            idx = bisect_right(self.thresholds, threshold)
+            self.thresholds.insert(idx, threshold)
+            self.triggers.insert(idx, trigger)
+        self.unchecked.add(trigger)
+
+    def remove(self, trigger: _IndexedTrigger) -> None:
+        """Remove a trigger from the index."""
+        for idx in reversed(range(len(self.triggers))):
+            if self.triggers[idx] is trigger:
+                del self.thresholds[idx]
+                del self.triggers[idx]
+        self.unchecked.discard(trigger)
+
+    @callback
+    def async_state_changed(self, event: Event) -> None:
+        """Call the triggers that start or stop matching."""
+        value = _numeric_value(event.data.get("new_state"), self.attribute)
+        last_value, self.value = self.value, value
+
+        if last_value is None or value is None:
+            candidates = set(self.triggers)
+        else:
+            low, high = sorted((last_value, value))
+            candidates = set(
+                self.triggers[
+                    bisect_left(self.thresholds, low) : bisect_right(
+                        self.thresholds, high
+                    )
+                ]
+            )
+            candidates |= self.unchecked
+        self.unchecked = set()
+
+        for trigger in sorted(candidates, key=attrgetter("order")):
+            if not trigger.attached:
+                continue
+            matching = trigger.matches(value)
+            if matching == (self.entity_id in trigger.triggered):
+                continue
+            try:
+                trigger.action(event, matching)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception(
+                    "Error in numeric_state trigger for %s", self.entity_id
+                )
+                self.unchecked.add(trigger)
+                continue
+            if trigger.attached and matching != (self.entity_id in trigger.triggered):
+                self.unchecked.add(trigger)
+
+
+def _numeric_value(state: Optional[State], attribute: Optional[str]) -> Optional[float]:
+    """Return the value of the state or attribute if it is a number."""
+    if state is None or (attribute is not None and attribute not in state.attributes):
+        return None
+
+    value = state.state if attribute is None else state.attributes[attribute]
+    if value in (STATE_UNAVAILABLE, STATE_UNKNOWN):
+        return None
+
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        _LOGGER.warning(
+            "Value cannot be processed as a number: %s (Offending entity: %s)",
+            state,
+            value,
+        )
+        return None
+
+
+@callback
+def _async_attach_indexed(
+    hass, entity_ids: List[str], attribute: Optional[str], trigger: _IndexedTrigger
+) -> CALLBACK_TYPE:
+    """Add a trigger to the index of each of its entities."""
+    indexes: Dict[Tuple[str, Optional[str]], _NumericStateIndex] = hass.data.setdefault(
+        DATA_NUMERIC_STATE_INDEX, {}
+    )
+    keys = []
+    for entity_id in entity_ids:
+        key = (entity_id, attribute)
+        index = indexes.get(key)
+        if index is None:
+            index = indexes[key] = _NumericStateIndex(entity_id, attribute)
+            index.unsub = async_track_state_change_event(
+                hass, entity_id, index.async_state_changed
+            )
+        index.add(trigger)
+        keys.append(key)
+
+    @callback
+    def async_remove():
+        """Remove the trigger from the indexes."""
+        trigger.attached = False
+        for key in keys:
+            index = indexes.get(key)
+            if index is None:
+                continue
+            index.remove(trigger)
+            if not index.triggers:
+                assert index.unsub is not None
+                index.unsub()
+                del indexes[key]
+
+    return async_remove
+
 
 async def async_attach_trigger(
     hass, config, action, automation_info, *, platform_type="numeric_state"
@@ -109,6 +286,14 @@ async def async_attach_trigger(
         entity_id = event.data.get("entity_id")
         from_s = event.data.get("old_state")
         to_s = event.data.get("new_state")
+        handle_state_change(event, check_numeric_state(entity_id, from_s, to_s))
+
+    @callback
+    def handle_state_change(event, matching):
+        """Call action when the state starts matching."""
+        entity_id = event.data.get("entity_id")
+        from_s = event.data.get("old_state")
+        to_s = event.data.get("new_state")
 
         @callback
         def call_action():
@@ -130,8 +315,6 @@ async def async_attach_trigger(
                 to_s.context,
             )
 
-        matching = check_numeric_state(entity_id, from_s, to_s)
-
         if not matching:
             entities_triggered.discard(entity_id)
         elif entity_id not in entities_triggered:
@@ -161,7 +344,22 @@ async def async_attach_trigger(
             else:
                 call_action()
 
-    unsub = async_track_state_change_event(hass, entity_ids, state_automation_listener)
+    if (
+        value_template is None
+        and not isinstance(below, str)
+        and not isinstance(above, str)
+        and (attribute is None or isinstance(attribute, str))
+    ):
+        unsub = _async_attach_indexed(
+            hass,
+            entity_ids,
+            attribute,
+            _IndexedTrigger(below, above, entities_triggered, handle_state_change),
+        )
+    else:
+        unsub = async_track_state_change_event(
+            hass, entity_ids, state_automation_listener
+        )
 
     @callback
     def async_remove():
@@ -3,6 +3,7 @@ from datetime import timedelta
 from itertools import groupby
 import json
 import re
+import time
 
 import sqlalchemy
 from sqlalchemy.orm import aliased
@@ -12,12 +13,14 @@ import voluptuous as vol
 from homeassistant.components.automation import EVENT_AUTOMATION_TRIGGERED
 from homeassistant.components.history import sqlalchemy_filter_from_include_exclude_conf
 from homeassistant.components.http import HomeAssistantView
+from homeassistant.components.recorder.const import DATA_INSTANCE
 from homeassistant.components.recorder.models import (
     Events,
+    StateAttributes,
     States,
-    process_timestamp_to_utc_isoformat,
+    timestamp_to_utc_isoformat,
 )
-from homeassistant.components.recorder.util import session_scope
+from homeassistant.components.recorder.util import entity_ids_filter, session_scope
 from homeassistant.components.script import EVENT_SCRIPT_STARTED
 from homeassistant.const import (
     ATTR_DOMAIN,
@@ -65,6 +68,11 @@ GROUP_BY_MINUTES = 15
 EMPTY_JSON_OBJECT = "{}"
 UNIT_OF_MEASUREMENT_JSON = '"unit_of_measurement":'
 
+# Rows written before schema 12 store their own attributes
+STATE_ATTRIBUTES = sqlalchemy.func.coalesce(
+    StateAttributes.shared_attrs, States.attributes
+)
+
 HA_DOMAIN_ENTITY_ID = f"{HA_DOMAIN}."
 
 CONFIG_SCHEMA = vol.Schema(
@@ -90,7 +98,7 @@ ALL_EVENT_TYPES = [
 EVENT_COLUMNS = [
     Events.event_type,
     Events.event_data,
-    Events.time_fired,
+    Events.time_fired_ts,
     Events.context_id,
     Events.context_user_id,
     Events.context_parent_id,
@@ -452,7 +460,7 @@ def _get_events(
 
             query = query.union_all(
                 _generate_states_query(
-                    session, start_day, end_day, old_state, entity_ids
+                    hass, session, start_day, end_day, old_state, entity_ids
                 )
             )
         else:
@@ -461,15 +469,17 @@ def _get_events(
             query = _apply_events_types_and_states_filter(
                 hass, query, old_state
             ).filter(
-                (States.last_updated == States.last_changed)
+                (States.last_updated_ts == States.last_changed_ts)
                 | (Events.event_type != EVENT_STATE_CHANGED)
             )
             if filters:
+                use_metadata_id = hass.data[DATA_INSTANCE].states_meta_migrated
                 query = query.filter(
-                    filters.entity_filter() | (Events.event_type != EVENT_STATE_CHANGED)
+                    filters.entity_filter(use_metadata_id)
+                    | (Events.event_type != EVENT_STATE_CHANGED)
                 )
 
-        query = query.order_by(Events.time_fired)
+        query = query.order_by(Events.time_fired_ts)
 
         return list(
             humanify(hass, yield_events(query), entity_attr_cache, context_lookup)
@@ -482,7 +492,7 @@ def _generate_events_query(session):
         States.state,
         States.entity_id,
         States.domain,
-        States.attributes,
+        STATE_ATTRIBUTES.label("attributes"),
     )
 
 
@@ -496,17 +506,23 @@ def _generate_events_query_without_states(session):
     )
 
 
-def _generate_states_query(session, start_day, end_day, old_state, entity_ids):
+def _generate_states_query(hass, session, start_day, end_day, old_state, entity_ids):
     return (
         _generate_events_query(session)
         .outerjoin(Events, (States.event_id == Events.event_id))
         .outerjoin(old_state, (States.old_state_id == old_state.state_id))
+        .outerjoin(
+            StateAttributes, (States.attributes_id == StateAttributes.attributes_id)
+        )
         .filter(_missing_state_matcher(old_state))
         .filter(_continuous_entity_matcher())
-        .filter((States.last_updated > start_day) & (States.last_updated < end_day))
         .filter(
-            (States.last_updated == States.last_changed)
-            & States.entity_id.in_(entity_ids)
+            (States.last_updated_ts > start_day.timestamp())
+            & (States.last_updated_ts < end_day.timestamp())
+        )
+        .filter(
+            (States.last_updated_ts == States.last_changed_ts)
+            & entity_ids_filter(hass, session, entity_ids)
         )
     )
 
@@ -515,6 +531,9 @@ def _apply_events_types_and_states_filter(hass, query, old_state):
     events_query = (
         query.outerjoin(States, (Events.event_id == States.event_id))
         .outerjoin(old_state, (States.old_state_id == old_state.state_id))
+        .outerjoin(
+            StateAttributes, (States.attributes_id == StateAttributes.attributes_id)
+        )
         .filter(
             (Events.event_type != EVENT_STATE_CHANGED)
             | _missing_state_matcher(old_state)
@@ -544,13 +563,14 @@ def _continuous_entity_matcher():
     #
     return sqlalchemy.or_(
         sqlalchemy.not_(States.domain.in_(CONTINUOUS_DOMAINS)),
-        sqlalchemy.not_(States.attributes.contains(UNIT_OF_MEASUREMENT_JSON)),
+        sqlalchemy.not_(STATE_ATTRIBUTES.contains(UNIT_OF_MEASUREMENT_JSON)),
     )
 
 
 def _apply_event_time_filter(events_query, start_day, end_day):
     return events_query.filter(
-        (Events.time_fired > start_day) & (Events.time_fired < end_day)
+        (Events.time_fired_ts > start_day.timestamp())
+        & (Events.time_fired_ts < end_day.timestamp())
     )
 
 
@@ -696,7 +716,7 @@ class LazyEventPartialState:
         self.context_id = self._row.context_id
         self.context_user_id = self._row.context_user_id
         self.context_parent_id = self._row.context_parent_id
-        self.time_fired_minute = self._row.time_fired.minute
+        self.time_fired_minute = int(self._row.time_fired_ts // 60 % 60)
 
     @property
     def attributes_icon(self):
@@ -752,8 +772,8 @@ class LazyEventPartialState:
     def time_fired_isoformat(self):
         """Time event was fired in utc isoformat."""
         if not self._time_fired_isoformat:
-            self._time_fired_isoformat = process_timestamp_to_utc_isoformat(
-                self._row.time_fired or dt_util.utcnow()
+            self._time_fired_isoformat = timestamp_to_utc_isoformat(
+                self._row.time_fired_ts or time.time()
             )
 
         return self._time_fired_isoformat
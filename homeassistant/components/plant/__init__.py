@@ -6,7 +6,11 @@ import logging
 import voluptuous as vol
 
 from homeassistant.components.recorder.models import States
-from homeassistant.components.recorder.util import execute, session_scope
+from homeassistant.components.recorder.util import (
+    entity_ids_filter,
+    execute,
+    session_scope,
+)
 from homeassistant.const import (
     ATTR_TEMPERATURE,
     ATTR_UNIT_OF_MEASUREMENT,
@@ -313,11 +317,9 @@ class Plant(Entity):
         with session_scope(hass=self.hass) as session:
             query = (
                 session.query(States)
-                .filter(
-                    (States.entity_id == entity_id.lower())
-                    and (States.last_updated > start_date)
-                )
-                .order_by(States.last_updated.asc())
+                .filter(entity_ids_filter(self.hass, session, [entity_id.lower()]))
+                .filter(States.last_updated_ts > start_date.timestamp())
+                .order_by(States.last_updated_ts.asc())
             )
             states = execute(query, to_native=True, validate_entity_ids=False)
 
@@ -10,12 +10,17 @@ import objgraph
 from pyprof2calltree import convert
 import voluptuous as vol
 
+from homeassistant.components import websocket_api
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.core import HomeAssistant, ServiceCall, callback
 import homeassistant.helpers.config_validation as cv
-from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.event import (
+    async_get_template_render_stats,
+    async_track_time_interval,
+)
 from homeassistant.helpers.service import async_register_admin_service
 from homeassistant.helpers.typing import ConfigType
+from homeassistant.util.job_stats import JobStats
 
 from .const import DOMAIN
 
@@ -24,6 +29,8 @@ SERVICE_MEMORY = "memory"
 SERVICE_START_LOG_OBJECTS = "start_log_objects"
 SERVICE_STOP_LOG_OBJECTS = "stop_log_objects"
 SERVICE_DUMP_LOG_OBJECTS = "dump_log_objects"
+SERVICE_START_JOB_STATS = "start_job_stats"
+SERVICE_STOP_JOB_STATS = "stop_job_stats"
 
 SERVICES = (
     SERVICE_START,
@@ -31,8 +38,12 @@ SERVICES = (
     SERVICE_START_LOG_OBJECTS,
     SERVICE_STOP_LOG_OBJECTS,
     SERVICE_DUMP_LOG_OBJECTS,
+    SERVICE_START_JOB_STATS,
+    SERVICE_STOP_JOB_STATS,
 )
 
+PLATFORMS = ["sensor"]
+
 DEFAULT_SCAN_INTERVAL = timedelta(seconds=30)
 
 CONF_SECONDS = "seconds"
@@ -46,6 +57,8 @@ _LOGGER = logging.getLogger(__name__)
 
 async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
     """Set up the profiler component."""
+    websocket_api.async_register_command(hass, ws_job_stats)
+    websocket_api.async_register_command(hass, ws_template_stats)
     return True
 
 
@@ -84,6 +97,16 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
         hass.components.persistent_notification.async_dismiss("profile_object_logging")
         domain_data.pop(LOG_INTERVAL_SUB)()
 
+    @callback
+    def _async_start_job_stats(call: ServiceCall):
+        if hass.job_stats is None:
+            hass.job_stats = JobStats(hass.loop)
+            hass.job_stats.async_start()
+
+    @callback
+    def _async_stop_job_stats(call: ServiceCall):
+        _async_stop_hass_job_stats(hass)
+
     def _dump_log_objects(call: ServiceCall):
         obj_type = call.data[CONF_TYPE]
 
@@ -149,19 +172,80 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
         schema=vol.Schema({vol.Required(CONF_TYPE): str}),
     )
 
+    async_register_admin_service(
+        hass,
+        DOMAIN,
+        SERVICE_START_JOB_STATS,
+        _async_start_job_stats,
+        schema=vol.Schema({}),
+    )
+
+    async_register_admin_service(
+        hass,
+        DOMAIN,
+        SERVICE_STOP_JOB_STATS,
+        _async_stop_job_stats,
+        schema=vol.Schema({}),
+    )
+
+    for platform in PLATFORMS:
+        hass.async_create_task(
+            hass.config_entries.async_forward_entry_setup(entry, platform)
+        )
+
     return True
 
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry):
     """Unload a config entry."""
+    unload_ok = all(
+        await asyncio.gather(
+            *[
+                hass.config_entries.async_forward_entry_unload(entry, platform)
+                for platform in PLATFORMS
+            ]
+        )
+    )
+    if not unload_ok:
+        return False
+
     for service in SERVICES:
         hass.services.async_remove(domain=DOMAIN, service=service)
     if LOG_INTERVAL_SUB in hass.data[DOMAIN]:
         hass.data[DOMAIN][LOG_INTERVAL_SUB]()
+    _async_stop_hass_job_stats(hass)
     hass.data.pop(DOMAIN)
     return True
 
 
+@callback
+def _async_stop_hass_job_stats(hass: HomeAssistant):
+    if hass.job_stats is not None:
+        hass.job_stats.async_stop()
+        hass.job_stats = None
+
+
+@callback
+@websocket_api.require_admin
+@websocket_api.websocket_command({vol.Required("type"): "profiler/job_stats"})
+def ws_job_stats(hass, connection, msg):
+    """Return the loop lag and the time spent running jobs per integration."""
+    if hass.job_stats is None:
+        connection.send_result(msg["id"], {"enabled": False})
+        return
+    connection.send_result(msg["id"], {"enabled": True, **hass.job_stats.as_dict()})
+
+
+@callback
+@websocket_api.require_admin
+@websocket_api.websocket_command({vol.Required("type"): "profiler/template_stats"})
+def ws_template_stats(hass, connection, msg):
+    """Return the render time of the tracked templates."""
+    connection.send_result(
+        msg["id"], {"templates": async_get_template_render_stats(hass)}
+    )
+
+
 async def _async_generate_profile(hass: HomeAssistant, call: ServiceCall):
     start_time = int(time.time() * 1000000)
     hass.components.persistent_notification.async_create(
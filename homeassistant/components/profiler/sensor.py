@@ -0,0 +1,91 @@
+"""Sensor reporting the event loop lag measured by the profiler."""
+from datetime import timedelta
+
+from homeassistant.const import TIME_MILLISECONDS
+from homeassistant.helpers.entity import Entity
+
+from .const import DOMAIN
+
+SCAN_INTERVAL = timedelta(seconds=30)
+
+ATTR_MEAN_LAG = "mean_lag"
+ATTR_SLOWEST_INTEGRATIONS = "slowest_integrations"
+
+SLOWEST_INTEGRATIONS = 5
+
+
+async def async_setup_entry(hass, entry, async_add_entities):
+    """Set up the event loop lag sensor."""
+    async_add_entities([EventLoopLagSensor(entry.entry_id)], True)
+
+
+class EventLoopLagSensor(Entity):
+    """Report the highest event loop lag of the last minute."""
+
+    def __init__(self, entry_id):
+        """Initialize the sensor."""
+        self._entry_id = entry_id
+        self._state = None
+        self._attributes = {}
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return "Event loop lag"
+
+    @property
+    def unique_id(self):
+        """Return a unique ID."""
+        return f"{DOMAIN}_{self._entry_id}_event_loop_lag"
+
+    @property
+    def icon(self):
+        """Return the icon."""
+        return "mdi:timer-sand"
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of measurement."""
+        return TIME_MILLISECONDS
+
+    @property
+    def available(self):
+        """Return if the job stats are being collected."""
+        return self.hass.job_stats is not None
+
+    @property
+    def state(self):
+        """Return the state of the sensor."""
+        return self._state
+
+    @property
+    def device_state_attributes(self):
+        """Return the mean lag and the integrations holding the loop the most."""
+        return self._attributes
+
+    async def async_update(self):
+        """Read the latest job stats."""
+        if self.hass.job_stats is None:
+            self._state = None
+            self._attributes = {}
+            return
+
+        stats = self.hass.job_stats.as_dict()
+        loop_lag = stats["loop_lag"]
+        self._state = _milliseconds(loop_lag["max"])
+        self._attributes = {
+            ATTR_MEAN_LAG: _milliseconds(loop_lag["mean"]),
+            ATTR_SLOWEST_INTEGRATIONS: {
+                integration: _milliseconds(job["time"])
+                for integration, job in list(stats["integrations"].items())[
+                    :SLOWEST_INTEGRATIONS
+                ]
+            },
+        }
+
+
+def _milliseconds(seconds):
+    """Convert seconds to rounded milliseconds."""
+    if seconds is None:
+        return None
+    return round(seconds * 1000, 1)
@@ -1,15 +1,14 @@
 """Support for recording details."""
 import asyncio
-from collections import namedtuple
+from collections import OrderedDict, namedtuple
 import concurrent.futures
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
-import queue
 import threading
 import time
-from typing import Any, Callable, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
-from sqlalchemy import create_engine, event as sqlalchemy_event, exc, select
+from sqlalchemy import create_engine, event as sqlalchemy_event, exc, func, select, text
 from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.pool import StaticPool
 import voluptuous as vol
@@ -21,7 +20,6 @@ from homeassistant.const import (
     EVENT_HOMEASSISTANT_START,
     EVENT_HOMEASSISTANT_STOP,
     EVENT_STATE_CHANGED,
-    EVENT_TIME_CHANGED,
     MATCH_ALL,
 )
 from homeassistant.core import CoreState, HomeAssistant, callback
@@ -34,9 +32,10 @@ from homeassistant.helpers.entityfilter import (
 from homeassistant.helpers.typing import ConfigType
 import homeassistant.util.dt as dt_util
 
-from . import migration, purge
+from . import migration, purge, statistics, websocket_api
+from .backlog import OVERFLOW_POLICIES, POLICY_DROP_OLDEST, RecorderQueue
 from .const import CONF_DB_INTEGRITY_CHECK, DATA_INSTANCE, DOMAIN, SQLITE_URL_PREFIX
-from .models import Base, Events, RecorderRuns, States
+from .models import Base, Events, RecorderRuns, StateAttributes, States, StatesMeta
 from .util import session_scope, validate_or_move_away_sqlite_database
 
 _LOGGER = logging.getLogger(__name__)
@@ -59,13 +58,19 @@ DEFAULT_DB_INTEGRITY_CHECK = True
 DEFAULT_DB_MAX_RETRIES = 10
 DEFAULT_DB_RETRY_WAIT = 3
 DEFAULT_COMMIT_INTERVAL = 1
+DEFAULT_MAX_BACKLOG = 40000
 KEEPALIVE_TIME = 30
 
 # Controls how often we clean up
 # States and Events objects
 EXPIRE_AFTER_COMMITS = 120
 
+# The number of distinct attribute documents to keep
+# the state_attributes id of in memory
+STATE_ATTRIBUTES_ID_CACHE_SIZE = 2048
+
 CONF_AUTO_PURGE = "auto_purge"
+CONF_BULK_INSERT = "bulk_insert"
 CONF_DB_URL = "db_url"
 CONF_DB_MAX_RETRIES = "db_max_retries"
 CONF_DB_RETRY_WAIT = "db_retry_wait"
@@ -73,6 +78,8 @@ CONF_PURGE_KEEP_DAYS = "purge_keep_days"
 CONF_PURGE_INTERVAL = "purge_interval"
 CONF_EVENT_TYPES = "event_types"
 CONF_COMMIT_INTERVAL = "commit_interval"
+CONF_MAX_BACKLOG = "max_backlog"
+CONF_OVERFLOW_POLICY = "overflow_policy"
 
 EXCLUDE_SCHEMA = INCLUDE_EXCLUDE_FILTER_SCHEMA_INNER.extend(
     {vol.Optional(CONF_EVENT_TYPES): vol.All(cv.ensure_list, [cv.string])}
@@ -106,6 +113,13 @@ CONFIG_SCHEMA = vol.Schema(
                     vol.Optional(
                         CONF_DB_INTEGRITY_CHECK, default=DEFAULT_DB_INTEGRITY_CHECK
                     ): cv.boolean,
+                    vol.Optional(CONF_BULK_INSERT, default=False): cv.boolean,
+                    vol.Optional(
+                        CONF_MAX_BACKLOG, default=DEFAULT_MAX_BACKLOG
+                    ): cv.positive_int,
+                    vol.Optional(
+                        CONF_OVERFLOW_POLICY, default=POLICY_DROP_OLDEST
+                    ): vol.In(OVERFLOW_POLICIES),
                 }
             ),
         )
@@ -164,6 +178,9 @@ async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
     db_max_retries = conf[CONF_DB_MAX_RETRIES]
     db_retry_wait = conf[CONF_DB_RETRY_WAIT]
     db_integrity_check = conf[CONF_DB_INTEGRITY_CHECK]
+    bulk_insert = conf[CONF_BULK_INSERT]
+    max_backlog = conf[CONF_MAX_BACKLOG]
+    overflow_policy = conf[CONF_OVERFLOW_POLICY]
 
     db_url = conf.get(CONF_DB_URL)
     if not db_url:
@@ -181,9 +198,13 @@ async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
         entity_filter=entity_filter,
         exclude_t=exclude_t,
         db_integrity_check=db_integrity_check,
+        bulk_insert=bulk_insert,
+        max_backlog=max_backlog,
+        overflow_policy=overflow_policy,
     )
     instance.async_initialize()
     instance.start()
+    websocket_api.async_setup(hass)
 
     async def async_handle_purge_service(service):
         """Handle calls to the purge service."""
@@ -197,12 +218,29 @@ async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
 
 
 PurgeTask = namedtuple("PurgeTask", ["keep_days", "repack"])
+StatisticsTask = namedtuple("StatisticsTask", ["start", "period"], defaults=[None])
+
+
+class RepackTask:
+    """An object to insert into the recorder queue to repack the database after a purge."""
+
+
+class StatesMetaTask:
+    """An object to insert into the recorder queue to migrate a batch of states to states_meta."""
 
 
 class WaitTask:
     """An object to insert into the recorder queue to tell it set the _queue_watch event."""
 
 
+class CommitTask:
+    """An object to insert into the recorder queue to commit the event session."""
+
+
+class KeepAliveTask:
+    """An object to insert into the recorder queue to keep the connection alive."""
+
+
 class Recorder(threading.Thread):
     """A threaded recorder class."""
 
@@ -218,6 +256,9 @@ class Recorder(threading.Thread):
         entity_filter: Callable[[str], bool],
         exclude_t: List[str],
         db_integrity_check: bool,
+        bulk_insert: bool = False,
+        max_backlog: int = 0,
+        overflow_policy: str = POLICY_DROP_OLDEST,
     ) -> None:
         """Initialize the recorder."""
         threading.Thread.__init__(self, name="Recorder")
@@ -226,12 +267,17 @@ class Recorder(threading.Thread):
         self.auto_purge = auto_purge
         self.keep_days = keep_days
         self.commit_interval = commit_interval
-        self.queue: Any = queue.SimpleQueue()
+        self.queue = RecorderQueue(max_backlog, overflow_policy)
         self.recording_start = dt_util.utcnow()
         self.db_url = uri
         self.db_max_retries = db_max_retries
         self.db_retry_wait = db_retry_wait
         self.db_integrity_check = db_integrity_check
+        self.bulk_insert = bulk_insert
+        self.commit_latency = 0.0
+        self.peak_commit_latency = 0.0
+        self.purge_progress: Optional[purge.PurgeProgress] = None
+        self.states_meta_migrated = False
         self.async_db_ready = asyncio.Future()
         self._queue_watch = threading.Event()
         self.engine: Any = None
@@ -240,11 +286,22 @@ class Recorder(threading.Thread):
         self.entity_filter = entity_filter
         self.exclude_t = exclude_t
 
-        self._timechanges_seen = 0
         self._commits_without_expire = 0
-        self._keepalive_count = 0
         self._old_states = {}
         self._pending_expunge = []
+        self._old_state_ids = {}
+        self._pending_event_rows = []
+        self._pending_state_rows = []
+        self._next_event_id = None
+        self._next_state_id = None
+        self._next_attributes_id = None
+        self._state_attributes_ids: "OrderedDict[str, int]" = OrderedDict()
+        self._pending_state_attributes: Dict[str, StateAttributes] = {}
+        self._pending_attributes_rows: Dict[str, dict] = {}
+        self._next_metadata_id = None
+        self._states_meta_ids: Dict[str, int] = {}
+        self._pending_states_meta: Dict[str, StatesMeta] = {}
+        self._pending_states_meta_rows: Dict[str, dict] = {}
         self.event_session = None
         self.get_session = None
         self._completed_database_setup = False
@@ -252,7 +309,7 @@ class Recorder(threading.Thread):
     @callback
     def async_initialize(self):
         """Initialize the recorder."""
-        self.hass.bus.async_listen(MATCH_ALL, self.event_listener)
+        self.hass.bus.async_listen(MATCH_ALL, self.event_listener, run_immediately=True)
 
     def do_adhoc_purge(self, **kwargs):
         """Trigger an adhoc purge retaining keep_days worth of data."""
@@ -335,6 +392,9 @@ class Recorder(threading.Thread):
         if result is shutdown_task:
             return
 
+        # Fill in the metadata_id of states recorded before schema 14
+        self.queue.put(StatesMetaTask())
+
         # Start periodic purge
         if self.auto_purge:
 
@@ -348,6 +408,37 @@ class Recorder(threading.Thread):
                 async_purge, hour=4, minute=12, second=0
             )
 
+        @callback
+        def async_periodic_statistics(now):
+            """Trigger the statistics run for the last completed period."""
+            self.queue.put(StatisticsTask(statistics.get_start_time(now)))
+
+        # Compile short term statistics every 5 minutes, shortly after
+        # the period ended so late state changes are included
+        self.hass.helpers.event.track_utc_time_change(
+            async_periodic_statistics, minute="/5", second=10
+        )
+
+        if self.commit_interval:
+
+            @callback
+            def async_commit(now):
+                """Trigger a commit of the pending events."""
+                self.queue.put(CommitTask())
+
+            self.hass.helpers.event.track_time_interval(
+                async_commit, timedelta(seconds=self.commit_interval)
+            )
+
+        @callback
+        def async_keep_alive(now):
+            """Trigger a keep alive of the database connection."""
+            self.queue.put(KeepAliveTask())
+
+        self.hass.helpers.event.track_time_interval(
+            async_keep_alive, timedelta(seconds=KEEPALIVE_TIME)
+        )
+
         self.event_session = self.get_session()
         self.event_session.expire_on_commit = False
         # Use a session for the event read loop
@@ -360,76 +451,459 @@ class Recorder(threading.Thread):
                 self._close_connection()
                 return
             if isinstance(event, PurgeTask):
+                # Commit pending states first so the purge does not remove
+                # state_attributes they are about to reference
+                self._commit_event_session_or_retry()
                 # Schedule a new purge task if this one didn't finish
-                if not purge.purge_old_data(self, event.keep_days, event.repack):
+                if not purge.purge_old_data(self, event.keep_days):
                     self.queue.put(PurgeTask(event.keep_days, event.repack))
+                elif event.repack:
+                    # A task of its own so the events that queued up
+                    # during the last batch are committed first
+                    self.queue.put(RepackTask())
+                continue
+            if isinstance(event, RepackTask):
+                self._commit_event_session_or_retry()
+                purge.repack_database(self)
+                continue
+            if isinstance(event, StatisticsTask):
+                self._commit_event_session_or_retry()
+                # Schedule a new statistics task if this one didn't finish
+                period = self._run_statistics(event.start, event.period)
+                if period is not None:
+                    self.queue.put(StatisticsTask(event.start, period))
+                continue
+            if isinstance(event, StatesMetaTask):
+                self._commit_event_session_or_retry()
+                self._migrate_states_meta()
                 continue
             if isinstance(event, WaitTask):
                 self._queue_watch.set()
                 continue
-            if event.event_type == EVENT_TIME_CHANGED:
-                self._keepalive_count += 1
-                if self._keepalive_count >= KEEPALIVE_TIME:
-                    self._keepalive_count = 0
-                    self._send_keep_alive()
-                if self.commit_interval:
-                    self._timechanges_seen += 1
-                    if self._timechanges_seen >= self.commit_interval:
-                        self._timechanges_seen = 0
-                        self._commit_event_session_or_retry()
+            if isinstance(event, CommitTask):
+                self._commit_event_session_or_retry()
                 continue
-            if event.event_type in self.exclude_t:
+            if isinstance(event, KeepAliveTask):
+                self._send_keep_alive()
                 continue
+            self._process_one_event(event)
+
+    def _process_one_event(self, event):
+        """Add an event to the pending commit."""
+        if event.event_type in self.exclude_t:
+            return
+
+        entity_id = event.data.get(ATTR_ENTITY_ID)
+        if entity_id is not None:
+            if not self.entity_filter(entity_id):
+                return
+
+        if self.bulk_insert:
+            self._add_event_rows(event)
+        else:
+            self._add_event_objects(event)
+
+        # If they do not have a commit interval
+        # than we commit right away
+        if not self.commit_interval:
+            self._commit_event_session_or_retry()
 
-            entity_id = event.data.get(ATTR_ENTITY_ID)
-            if entity_id is not None:
-                if not self.entity_filter(entity_id):
-                    continue
+    def _add_event_objects(self, event):
+        """Add ORM objects for an event to the event session."""
+        dbevent = None
+        try:
+            if event.event_type == EVENT_STATE_CHANGED:
+                dbevent = Events.from_event(event, event_data="{}")
+            else:
+                dbevent = Events.from_event(event)
+            self.event_session.add(dbevent)
+        except (TypeError, ValueError):
+            _LOGGER.warning("Event is not JSON serializable: %s", event)
+        except Exception as err:  # pylint: disable=broad-except
+            # Must catch the exception to prevent the loop from collapsing
+            _LOGGER.exception("Error adding event: %s", err)
 
+        if dbevent and event.event_type == EVENT_STATE_CHANGED:
             try:
-                if event.event_type == EVENT_STATE_CHANGED:
-                    dbevent = Events.from_event(event, event_data="{}")
-                else:
-                    dbevent = Events.from_event(event)
-                dbevent.created = event.time_fired
-                self.event_session.add(dbevent)
+                dbstate = States.from_event(event)
+                self._link_state_attributes(dbstate)
+                self._link_states_meta(dbstate)
+                has_new_state = event.data.get("new_state")
+                if dbstate.entity_id in self._old_states:
+                    old_state = self._old_states.pop(dbstate.entity_id)
+                    if old_state.state_id:
+                        dbstate.old_state_id = old_state.state_id
+                    else:
+                        dbstate.old_state = old_state
+                if not has_new_state:
+                    dbstate.state = None
+                dbstate.event = dbevent
+                self.event_session.add(dbstate)
+                if has_new_state:
+                    self._old_states[dbstate.entity_id] = dbstate
+                    self._pending_expunge.append(dbstate)
             except (TypeError, ValueError):
-                _LOGGER.warning("Event is not JSON serializable: %s", event)
+                _LOGGER.warning(
+                    "State is not JSON serializable: %s",
+                    event.data.get("new_state"),
+                )
             except Exception as err:  # pylint: disable=broad-except
                 # Must catch the exception to prevent the loop from collapsing
-                _LOGGER.exception("Error adding event: %s", err)
-
-            if dbevent and event.event_type == EVENT_STATE_CHANGED:
-                try:
-                    dbstate = States.from_event(event)
-                    has_new_state = event.data.get("new_state")
-                    if dbstate.entity_id in self._old_states:
-                        old_state = self._old_states.pop(dbstate.entity_id)
-                        if old_state.state_id:
-                            dbstate.old_state_id = old_state.state_id
-                        else:
-                            dbstate.old_state = old_state
-                    if not has_new_state:
-                        dbstate.state = None
-                    dbstate.event = dbevent
-                    dbstate.created = event.time_fired
-                    self.event_session.add(dbstate)
-                    if has_new_state:
-                        self._old_states[dbstate.entity_id] = dbstate
-                        self._pending_expunge.append(dbstate)
-                except (TypeError, ValueError):
-                    _LOGGER.warning(
-                        "State is not JSON serializable: %s",
-                        event.data.get("new_state"),
-                    )
-                except Exception as err:  # pylint: disable=broad-except
-                    # Must catch the exception to prevent the loop from collapsing
-                    _LOGGER.exception("Error adding state change: %s", err)
+                _LOGGER.exception("Error adding state change: %s", err)
 
-            # If they do not have a commit interval
-            # than we commit right away
-            if not self.commit_interval:
-                self._commit_event_session_or_retry()
+    def _add_event_rows(self, event):
+        """Add column values for an event to the pending bulk rows.
+
+        The primary keys are allocated here instead of by the database
+        so the states can reference their event and old state without
+        a round-trip per row. The recorder is the only writer, so the
+        counters only need to be seeded from the database once.
+        """
+        try:
+            if event.event_type == EVENT_STATE_CHANGED:
+                event_row = Events.row_from_event(event, event_data="{}")
+            else:
+                event_row = Events.row_from_event(event)
+        except (TypeError, ValueError):
+            _LOGGER.warning("Event is not JSON serializable: %s", event)
+            return
+        except Exception as err:  # pylint: disable=broad-except
+            # Must catch the exception to prevent the loop from collapsing
+            _LOGGER.exception("Error adding event: %s", err)
+            return
+
+        state_row = None
+        if event.event_type == EVENT_STATE_CHANGED:
+            try:
+                state_row = States.row_from_event(event)
+            except (TypeError, ValueError):
+                _LOGGER.warning(
+                    "State is not JSON serializable: %s",
+                    event.data.get("new_state"),
+                )
+            except Exception as err:  # pylint: disable=broad-except
+                # Must catch the exception to prevent the loop from collapsing
+                _LOGGER.exception("Error adding state change: %s", err)
+
+        if self._next_event_id is None:
+            self._seed_bulk_ids()
+
+        event_row["event_id"] = self._next_event_id
+        self._next_event_id += 1
+        self._pending_event_rows.append(event_row)
+
+        if state_row is None:
+            return
+
+        state_id = self._next_state_id
+        self._next_state_id += 1
+        entity_id = state_row["entity_id"]
+        state_row["state_id"] = state_id
+        state_row["event_id"] = event_row["event_id"]
+        state_row["attributes_id"] = self._attributes_id_for_row(
+            state_row.pop("attributes")
+        )
+        state_row["attributes"] = None
+        state_row["metadata_id"] = self._metadata_id_for_row(entity_id)
+        state_row["old_state_id"] = self._old_state_ids.pop(entity_id, None)
+        if event.data.get("new_state"):
+            self._old_state_ids[entity_id] = state_id
+        else:
+            state_row["state"] = None
+        self._pending_state_rows.append(state_row)
+
+    def _seed_bulk_ids(self):
+        """Seed the primary key counters from the database."""
+        query = self.event_session.query
+        self._next_event_id = (query(func.max(Events.event_id)).scalar() or 0) + 1
+        self._next_state_id = (query(func.max(States.state_id)).scalar() or 0) + 1
+        self._next_attributes_id = (
+            query(func.max(StateAttributes.attributes_id)).scalar() or 0
+        ) + 1
+        self._next_metadata_id = (
+            query(func.max(StatesMeta.metadata_id)).scalar() or 0
+        ) + 1
+
+    def _link_state_attributes(self, dbstate):
+        """Move the attributes of a state to the shared state_attributes table."""
+        shared_attrs = dbstate.attributes
+        dbstate.attributes = None
+
+        pending_attributes = self._pending_state_attributes.get(shared_attrs)
+        if pending_attributes is not None:
+            dbstate.state_attributes = pending_attributes
+            return
+
+        attributes_id = self._find_shared_attributes_id(shared_attrs)
+        if attributes_id is not None:
+            dbstate.attributes_id = attributes_id
+            return
+
+        dbstate_attributes = StateAttributes.from_shared_attrs(shared_attrs)
+        dbstate.state_attributes = dbstate_attributes
+        self._pending_state_attributes[shared_attrs] = dbstate_attributes
+
+    def _attributes_id_for_row(self, shared_attrs):
+        """Return the attributes_id for a bulk state row.
+
+        New attribute documents are added to the pending bulk rows.
+        """
+        pending_row = self._pending_attributes_rows.get(shared_attrs)
+        if pending_row is not None:
+            return pending_row["attributes_id"]
+
+        attributes_id = self._find_shared_attributes_id(shared_attrs)
+        if attributes_id is not None:
+            return attributes_id
+
+        attributes_id = self._next_attributes_id
+        self._next_attributes_id += 1
+        self._pending_attributes_rows[shared_attrs] = {
+            "attributes_id": attributes_id,
+            "hash": StateAttributes.hash_shared_attrs(shared_attrs),
+            "shared_attrs": shared_attrs,
+        }
+        return attributes_id
+
+    def _find_shared_attributes_id(self, shared_attrs):
+        """Find the id of already stored attributes in the cache or database."""
+        attributes_id = self._state_attributes_ids.get(shared_attrs)
+        if attributes_id is not None:
+            self._state_attributes_ids.move_to_end(shared_attrs)
+            return attributes_id
+
+        with self.event_session.no_autoflush:
+            row = (
+                self.event_session.query(StateAttributes.attributes_id)
+                .filter(
+                    StateAttributes.hash
+                    == StateAttributes.hash_shared_attrs(shared_attrs)
+                )
+                .filter(StateAttributes.shared_attrs == shared_attrs)
+                .first()
+            )
+        if row is None:
+            return None
+
+        self._cache_shared_attributes_id(shared_attrs, row[0])
+        return row[0]
+
+    def _cache_shared_attributes_id(self, shared_attrs, attributes_id):
+        """Remember the attributes_id, evicting the least recently used."""
+        self._state_attributes_ids[shared_attrs] = attributes_id
+        self._state_attributes_ids.move_to_end(shared_attrs)
+        if len(self._state_attributes_ids) > STATE_ATTRIBUTES_ID_CACHE_SIZE:
+            self._state_attributes_ids.popitem(last=False)
+
+    def _cache_pending_attributes_ids(self):
+        """Remember the ids of the attributes written by the last commit."""
+        for shared_attrs, dbstate_attributes in self._pending_state_attributes.items():
+            # Attributes of a rolled back session were never written
+            if dbstate_attributes.attributes_id is not None:
+                self._cache_shared_attributes_id(
+                    shared_attrs, dbstate_attributes.attributes_id
+                )
+        for shared_attrs, row in self._pending_attributes_rows.items():
+            self._cache_shared_attributes_id(shared_attrs, row["attributes_id"])
+
+    def clear_state_attributes_cache(self):
+        """Forget all cached attributes ids.
+
+        Called after purging unreferenced rows from the state_attributes table.
+        """
+        self._state_attributes_ids.clear()
+
+    def _link_states_meta(self, dbstate):
+        """Link a state to its entity_id in the states_meta table."""
+        entity_id = dbstate.entity_id
+
+        pending_states_meta = self._pending_states_meta.get(entity_id)
+        if pending_states_meta is not None:
+            dbstate.states_meta = pending_states_meta
+            return
+
+        metadata_id = self._find_metadata_id(entity_id)
+        if metadata_id is not None:
+            dbstate.metadata_id = metadata_id
+            return
+
+        states_meta = StatesMeta(entity_id=entity_id)
+        dbstate.states_meta = states_meta
+        self._pending_states_meta[entity_id] = states_meta
+
+    def _metadata_id_for_row(self, entity_id):
+        """Return the metadata_id for a bulk state row.
+
+        New entity ids are added to the pending bulk rows.
+        """
+        pending_row = self._pending_states_meta_rows.get(entity_id)
+        if pending_row is not None:
+            return pending_row["metadata_id"]
+
+        metadata_id = self._find_metadata_id(entity_id)
+        if metadata_id is not None:
+            return metadata_id
+
+        metadata_id = self._next_metadata_id
+        self._next_metadata_id += 1
+        self._pending_states_meta_rows[entity_id] = {
+            "metadata_id": metadata_id,
+            "entity_id": entity_id,
+        }
+        return metadata_id
+
+    def _find_metadata_id(self, entity_id):
+        """Find the metadata_id of an entity_id in the cache or database."""
+        metadata_id = self._states_meta_ids.get(entity_id)
+        if metadata_id is not None:
+            return metadata_id
+
+        with self.event_session.no_autoflush:
+            row = (
+                self.event_session.query(StatesMeta.metadata_id)
+                .filter(StatesMeta.entity_id == entity_id)
+                .first()
+            )
+        if row is None:
+            return None
+
+        # The number of entities is small, the cache is not bounded
+        self._states_meta_ids[entity_id] = row[0]
+        return row[0]
+
+    def _cache_pending_metadata_ids(self):
+        """Remember the metadata_ids written by the last commit."""
+        for entity_id, states_meta in self._pending_states_meta.items():
+            # States meta of a rolled back session were never written
+            if states_meta.metadata_id is not None:
+                self._states_meta_ids[entity_id] = states_meta.metadata_id
+        for entity_id, row in self._pending_states_meta_rows.items():
+            self._states_meta_ids[entity_id] = row["metadata_id"]
+
+    def lookup_metadata_ids(self, session, entity_ids):
+        """Look up the metadata_ids of entity_ids that have recorded states.
+
+        Safe to call from other threads, it only reads the cache.
+        """
+        metadata_ids = {}
+        missing = []
+        for entity_id in entity_ids:
+            metadata_id = self._states_meta_ids.get(entity_id)
+            if metadata_id is None:
+                missing.append(entity_id)
+            else:
+                metadata_ids[entity_id] = metadata_id
+
+        if missing:
+            metadata_ids.update(
+                session.query(StatesMeta.entity_id, StatesMeta.metadata_id).filter(
+                    StatesMeta.entity_id.in_(missing)
+                )
+            )
+        return metadata_ids
+
+    def _migrate_states_meta(self):
+        """Migrate a batch of states to states_meta and queue the next one."""
+        try:
+            finished = migration.migrate_states_meta(self)
+        except Exception as err:  # pylint: disable=broad-except
+            # Must catch the exception to prevent the loop from collapsing
+            _LOGGER.exception("Error migrating states to states_meta: %s", err)
+            return
+        finally:
+            # The batch took metadata_ids from the database, the pending
+            # rows were committed before it so the counters can be seeded
+            # again without handing out an id twice
+            self._reset_bulk_ids()
+
+        if finished:
+            self.states_meta_migrated = True
+        else:
+            self.queue.put(StatesMetaTask())
+
+    def _insert_pending_rows(self):
+        """Write the pending bulk rows with one executemany per table."""
+        self.event_session.execute(Events.__table__.insert(), self._pending_event_rows)
+        if self._pending_attributes_rows:
+            self.event_session.execute(
+                StateAttributes.__table__.insert(),
+                list(self._pending_attributes_rows.values()),
+            )
+        if self._pending_states_meta_rows:
+            self.event_session.execute(
+                StatesMeta.__table__.insert(),
+                list(self._pending_states_meta_rows.values()),
+            )
+        if self._pending_state_rows:
+            self.event_session.execute(
+                States.__table__.insert(), self._pending_state_rows
+            )
+
+        if self.engine.dialect.name != "postgresql":
+            return
+
+        # PostgreSQL does not advance the serial sequences when
+        # the primary key is provided, keep them in sync so
+        # rows inserted without bulk_insert do not collide.
+        for table, column, next_id in (
+            ("events", "event_id", self._next_event_id),
+            ("states", "state_id", self._next_state_id),
+            ("state_attributes", "attributes_id", self._next_attributes_id),
+            ("states_meta", "metadata_id", self._next_metadata_id),
+        ):
+            if next_id == 1:
+                continue
+            self.event_session.execute(
+                text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+                    ":last_id)"
+                ),
+                {"last_id": next_id - 1},
+            )
+
+    def _reset_bulk_ids(self):
+        """Seed the primary key counters again before the next bulk write."""
+        self._next_event_id = None
+        self._next_state_id = None
+        self._next_attributes_id = None
+        self._next_metadata_id = None
+
+    def _drop_pending_rows(self):
+        """Drop the pending rows of a commit that failed.
+
+        The ids allocated for them were never written, so no old state
+        may reference them and the counters are seeded again.
+        """
+        self._old_state_ids = {}
+        self._reset_bulk_ids()
+        self._discard_pending_rows()
+
+    def _discard_pending_rows(self):
+        """Clear the pending bulk rows and attributes."""
+        self._pending_event_rows = []
+        self._pending_state_rows = []
+        self._pending_state_attributes = {}
+        self._pending_attributes_rows = {}
+        # Keep states meta that were not written, the old state of the
+        # next state change still references them
+        self._pending_states_meta = {
+            entity_id: states_meta
+            for entity_id, states_meta in self._pending_states_meta.items()
+            if states_meta.metadata_id is None
+        }
+        self._pending_states_meta_rows = {}
+
+    def _run_statistics(self, start, period):
+        """Compile the statistics of the periods up to the one at start.
+
+        Returns the next period to compile if there are more.
+        """
+        try:
+            return statistics.compile_missing_statistics(self, start, period)
+        except Exception as err:  # pylint: disable=broad-except
+            # Must catch the exception to prevent the loop from collapsing
+            _LOGGER.exception("Error compiling statistics: %s", err)
+        return None
 
     def _send_keep_alive(self):
         try:
@@ -445,6 +919,17 @@ class Recorder(threading.Thread):
             self._reopen_event_session()
 
     def _commit_event_session_or_retry(self):
+        start = time.perf_counter()
+        try:
+            self._commit_event_session_with_retries()
+        finally:
+            # Includes the retries, a stalled database shows up here
+            self.commit_latency = time.perf_counter() - start
+            self.peak_commit_latency = max(
+                self.peak_commit_latency, self.commit_latency
+            )
+
+    def _commit_event_session_with_retries(self):
         tries = 1
         while tries <= self.db_max_retries:
             if tries != 1:
@@ -473,12 +958,14 @@ class Recorder(threading.Thread):
             except Exception as err:  # pylint: disable=broad-except
                 # Must catch the exception to prevent the loop from collapsing
                 _LOGGER.exception("Error saving events: %s", err)
+                self._drop_pending_rows()
                 return
 
         _LOGGER.error(
             "Error in database update. Could not save " "after %d tries. Giving up",
             tries,
         )
+        self._drop_pending_rows()
         self._reopen_event_session()
 
     def _reopen_event_session(self):
@@ -505,6 +992,8 @@ class Recorder(threading.Thread):
         self._commits_without_expire += 1
 
         try:
+            if self._pending_event_rows:
+                self._insert_pending_rows()
             if self._pending_expunge:
                 self.event_session.flush()
                 for dbstate in self._pending_expunge:
@@ -521,12 +1010,21 @@ class Recorder(threading.Thread):
             )
             self.event_session.rollback()
             self._old_states = {}
+            self._old_state_ids = {}
+            self._reset_bulk_ids()
+            self._state_attributes_ids.clear()
+            self._states_meta_ids.clear()
+            self._pending_states_meta = {}
             raise
         except Exception as err:
             _LOGGER.error("Error executing query: %s", err)
             self.event_session.rollback()
             raise
 
+        self._cache_pending_attributes_ids()
+        self._cache_pending_metadata_ids()
+        self._discard_pending_rows()
+
         # Expire is an expensive operation (frequently more expensive
         # than the flush and commit itself) so we only
         # do it after EXPIRE_AFTER_COMMITS commits
@@ -539,6 +1037,16 @@ class Recorder(threading.Thread):
         """Listen for new events and put them in the process queue."""
         self.queue.put(event)
 
+    def info(self) -> Dict[str, Any]:
+        """Return the backlog, commit latency and purge progress of the recorder."""
+        purge_progress = self.purge_progress
+        return {
+            **self.queue.as_dict(),
+            "commit_latency": self.commit_latency,
+            "peak_commit_latency": self.peak_commit_latency,
+            "purge_progress": purge_progress.as_dict() if purge_progress else None,
+        }
+
     def block_till_done(self):
         """Block till all events processed.
 
@@ -0,0 +1,155 @@
+"""Bounded queue feeding the recorder thread."""
+from collections import deque
+import logging
+import threading
+from typing import Any, Deque, Dict, List
+
+from homeassistant.const import ATTR_ENTITY_ID, EVENT_STATE_CHANGED
+from homeassistant.core import Event
+
+_LOGGER = logging.getLogger(__name__)
+
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_COALESCE_STATES = "coalesce_states"
+POLICY_PAUSE_EVENTS = "pause_events"
+
+OVERFLOW_POLICIES = (POLICY_DROP_OLDEST, POLICY_COALESCE_STATES, POLICY_PAUSE_EVENTS)
+
+
+class RecorderQueue:
+    """Queue of events and tasks for the recorder thread.
+
+    Tasks are always queued. Once max_backlog events are waiting,
+    the overflow policy decides which event is not recorded:
+
+    drop_oldest: the oldest waiting event is dropped.
+    coalesce_states: a state change replaces the waiting state change
+        of the same entity, otherwise the oldest waiting event is dropped.
+    pause_events: events other than state changes are dropped, state
+        changes replace the oldest waiting event.
+
+    A max_backlog of 0 keeps the queue unbounded.
+    """
+
+    def __init__(self, max_backlog: int = 0, policy: str = POLICY_DROP_OLDEST):
+        """Initialize the queue."""
+        self.max_backlog = max_backlog
+        self.policy = policy
+        self.dropped = 0
+        self.coalesced = 0
+        self.peak_backlog = 0
+        self._items: Deque[Any] = deque()
+        self._not_empty = threading.Condition(threading.Lock())
+        self._backlog = 0
+        # Waiting state changes by entity_id, only kept when coalescing.
+        # They are queued in a list so a newer state change can replace
+        # the event without moving it in the queue.
+        self._pending_states: Dict[str, List[Event]] = {}
+        self._overflowing = False
+
+    @property
+    def backlog(self) -> int:
+        """Return the number of waiting events."""
+        return self._backlog
+
+    def qsize(self) -> int:
+        """Return the number of waiting events and tasks."""
+        return len(self._items)
+
+    def empty(self) -> bool:
+        """Return if nothing is waiting."""
+        return not self._items
+
+    def put(self, item: Any) -> None:
+        """Queue an event or task."""
+        with self._not_empty:
+            if isinstance(item, Event):
+                self._put_event(item)
+            else:
+                self._items.append(item)
+            self._not_empty.notify()
+
+    def _put_event(self, event: Event) -> None:
+        """Queue an event applying the overflow policy."""
+        coalesce = self.policy == POLICY_COALESCE_STATES
+        entity_id = None
+        if event.event_type == EVENT_STATE_CHANGED:
+            entity_id = event.data.get(ATTR_ENTITY_ID)
+
+        if self.max_backlog and self._backlog >= self.max_backlog:
+            if not self._overflowing:
+                self._overflowing = True
+                _LOGGER.warning(
+                    "The recorder backlog reached %s events, applying the %s policy",
+                    self.max_backlog,
+                    self.policy,
+                )
+
+            if coalesce and entity_id in self._pending_states:
+                self._pending_states[entity_id][0] = event
+                self.coalesced += 1
+                return
+
+            if self.policy == POLICY_PAUSE_EVENTS and entity_id is None:
+                self.dropped += 1
+                return
+
+            self._drop_oldest_event()
+
+        elif self._overflowing and self._backlog < self.max_backlog // 2:
+            self._overflowing = False
+            _LOGGER.info("The recorder backlog is back to %s events", self._backlog)
+
+        self._backlog += 1
+        self.peak_backlog = max(self.peak_backlog, self._backlog)
+
+        if coalesce and entity_id is not None:
+            pending = self._pending_states[entity_id] = [event]
+            self._items.append(pending)
+        else:
+            self._items.append(event)
+
+    def _drop_oldest_event(self) -> None:
+        """Drop the oldest waiting event, tasks keep their place."""
+        tasks = []
+        while self._items:
+            item = self._items.popleft()
+            if isinstance(item, list):
+                self._forget_pending_state(item)
+                break
+            if isinstance(item, Event):
+                break
+            tasks.append(item)
+        self._items.extendleft(reversed(tasks))
+        self._backlog -= 1
+        self.dropped += 1
+
+    def _forget_pending_state(self, pending: List[Event]) -> None:
+        """Stop coalescing into a state change that left the queue."""
+        entity_id = pending[0].data[ATTR_ENTITY_ID]
+        if self._pending_states.get(entity_id) is pending:
+            del self._pending_states[entity_id]
+
+    def get(self) -> Any:
+        """Remove and return the next event or task, waiting if needed."""
+        with self._not_empty:
+            while not self._items:
+                self._not_empty.wait()
+            item = self._items.popleft()
+            if isinstance(item, list):
+                self._forget_pending_state(item)
+                item = item[0]
+            if isinstance(item, Event):
+                self._backlog -= 1
+            return item
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the queue metrics."""
+        return {
+            "backlog": self._backlog,
+            "max_backlog": self.max_backlog,
+            "peak_backlog": self.peak_backlog,
+            "overflow_policy": self.policy,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
@@ -1,4 +1,5 @@
 """Schema migration helpers."""
+from collections import defaultdict
 import logging
 
 from sqlalchemy import ForeignKeyConstraint, MetaData, Table, text
@@ -7,11 +8,35 @@ from sqlalchemy.exc import InternalError, OperationalError, SQLAlchemyError
 from sqlalchemy.schema import AddConstraint, DropConstraint
 
 from .const import DOMAIN
-from .models import SCHEMA_VERSION, TABLE_STATES, Base, SchemaChanges
+from .models import (
+    SCHEMA_VERSION,
+    TABLE_EVENTS,
+    TABLE_STATES,
+    Base,
+    SchemaChanges,
+    States,
+    StatesMeta,
+)
 from .util import session_scope
 
 _LOGGER = logging.getLogger(__name__)
 
+# States migrated to states_meta per batch, the state ids of an
+# entity are used as bound parameters and SQLite allows up to 999
+STATES_META_BATCH_SIZE = 998
+
+# SQL expression converting a DateTime column to a UNIX timestamp per dialect.
+# SQLite stores UTC as "YYYY-MM-DD HH:MM:SS.ffffff", julianday would
+# round to milliseconds so the fraction is added separately.
+TIMESTAMP_EXPRESSIONS = {
+    "sqlite": (
+        "CAST(strftime('%s', substr({column}, 1, 19)) AS REAL)"
+        " + CAST(substr({column}, 20) AS REAL)"
+    ),
+    "mysql": "TIMESTAMPDIFF(MICROSECOND, '1970-01-01 00:00:00', {column}) / 1e6",
+    "postgresql": "EXTRACT(EPOCH FROM {column})",
+}
+
 
 def migrate_schema(instance):
     """Check if the schema needs to be upgraded."""
@@ -46,6 +71,59 @@ def migrate_schema(instance):
                 _LOGGER.info("Upgrade to version %s done", new_version)
 
 
+def migrate_states_meta(instance) -> bool:
+    """Fill in the metadata_id of a batch of states recorded before schema 14.
+
+    Runs in the recorder thread after startup so the migration of a
+    large database does not delay it, and continues where it stopped
+    after a restart. Returns True once all states have a metadata_id
+    and the entity_id index they replace has been dropped.
+    """
+    with session_scope(session=instance.get_session()) as session:
+        rows = (
+            session.query(States.state_id, States.entity_id)
+            .filter(States.metadata_id.is_(None))
+            .filter(States.entity_id.isnot(None))
+            .limit(STATES_META_BATCH_SIZE)
+            .all()
+        )
+        if rows:
+            state_ids = defaultdict(list)
+            for state_id, entity_id in rows:
+                state_ids[entity_id].append(state_id)
+
+            metadata_ids = dict(
+                session.query(StatesMeta.entity_id, StatesMeta.metadata_id).filter(
+                    StatesMeta.entity_id.in_(list(state_ids))
+                )
+            )
+            new_states_meta = [
+                StatesMeta(entity_id=entity_id)
+                for entity_id in state_ids
+                if entity_id not in metadata_ids
+            ]
+            if new_states_meta:
+                session.add_all(new_states_meta)
+                session.flush()
+                for states_meta in new_states_meta:
+                    metadata_ids[states_meta.entity_id] = states_meta.metadata_id
+
+            for entity_id, ids in state_ids.items():
+                session.query(States).filter(States.state_id.in_(ids)).update(
+                    {States.metadata_id: metadata_ids[entity_id]},
+                    synchronize_session=False,
+                )
+            _LOGGER.debug("Migrated %s states to states_meta", len(rows))
+            return False
+
+    indexes = reflection.Inspector.from_engine(instance.engine).get_indexes(
+        TABLE_STATES
+    )
+    if any(index["name"] == "ix_states_entity_id_last_updated" for index in indexes):
+        _drop_index(instance.engine, TABLE_STATES, "ix_states_entity_id_last_updated")
+    return True
+
+
 def _create_index(engine, table_name, index_name):
     """Create an index for the specified table.
 
@@ -206,6 +284,35 @@ def _add_columns(engine, table_name, columns_def):
             )
 
 
+def _migrate_columns_to_timestamp(engine):
+    """Fill in the UNIX timestamp columns added in schema 15."""
+    expression = TIMESTAMP_EXPRESSIONS.get(engine.dialect.name)
+    if expression is None:
+        raise ValueError(
+            f"No timestamp migration defined for the {engine.dialect.name} database"
+        )
+
+    updates = {
+        TABLE_EVENTS: {"time_fired_ts": "time_fired"},
+        TABLE_STATES: {
+            "last_changed_ts": "last_changed",
+            "last_updated_ts": "last_updated",
+        },
+    }
+    for table_name, columns in updates.items():
+        _LOGGER.warning(
+            "Converting the timestamps of table %s. Note: this can take several "
+            "minutes on large databases and slow computers. Please "
+            "be patient!",
+            table_name,
+        )
+        assignments = ", ".join(
+            f"{ts_column} = {expression.format(column=column)}"
+            for ts_column, column in columns.items()
+        )
+        engine.execute(text(f"UPDATE {table_name} SET {assignments}"))
+
+
 def _update_states_table_with_foreign_key_options(engine):
     """Add the options to foreign key constraints."""
     inspector = reflection.Inspector.from_engine(engine)
@@ -323,6 +430,38 @@ def _apply_update(engine, new_version, old_version):
     elif new_version == 11:
         _create_index(engine, "states", "ix_states_old_state_id")
         _update_states_table_with_foreign_key_options(engine)
+    elif new_version == 12:
+        # The state_attributes table itself is created by create_all,
+        # existing rows keep their attributes in the states table
+        _add_columns(engine, "states", ["attributes_id INTEGER"])
+        _create_index(engine, "states", "ix_states_attributes_id")
+    elif new_version == 13:
+        # The statistics tables are created by create_all
+        pass
+    elif new_version == 14:
+        # The states_meta table itself is created by create_all, the
+        # metadata_id of existing states is filled in by the recorder
+        # in batches after startup, see migrate_states_meta
+        _add_columns(engine, "states", ["metadata_id INTEGER"])
+        _create_index(engine, "states", "ix_states_metadata_id_last_updated")
+    elif new_version == 15:
+        # The DateTime columns are kept for old rows but no longer
+        # written or indexed, see _migrate_columns_to_timestamp
+        _add_columns(engine, "events", ["time_fired_ts DOUBLE PRECISION"])
+        _add_columns(
+            engine,
+            "states",
+            ["last_changed_ts DOUBLE PRECISION", "last_updated_ts DOUBLE PRECISION"],
+        )
+        _migrate_columns_to_timestamp(engine)
+        _drop_index(engine, "events", "ix_events_time_fired")
+        _drop_index(engine, "events", "ix_events_event_type_time_fired")
+        _drop_index(engine, "states", "ix_states_last_updated")
+        _drop_index(engine, "states", "ix_states_metadata_id_last_updated")
+        _create_index(engine, "events", "ix_events_time_fired_ts")
+        _create_index(engine, "events", "ix_events_event_type_time_fired_ts")
+        _create_index(engine, "states", "ix_states_last_updated_ts")
+        _create_index(engine, "states", "ix_states_metadata_id_last_updated_ts")
     else:
         raise ValueError(f"No schema migration defined for version {new_version}")
 
@@ -340,7 +479,7 @@ def _inspect_schema_version(engine, session):
     indexes = inspector.get_indexes("events")
 
     for index in indexes:
-        if index["column_names"] == ["time_fired"]:
+        if index["column_names"] in (["time_fired"], ["time_fired_ts"]):
             # Schema addition from version 1 detected. New DB.
             session.add(SchemaChanges(schema_version=SCHEMA_VERSION))
             return SCHEMA_VERSION
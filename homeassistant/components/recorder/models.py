@@ -1,11 +1,16 @@
 """Models for SQLAlchemy."""
+from datetime import datetime
 import json
 import logging
+from types import MappingProxyType
+import zlib
 
 from sqlalchemy import (
+    BigInteger,
     Boolean,
     Column,
     DateTime,
+    Float,
     ForeignKey,
     Index,
     Integer,
@@ -13,19 +18,20 @@ from sqlalchemy import (
     Text,
     distinct,
 )
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.dialects import mysql
+from sqlalchemy.ext.declarative import declarative_base, declared_attr
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm.session import Session
 
 from homeassistant.core import Context, Event, EventOrigin, State, split_entity_id
-from homeassistant.helpers.json import JSONEncoder
+from homeassistant.helpers.json import JSONEncoder, state_attributes_json
 import homeassistant.util.dt as dt_util
 
 # SQLAlchemy Schema
 # pylint: disable=invalid-name
 Base = declarative_base()
 
-SCHEMA_VERSION = 11
+SCHEMA_VERSION = 15
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -33,11 +39,18 @@ DB_TIMEZONE = "+00:00"
 
 TABLE_EVENTS = "events"
 TABLE_STATES = "states"
+TABLE_STATE_ATTRIBUTES = "state_attributes"
+TABLE_STATES_META = "states_meta"
 TABLE_RECORDER_RUNS = "recorder_runs"
 TABLE_SCHEMA_CHANGES = "schema_changes"
+TABLE_STATISTICS = "statistics"
+TABLE_STATISTICS_SHORT_TERM = "statistics_short_term"
 
 ALL_TABLES = [TABLE_STATES, TABLE_EVENTS, TABLE_RECORDER_RUNS, TABLE_SCHEMA_CHANGES]
 
+# UNIX timestamps, MySQL FLOAT is single precision
+TIMESTAMP_TYPE = Float().with_variant(mysql.DOUBLE(asdecimal=False), "mysql")
+
 
 class Events(Base):  # type: ignore
     """Event history data."""
@@ -51,8 +64,11 @@ class Events(Base):  # type: ignore
     event_type = Column(String(32))
     event_data = Column(Text)
     origin = Column(String(32))
-    time_fired = Column(DateTime(timezone=True), index=True)
-    created = Column(DateTime(timezone=True), default=dt_util.utcnow)
+    # Replaced by time_fired_ts in schema 15
+    time_fired = Column(DateTime(timezone=True))
+    time_fired_ts = Column(TIMESTAMP_TYPE, index=True)
+    # No longer written since schema 15
+    created = Column(DateTime(timezone=True))
     context_id = Column(String(36), index=True)
     context_user_id = Column(String(36), index=True)
     context_parent_id = Column(String(36), index=True)
@@ -60,21 +76,29 @@ class Events(Base):  # type: ignore
     __table_args__ = (
         # Used for fetching events at a specific time
         # see logbook
-        Index("ix_events_event_type_time_fired", "event_type", "time_fired"),
+        Index("ix_events_event_type_time_fired_ts", "event_type", "time_fired_ts"),
     )
 
     @staticmethod
     def from_event(event, event_data=None):
         """Create an event database object from a native event."""
-        return Events(
-            event_type=event.event_type,
-            event_data=event_data or json.dumps(event.data, cls=JSONEncoder),
-            origin=str(event.origin.value),
-            time_fired=event.time_fired,
-            context_id=event.context.id,
-            context_user_id=event.context.user_id,
-            context_parent_id=event.context.parent_id,
-        )
+        return Events(**Events.row_from_event(event, event_data))
+
+    @staticmethod
+    def row_from_event(event, event_data=None):
+        """Create a dict of column values from a native event.
+
+        Used by the bulk insert path which bypasses the ORM.
+        """
+        return {
+            "event_type": event.event_type,
+            "event_data": event_data or json.dumps(event.data, cls=JSONEncoder),
+            "origin": str(event.origin.value),
+            "time_fired_ts": event.time_fired.timestamp(),
+            "context_id": event.context.id,
+            "context_user_id": event.context.user_id,
+            "context_parent_id": event.context.parent_id,
+        }
 
     def to_native(self, validate_entity_id=True):
         """Convert to a natve HA Event."""
@@ -88,7 +112,7 @@ class Events(Base):  # type: ignore
                 self.event_type,
                 json.loads(self.event_data),
                 EventOrigin(self.origin),
-                process_timestamp(self.time_fired),
+                timestamp_to_datetime(self.time_fired_ts),
                 context=context,
             )
         except ValueError:
@@ -113,58 +137,107 @@ class States(Base):  # type: ignore
     event_id = Column(
         Integer, ForeignKey("events.event_id", ondelete="CASCADE"), index=True
     )
-    last_changed = Column(DateTime(timezone=True), default=dt_util.utcnow)
-    last_updated = Column(DateTime(timezone=True), default=dt_util.utcnow, index=True)
-    created = Column(DateTime(timezone=True), default=dt_util.utcnow)
+    # Replaced by last_changed_ts and last_updated_ts in schema 15
+    last_changed = Column(DateTime(timezone=True))
+    last_updated = Column(DateTime(timezone=True))
+    last_changed_ts = Column(TIMESTAMP_TYPE)
+    last_updated_ts = Column(TIMESTAMP_TYPE, index=True)
+    # No longer written since schema 15
+    created = Column(DateTime(timezone=True))
     old_state_id = Column(
         Integer, ForeignKey("states.state_id", ondelete="SET NULL"), index=True
     )
+    attributes_id = Column(
+        Integer, ForeignKey("state_attributes.attributes_id"), index=True
+    )
+    metadata_id = Column(Integer, ForeignKey("states_meta.metadata_id"))
     event = relationship("Events", uselist=False)
     old_state = relationship("States", remote_side=[state_id])
+    state_attributes = relationship("StateAttributes", lazy="joined")
+    states_meta = relationship("StatesMeta")
 
     __table_args__ = (
         # Used for fetching the state of entities at a specific time
-        # (get_states in history.py)
-        Index("ix_states_entity_id_last_updated", "entity_id", "last_updated"),
+        # (get_states in history.py). Replaces ix_states_entity_id_last_updated
+        # which is dropped once all states have a metadata_id.
+        Index(
+            "ix_states_metadata_id_last_updated_ts", "metadata_id", "last_updated_ts"
+        ),
     )
 
     @staticmethod
     def from_event(event):
         """Create object from a state_changed event."""
+        return States(**States.row_from_event(event))
+
+    @staticmethod
+    def row_from_event(event):
+        """Create a dict of column values from a state_changed event.
+
+        Used by the bulk insert path which bypasses the ORM.
+        """
         entity_id = event.data["entity_id"]
         state = event.data.get("new_state")
 
-        dbstate = States(entity_id=entity_id)
-
         # State got deleted
         if state is None:
-            dbstate.state = ""
-            dbstate.domain = split_entity_id(entity_id)[0]
-            dbstate.attributes = "{}"
-            dbstate.last_changed = event.time_fired
-            dbstate.last_updated = event.time_fired
-        else:
-            dbstate.domain = state.domain
-            dbstate.state = state.state
-            dbstate.attributes = json.dumps(dict(state.attributes), cls=JSONEncoder)
-            dbstate.last_changed = state.last_changed
-            dbstate.last_updated = state.last_updated
-
-        return dbstate
+            return {
+                "entity_id": entity_id,
+                "state": "",
+                "domain": split_entity_id(entity_id)[0],
+                "attributes": "{}",
+                "last_changed_ts": event.time_fired.timestamp(),
+                "last_updated_ts": event.time_fired.timestamp(),
+            }
+
+        try:
+            attributes = state_attributes_json(state)
+        except ValueError:
+            # Out of range floats are not valid JSON but the database
+            # has always accepted them
+            attributes = json.dumps(dict(state.attributes), cls=JSONEncoder)
+
+        return {
+            "entity_id": entity_id,
+            "state": state.state,
+            "domain": state.domain,
+            "attributes": attributes,
+            "last_changed_ts": state.last_changed.timestamp(),
+            "last_updated_ts": state.last_updated.timestamp(),
+        }
 
     def to_native(self, validate_entity_id=True):
         """Convert to an HA state object."""
+        # Rows written before schema 12 carry their own attributes,
+        # newer rows reference the shared state_attributes table.
+        attributes = self.attributes
+        if attributes is None:
+            attributes = (
+                self.state_attributes.shared_attrs if self.state_attributes else "{}"
+            )
         try:
-            return State(
+            attributes = json.loads(attributes)
+            # Join the events table on event_id to get the context instead
+            # as it will always be there for state_changed events
+            context = Context(id=None)
+            if validate_entity_id:
+                return State(
+                    self.entity_id,
+                    self.state,
+                    attributes,
+                    timestamp_to_datetime(self.last_changed_ts),
+                    timestamp_to_datetime(self.last_updated_ts),
+                    context=context,
+                )
+            # The rows were written from the state machine
+            last_updated = timestamp_to_datetime(self.last_updated_ts)
+            return State.from_trusted(
                 self.entity_id,
                 self.state,
-                json.loads(self.attributes),
-                process_timestamp(self.last_changed),
-                process_timestamp(self.last_updated),
-                # Join the events table on event_id to get the context instead
-                # as it will always be there for state_changed events
-                context=Context(id=None),
-                validate_entity_id=validate_entity_id,
+                MappingProxyType(attributes),
+                timestamp_to_datetime(self.last_changed_ts) or last_updated,
+                last_updated,
+                context,
             )
         except ValueError:
             # When json.loads fails
@@ -172,6 +245,126 @@ class States(Base):  # type: ignore
             return None
 
 
+class StateAttributes(Base):  # type: ignore
+    """State attribute change history.
+
+    Attributes are stored once per distinct JSON document and
+    referenced from the states table by attributes_id.
+    """
+
+    __table_args__ = {
+        "mysql_default_charset": "utf8mb4",
+        "mysql_collate": "utf8mb4_unicode_ci",
+    }
+    __tablename__ = TABLE_STATE_ATTRIBUTES
+    attributes_id = Column(Integer, primary_key=True)
+    hash = Column(BigInteger, index=True)
+    # Note that this is not named attributes to avoid confusion with the states table
+    shared_attrs = Column(Text)
+
+    @staticmethod
+    def from_shared_attrs(shared_attrs):
+        """Create object from the json encoded shared attributes."""
+        return StateAttributes(
+            shared_attrs=shared_attrs,
+            hash=StateAttributes.hash_shared_attrs(shared_attrs),
+        )
+
+    @staticmethod
+    def hash_shared_attrs(shared_attrs):
+        """Return the hash of json encoded shared attributes.
+
+        The hash is only used to narrow down the lookup,
+        matches are always confirmed with shared_attrs.
+        """
+        return zlib.crc32(shared_attrs.encode("utf-8"))
+
+    def to_native(self, validate_entity_id=True):
+        """Convert to the state attributes dict."""
+        try:
+            return json.loads(self.shared_attrs)
+        except ValueError:
+            # When json.loads fails
+            _LOGGER.exception("Error converting row to state attributes: %s", self)
+            return {}
+
+
+class StatesMeta(Base):  # type: ignore
+    """Entity ids of the states table.
+
+    States reference their entity_id by metadata_id so the indexes
+    on the states table hold an integer instead of the entity_id.
+    """
+
+    __table_args__ = {
+        "mysql_default_charset": "utf8mb4",
+        "mysql_collate": "utf8mb4_unicode_ci",
+    }
+    __tablename__ = TABLE_STATES_META
+    metadata_id = Column(Integer, primary_key=True)
+    entity_id = Column(String(255), index=True, unique=True)
+
+
+class StatisticsBase:
+    """Statistics rolled up over a fixed period.
+
+    Numeric sensors record mean, min and max, meters record
+    the last state, its last_reset and the accumulated sum.
+    """
+
+    id = Column(Integer, primary_key=True)
+    created = Column(DateTime(timezone=True), default=dt_util.utcnow)
+    statistic_id = Column(String(255))
+    start = Column(DateTime(timezone=True))
+    mean = Column(Float())
+    min = Column(Float())
+    max = Column(Float())
+    last_reset = Column(DateTime(timezone=True))
+    state = Column(Float())
+    sum = Column(Float())
+
+    @declared_attr
+    def __table_args__(cls):  # pylint: disable=no-self-argument
+        """Index the statistics by statistic_id and start."""
+        return (
+            Index(
+                f"ix_{cls.__tablename__}_statistic_id_start",  # type: ignore
+                "statistic_id",
+                "start",
+            ),
+        )
+
+    @classmethod
+    def from_stats(cls, statistic_id, start, stats):
+        """Create object from a statistics dict."""
+        return cls(statistic_id=statistic_id, start=start, **stats)
+
+    def as_dict(self):
+        """Return a JSON friendly dict of the statistics."""
+        return {
+            "statistic_id": self.statistic_id,
+            "start": process_timestamp_to_utc_isoformat(self.start),
+            "mean": self.mean,
+            "min": self.min,
+            "max": self.max,
+            "last_reset": process_timestamp_to_utc_isoformat(self.last_reset),
+            "state": self.state,
+            "sum": self.sum,
+        }
+
+
+class Statistics(Base, StatisticsBase):  # type: ignore
+    """Long term statistics rolled up per hour."""
+
+    __tablename__ = TABLE_STATISTICS
+
+
+class StatisticsShortTerm(Base, StatisticsBase):  # type: ignore
+    """Short term statistics rolled up per 5 minutes."""
+
+    __tablename__ = TABLE_STATISTICS_SHORT_TERM
+
+
 class RecorderRuns(Base):  # type: ignore
     """Representation of recorder run."""
 
@@ -195,13 +388,15 @@ class RecorderRuns(Base):  # type: ignore
         assert session is not None, "RecorderRuns need to be persisted"
 
         query = session.query(distinct(States.entity_id)).filter(
-            States.last_updated >= self.start
+            States.last_updated_ts >= process_timestamp(self.start).timestamp()
         )
 
         if point_in_time is not None:
-            query = query.filter(States.last_updated < point_in_time)
+            query = query.filter(States.last_updated_ts < point_in_time.timestamp())
         elif self.end is not None:
-            query = query.filter(States.last_updated < self.end)
+            query = query.filter(
+                States.last_updated_ts < process_timestamp(self.end).timestamp()
+            )
 
         return [row[0] for row in query]
 
@@ -238,3 +433,20 @@ def process_timestamp_to_utc_isoformat(ts):
     if ts.tzinfo is None:
         return f"{ts.isoformat()}{DB_TIMEZONE}"
     return ts.astimezone(dt_util.UTC).isoformat()
+
+
+def timestamp_to_datetime(ts):
+    """Convert a UNIX timestamp into a UTC datetime object."""
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, dt_util.UTC)
+
+
+def timestamp_to_utc_isoformat(ts):
+    """Convert a UNIX timestamp into UTC isotime.
+
+    Skips the timezone conversion of a timezone aware datetime object.
+    """
+    if ts is None:
+        return None
+    return f"{datetime.utcfromtimestamp(ts).isoformat()}{DB_TIMEZONE}"
@@ -1,66 +1,104 @@
 """Purge old data helper."""
-from datetime import timedelta
+from datetime import datetime, timedelta
 import logging
 import time
+from typing import Any, Dict, Optional
 
 from sqlalchemy.exc import OperationalError, SQLAlchemyError
 
 import homeassistant.util.dt as dt_util
 
-from .models import Events, RecorderRuns, States
-from .util import execute, session_scope
+from .models import Events, RecorderRuns, StateAttributes, States, StatisticsShortTerm
+from .util import session_scope
 
 _LOGGER = logging.getLogger(__name__)
 
 
-def purge_old_data(instance, purge_days: int, repack: bool) -> bool:
+# Rows deleted per batch, a batch blocks the recorder thread so it is
+# kept small enough to finish in well under a second. The attributes ids
+# of a batch are used as bound parameters, SQLite allows up to 999.
+PURGE_BATCH_SIZE = 998
+
+# Seconds between progress reports in the log
+PROGRESS_LOG_INTERVAL = 10
+
+
+class PurgeProgress:
+    """Progress of a purge that is split over many batches."""
+
+    def __init__(self, purge_before: datetime, total: int) -> None:
+        """Initialize the progress.
+
+        total is an estimate from the primary key ranges of the rows to
+        purge, it is too high when the ids have gaps.
+        """
+        self.purge_before = purge_before
+        self.total = total
+        self.deleted = 0
+        self.started = time.monotonic()
+        self._last_log = self.started
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Return the estimated seconds until all rows are deleted."""
+        if not self.deleted:
+            return None
+        elapsed = time.monotonic() - self.started
+        return max(self.total - self.deleted, 0) * elapsed / self.deleted
+
+    def add(self, deleted: int) -> None:
+        """Count deleted rows and log the progress now and then."""
+        self.deleted += deleted
+        now = time.monotonic()
+        if now - self._last_log < PROGRESS_LOG_INTERVAL:
+            return
+        self._last_log = now
+        _LOGGER.info(
+            "Purged %s of about %s states and events, %.0f seconds remaining",
+            self.deleted,
+            self.total,
+            self.eta,
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the progress as a dict."""
+        return {
+            "purge_before": self.purge_before.isoformat(),
+            "deleted": self.deleted,
+            "total": self.total,
+            "eta": self.eta,
+        }
+
+
+def purge_old_data(instance, purge_days: int) -> bool:
     """Purge events and states older than purge_days ago.
 
-    Cleans up an timeframe of an hour, based on the oldest record.
+    Deletes a batch of at most PURGE_BATCH_SIZE rows, selected by a
+    primary key range starting at the oldest row. Returns False when
+    there may be more rows to purge so the recorder can commit the
+    events that queued up in the meantime before the next batch.
     """
     purge_before = dt_util.utcnow() - timedelta(days=purge_days)
+    purge_before_ts = purge_before.timestamp()
     _LOGGER.debug("Purging states and events before target %s", purge_before)
 
     try:
         with session_scope(session=instance.get_session()) as session:
-            # Purge a max of 1 hour, based on the oldest states or events record
-            batch_purge_before = purge_before
-
-            query = session.query(States).order_by(States.last_updated.asc()).limit(1)
-            states = execute(query, to_native=True, validate_entity_ids=False)
-            if states:
-                batch_purge_before = min(
-                    batch_purge_before,
-                    states[0].last_updated + timedelta(hours=1),
+            progress = instance.purge_progress
+            if progress is None:
+                progress = instance.purge_progress = PurgeProgress(
+                    purge_before, _estimate_rows_to_purge(session, purge_before_ts)
                 )
-
-            query = session.query(Events).order_by(Events.time_fired.asc()).limit(1)
-            events = execute(query, to_native=True)
-            if events:
-                batch_purge_before = min(
-                    batch_purge_before,
-                    events[0].time_fired + timedelta(hours=1),
+            # The states go first, they reference the events
+            deleted_rows = _purge_states_batch(instance, session, purge_before_ts)
+            if not deleted_rows:
+                deleted_rows = _purge_batch(
+                    session, Events.event_id, Events.time_fired_ts, purge_before_ts
                 )
+                _LOGGER.debug("Deleted %s events", deleted_rows)
 
-            _LOGGER.debug("Purging states and events before %s", batch_purge_before)
-
-            deleted_rows = (
-                session.query(States)
-                .filter(States.last_updated < batch_purge_before)
-                .delete(synchronize_session=False)
-            )
-            _LOGGER.debug("Deleted %s states", deleted_rows)
-
-            deleted_rows = (
-                session.query(Events)
-                .filter(Events.time_fired < batch_purge_before)
-                .delete(synchronize_session=False)
-            )
-            _LOGGER.debug("Deleted %s events", deleted_rows)
-
-            # If states or events purging isn't processing the purge_before yet,
-            # return false, as we are not done yet.
-            if batch_purge_before != purge_before:
+            if deleted_rows:
+                progress.add(deleted_rows)
                 _LOGGER.debug("Purging hasn't fully completed yet")
                 return False
 
@@ -73,15 +111,20 @@ def purge_old_data(instance, purge_days: int, repack: bool) -> bool:
             )
             _LOGGER.debug("Deleted %s recorder_runs", deleted_rows)
 
-        if repack:
-            # Execute sqlite or postgresql vacuum command to free up space on disk
-            if instance.engine.driver in ("pysqlite", "postgresql"):
-                _LOGGER.debug("Vacuuming SQL DB to free space")
-                instance.engine.execute("VACUUM")
-            # Optimize mysql / mariadb tables to free up space on disk
-            elif instance.engine.driver in ("mysqldb", "pymysql"):
-                _LOGGER.debug("Optimizing SQL DB to free space")
-                instance.engine.execute("OPTIMIZE TABLE states, events, recorder_runs")
+            # Short term statistics follow keep_days, the hourly
+            # statistics are small and kept as long term history
+            deleted_rows = (
+                session.query(StatisticsShortTerm)
+                .filter(StatisticsShortTerm.start < purge_before)
+                .delete(synchronize_session=False)
+            )
+            _LOGGER.debug("Deleted %s statistics_short_term", deleted_rows)
+
+        _LOGGER.debug(
+            "Purged %s states and events in %.1f seconds",
+            progress.deleted,
+            time.monotonic() - progress.started,
+        )
 
     except OperationalError as err:
         # Retry when one of the following MySQL errors occurred:
@@ -100,4 +143,123 @@ def purge_old_data(instance, purge_days: int, repack: bool) -> bool:
         _LOGGER.warning("Error purging history: %s", err)
     except SQLAlchemyError as err:
         _LOGGER.warning("Error purging history: %s", err)
+    instance.purge_progress = None
     return True
+
+
+def repack_database(instance) -> None:
+    """Rewrite the database to free the space of the purged rows.
+
+    Unlike the purge this can not be split in batches, the recorder
+    can not write until it is done. It only runs when requested with
+    the repack option of the purge service, never for the nightly purge.
+    """
+    try:
+        # Execute sqlite or postgresql vacuum command to free up space on disk
+        if instance.engine.driver in ("pysqlite", "postgresql"):
+            _LOGGER.debug("Vacuuming SQL DB to free space")
+            instance.engine.execute("VACUUM")
+        # Optimize mysql / mariadb tables to free up space on disk
+        elif instance.engine.driver in ("mysqldb", "pymysql"):
+            _LOGGER.debug("Optimizing SQL DB to free space")
+            instance.engine.execute(
+                "OPTIMIZE TABLE states, state_attributes, events, recorder_runs"
+            )
+    except SQLAlchemyError as err:
+        _LOGGER.warning("Error repacking database: %s", err)
+
+
+def _estimate_rows_to_purge(session, purge_before_ts: float) -> int:
+    """Estimate the states and events older than purge_before_ts.
+
+    Counting the rows reads all of them, the primary key range between
+    the oldest and the newest of them only takes two index lookups.
+    """
+    return _id_range_size(
+        session, States.state_id, States.last_updated_ts, purge_before_ts
+    ) + _id_range_size(session, Events.event_id, Events.time_fired_ts, purge_before_ts)
+
+
+def _id_range_size(session, id_column, time_column, purge_before_ts: float) -> int:
+    """Return the size of the primary key range of rows older than purge_before_ts."""
+    query = session.query(id_column).filter(time_column < purge_before_ts)
+    oldest = query.order_by(time_column.asc()).first()
+    if oldest is None:
+        return 0
+    newest = query.order_by(time_column.desc()).first()
+    return max(newest[0] - oldest[0] + 1, 1)
+
+
+def _batch_filter(session, id_column, time_column, purge_before_ts: float):
+    """Return the filter of the next batch of rows older than purge_before_ts.
+
+    The batch is a range of primary keys starting at the oldest row so
+    the delete can use the primary key index. Ids grow with time, rows in
+    the range that are not old enough yet are left alone.
+    """
+    oldest = (
+        session.query(id_column)
+        .filter(time_column < purge_before_ts)
+        .order_by(time_column.asc())
+        .first()
+    )
+    if oldest is None:
+        return None
+
+    return (
+        (id_column >= oldest[0])
+        & (id_column < oldest[0] + PURGE_BATCH_SIZE)
+        & (time_column < purge_before_ts)
+    )
+
+
+def _purge_batch(session, id_column, time_column, purge_before_ts: float) -> int:
+    """Delete the next batch of rows older than purge_before_ts."""
+    batch = _batch_filter(session, id_column, time_column, purge_before_ts)
+    if batch is None:
+        return 0
+
+    return (
+        session.query(id_column.class_).filter(batch).delete(synchronize_session=False)
+    )
+
+
+def _purge_states_batch(instance, session, purge_before_ts: float) -> int:
+    """Delete the next batch of states and the attributes only they used."""
+    batch = _batch_filter(
+        session, States.state_id, States.last_updated_ts, purge_before_ts
+    )
+    if batch is None:
+        return 0
+
+    attributes_ids = {
+        row[0]
+        for row in session.query(States.attributes_id)
+        .filter(batch)
+        .filter(States.attributes_id.isnot(None))
+        .distinct()
+    }
+    deleted_rows = session.query(States).filter(batch).delete(synchronize_session=False)
+    _LOGGER.debug("Deleted %s states", deleted_rows)
+
+    if not attributes_ids:
+        return deleted_rows
+
+    # Attributes are shared between states, keep the ones
+    # still referenced by any remaining state
+    attributes_ids -= {
+        row[0]
+        for row in session.query(States.attributes_id)
+        .filter(States.attributes_id.in_(attributes_ids))
+        .distinct()
+    }
+    if attributes_ids:
+        deleted_attributes = (
+            session.query(StateAttributes)
+            .filter(StateAttributes.attributes_id.in_(attributes_ids))
+            .delete(synchronize_session=False)
+        )
+        _LOGGER.debug("Deleted %s state_attributes", deleted_attributes)
+        instance.clear_state_attributes_cache()
+
+    return deleted_rows
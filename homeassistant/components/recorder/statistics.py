@@ -0,0 +1,365 @@
+"""Statistics helper."""
+from datetime import datetime, timedelta
+from itertools import groupby
+import json
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, func
+
+from homeassistant.const import ATTR_UNIT_OF_MEASUREMENT
+import homeassistant.util.dt as dt_util
+
+from .models import (
+    StateAttributes,
+    States,
+    Statistics,
+    StatisticsShortTerm,
+    process_timestamp,
+)
+from .util import entity_ids_filter, execute, session_scope
+
+_LOGGER = logging.getLogger(__name__)
+
+ATTR_LAST_RESET = "last_reset"
+
+STATISTICS_DOMAINS = ("sensor",)
+
+SHORT_TERM_PERIOD = timedelta(minutes=5)
+HOURLY_PERIOD = timedelta(hours=1)
+
+# Periods compiled by one statistics task while catching up
+MAX_PERIODS_PER_RUN = 12
+
+PERIOD_5MINUTE = "5minute"
+PERIOD_HOUR = "hour"
+
+STATISTICS_TABLES = {
+    PERIOD_5MINUTE: StatisticsShortTerm,
+    PERIOD_HOUR: Statistics,
+}
+
+UNIT_OF_MEASUREMENT_JSON = f'"{ATTR_UNIT_OF_MEASUREMENT}":'
+LAST_RESET_JSON = f'"{ATTR_LAST_RESET}":'
+
+# Rows written before schema 12 store their own attributes
+STATE_ATTRIBUTES = func.coalesce(StateAttributes.shared_attrs, States.attributes)
+
+
+def get_start_time(now: datetime) -> datetime:
+    """Return the start of the last completed short term period."""
+    now = dt_util.as_utc(now).replace(second=0, microsecond=0)
+    last_period = now.replace(minute=now.minute - now.minute % 5)
+    return last_period - SHORT_TERM_PERIOD
+
+
+def compile_missing_statistics(
+    instance, start: datetime, period: Optional[datetime] = None
+) -> Optional[datetime]:
+    """Compile statistics for the periods up to the one starting at start.
+
+    Periods missed while Home Assistant was stopped or the recorder was
+    behind are compiled first, in order, continuing after the last
+    compiled short term period. States older than keep_days have been
+    purged, so periods before that are not compiled.
+
+    At most MAX_PERIODS_PER_RUN periods are compiled so the recorder
+    does not stall, the start of the next period to compile is returned
+    when there are more. Pass it as period to continue.
+    """
+    start = dt_util.as_utc(start)
+    if period is None:
+        period = start
+        with session_scope(session=instance.get_session()) as session:
+            last_start = session.query(func.max(StatisticsShortTerm.start)).scalar()
+        if last_start is not None:
+            period = max(
+                process_timestamp(last_start) + SHORT_TERM_PERIOD,
+                start - timedelta(days=instance.keep_days),
+            )
+
+    for _ in range(MAX_PERIODS_PER_RUN):
+        if period > start:
+            return None
+        compile_statistics(instance, period)
+        period += SHORT_TERM_PERIOD
+
+    return period if period <= start else None
+
+
+def compile_statistics(instance, start: datetime) -> bool:
+    """Compile statistics for the short term period starting at start.
+
+    When the period completes an hour the hourly statistics are
+    compiled from the short term statistics as well.
+    """
+    start = dt_util.as_utc(start)
+    end = start + SHORT_TERM_PERIOD
+    _LOGGER.debug("Compiling statistics for %s-%s", start, end)
+
+    with session_scope(session=instance.get_session()) as session:
+        if _has_statistics(session, StatisticsShortTerm, start):
+            _LOGGER.debug("Statistics already compiled for %s-%s", start, end)
+        else:
+            _compile_short_term_statistics(instance, session, start, end)
+
+        if end.minute == 0 and not _has_statistics(
+            session, Statistics, end - HOURLY_PERIOD
+        ):
+            # Flush so the hourly rollup includes the last short term period
+            session.flush()
+            _compile_hourly_statistics(session, end - HOURLY_PERIOD)
+
+    return True
+
+
+def _compile_short_term_statistics(
+    instance, session, start: datetime, end: datetime
+) -> None:
+    """Compile the short term statistics of the period start - end."""
+    previous = {
+        row.statistic_id: row
+        for row in session.query(StatisticsShortTerm).filter(
+            StatisticsShortTerm.start == start - SHORT_TERM_PERIOD
+        )
+    }
+
+    rows = execute(
+        session.query(
+            States.entity_id,
+            States.state,
+            STATE_ATTRIBUTES.label("attributes"),
+            States.last_updated_ts,
+        )
+        .outerjoin(
+            StateAttributes, States.attributes_id == StateAttributes.attributes_id
+        )
+        .filter(States.domain.in_(STATISTICS_DOMAINS))
+        .filter(
+            (States.last_updated_ts >= start.timestamp())
+            & (States.last_updated_ts < end.timestamp())
+        )
+        .filter(STATE_ATTRIBUTES.contains(UNIT_OF_MEASUREMENT_JSON))
+        # Group on the integer metadata_id once all states have one
+        .order_by(
+            States.metadata_id if instance.states_meta_migrated else States.entity_id,
+            States.last_updated_ts,
+        )
+    )
+
+    short_term = {}
+    for entity_id, group in groupby(rows, lambda row: row.entity_id):
+        stats = _compile_entity(group, previous.get(entity_id), start, end)
+        if stats is not None:
+            short_term[entity_id] = stats
+
+    # Sensors that did not change keep their last value as long as their
+    # last state is numeric, a sensor that became unavailable, lost its
+    # unit or was removed ends its series
+    unchanged = [
+        statistic_id
+        for statistic_id, prev in previous.items()
+        if statistic_id not in short_term and prev.state is not None
+    ]
+    if unchanged:
+        last_states = _last_states(instance, session, unchanged, end)
+        for statistic_id in unchanged:
+            if _is_numeric(last_states.get(statistic_id)):
+                short_term[statistic_id] = _carry_over(previous[statistic_id])
+
+    session.add_all(
+        StatisticsShortTerm.from_stats(statistic_id, start, stats)
+        for statistic_id, stats in short_term.items()
+    )
+
+
+def _last_states(instance, session, entity_ids: List[str], end: datetime) -> Dict:
+    """Return the last state row before end of each of entity_ids."""
+    # Group on the integer metadata_id once all states have one
+    entity_column = States.entity_id
+    if instance.states_meta_migrated:
+        entity_column = States.metadata_id
+
+    most_recent = (
+        session.query(
+            entity_column.label("max_entity_id"),
+            func.max(States.last_updated_ts).label("max_last_updated"),
+        )
+        .filter(entity_ids_filter(instance.hass, session, entity_ids))
+        .filter(States.last_updated_ts < end.timestamp())
+        .group_by(entity_column)
+        .subquery()
+    )
+
+    rows = execute(
+        session.query(
+            States.entity_id,
+            States.state,
+            STATE_ATTRIBUTES.label("attributes"),
+        )
+        .outerjoin(
+            StateAttributes, States.attributes_id == StateAttributes.attributes_id
+        )
+        .join(
+            most_recent,
+            and_(
+                entity_column == most_recent.c.max_entity_id,
+                States.last_updated_ts == most_recent.c.max_last_updated,
+            ),
+        )
+    )
+    return {row.entity_id: row for row in rows}
+
+
+def _is_numeric(row) -> bool:
+    """Return if a state row is a number with a unit of measurement."""
+    if row is None or UNIT_OF_MEASUREMENT_JSON not in (row.attributes or ""):
+        return False
+    try:
+        float(row.state)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def _has_statistics(session, table, start: datetime) -> bool:
+    """Return if statistics were already compiled for the period at start."""
+    return session.query(table.id).filter(table.start == start).first() is not None
+
+
+def _compile_entity(rows, prev, start: datetime, end: datetime) -> Optional[Dict]:
+    """Compile the statistics of a single entity from its state rows."""
+    values = []
+    last_reset = process_timestamp(prev.last_reset) if prev else None
+    is_meter = prev is not None and prev.sum is not None
+    total = prev.sum if is_meter else None
+    last_value = prev.state if prev else None
+
+    for row in rows:
+        try:
+            value = float(row.state)
+        except (TypeError, ValueError):
+            continue
+
+        if LAST_RESET_JSON in row.attributes:
+            is_meter = True
+            row_last_reset = _last_reset(row.attributes)
+            if total is None:
+                # First time the meter is seen, start from its current state
+                total = 0.0
+            elif row_last_reset != last_reset:
+                # The meter was reset, the new state accumulated since then
+                total += value
+            elif last_value is not None:
+                total += value - last_value
+            last_reset = row_last_reset
+
+        values.append((dt_util.utc_from_timestamp(row.last_updated_ts), value))
+        last_value = value
+
+    if not values:
+        return None
+
+    # Time weighted mean, the previous state holds until the first change
+    if prev is not None and prev.state is not None:
+        values.insert(0, (start, prev.state))
+    weighted = 0.0
+    for idx, (changed, value) in enumerate(values):
+        until = values[idx + 1][0] if idx + 1 < len(values) else end
+        weighted += value * (until - changed).total_seconds()
+    duration = (end - values[0][0]).total_seconds()
+
+    all_values = [value for _, value in values]
+    return {
+        "mean": weighted / duration if duration else all_values[-1],
+        "min": min(all_values),
+        "max": max(all_values),
+        "last_reset": last_reset if is_meter else None,
+        "state": last_value,
+        "sum": total if is_meter else None,
+    }
+
+
+def _carry_over(prev) -> Dict:
+    """Return the statistics of a period without state changes."""
+    return {
+        "mean": prev.state,
+        "min": prev.state,
+        "max": prev.state,
+        "last_reset": prev.last_reset,
+        "state": prev.state,
+        "sum": prev.sum,
+    }
+
+
+def _last_reset(attributes: str) -> Optional[datetime]:
+    """Extract the last_reset attribute of a meter."""
+    try:
+        last_reset = json.loads(attributes).get(ATTR_LAST_RESET)
+    except ValueError:
+        return None
+    if not isinstance(last_reset, str):
+        return None
+    parsed = dt_util.parse_datetime(last_reset)
+    return dt_util.as_utc(parsed) if parsed else None
+
+
+def _compile_hourly_statistics(session, start: datetime) -> None:
+    """Roll up the short term statistics of an hour."""
+    end = start + HOURLY_PERIOD
+    _LOGGER.debug("Compiling hourly statistics for %s-%s", start, end)
+
+    rows = (
+        session.query(StatisticsShortTerm)
+        .filter(
+            (StatisticsShortTerm.start >= start) & (StatisticsShortTerm.start < end)
+        )
+        .order_by(StatisticsShortTerm.statistic_id, StatisticsShortTerm.start)
+    )
+
+    hourly = []
+    for statistic_id, group in groupby(rows, lambda row: row.statistic_id):
+        short_term = list(group)
+        last = short_term[-1]
+        hourly.append(
+            Statistics.from_stats(
+                statistic_id,
+                start,
+                {
+                    "mean": sum(row.mean for row in short_term) / len(short_term),
+                    "min": min(row.min for row in short_term),
+                    "max": max(row.max for row in short_term),
+                    "last_reset": last.last_reset,
+                    "state": last.state,
+                    "sum": last.sum,
+                },
+            )
+        )
+
+    session.add_all(hourly)
+
+
+def statistics_during_period(
+    hass,
+    start_time: datetime,
+    end_time: Optional[datetime] = None,
+    statistic_ids: Optional[Iterable[str]] = None,
+    period: str = PERIOD_HOUR,
+) -> Dict[str, List[Dict]]:
+    """Return the statistics of the period start_time - end_time."""
+    table = STATISTICS_TABLES[period]
+
+    with session_scope(hass=hass) as session:
+        query = session.query(table).filter(table.start >= start_time)
+        if end_time is not None:
+            query = query.filter(table.start < end_time)
+        if statistic_ids is not None:
+            query = query.filter(table.statistic_id.in_(list(statistic_ids)))
+        query = query.order_by(table.statistic_id, table.start)
+
+        return {
+            statistic_id: [row.as_dict() for row in group]
+            for statistic_id, group in groupby(
+                execute(query), lambda row: row.statistic_id
+            )
+        }
@@ -4,13 +4,14 @@ from datetime import timedelta
 import logging
 import os
 import time
+from typing import Iterable, List, Optional
 
 from sqlalchemy.exc import OperationalError, SQLAlchemyError
 
 import homeassistant.util.dt as dt_util
 
 from .const import CONF_DB_INTEGRITY_CHECK, DATA_INSTANCE, SQLITE_URL_PREFIX
-from .models import ALL_TABLES, process_timestamp
+from .models import ALL_TABLES, States, process_timestamp
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -24,6 +25,27 @@ SQLITE3_POSTFIXES = ["", "-wal", "-shm"]
 MAX_RESTART_TIME = timedelta(minutes=10)
 
 
+def get_metadata_ids(hass, session, entity_ids: Iterable[str]) -> Optional[List[int]]:
+    """Return the metadata_ids to filter the states of entity_ids on.
+
+    Returns None until the states recorded before schema 14 have a
+    metadata_id, queries need to filter on States.entity_id until then.
+    Entities without recorded states are left out.
+    """
+    instance = hass.data[DATA_INSTANCE]
+    if not instance.states_meta_migrated:
+        return None
+    return list(instance.lookup_metadata_ids(session, entity_ids).values())
+
+
+def entity_ids_filter(hass, session, entity_ids: List[str]):
+    """Return the criterion to filter the states of entity_ids on."""
+    metadata_ids = get_metadata_ids(hass, session, entity_ids)
+    if metadata_ids is None:
+        return States.entity_id.in_(entity_ids)
+    return States.metadata_id.in_(metadata_ids)
+
+
 @contextmanager
 def session_scope(*, hass=None, session=None):
     """Provide a transactional scope around a series of operations."""
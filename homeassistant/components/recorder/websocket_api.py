@@ -0,0 +1,46 @@
+"""The Recorder websocket API."""
+from datetime import timedelta
+
+import voluptuous as vol
+
+from homeassistant.components import websocket_api
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_track_time_interval
+
+from .const import DATA_INSTANCE
+
+INFO_INTERVAL = timedelta(seconds=5)
+
+
+@callback
+def async_setup(hass: HomeAssistant) -> None:
+    """Set up the recorder websocket API."""
+    websocket_api.async_register_command(hass, ws_info)
+    websocket_api.async_register_command(hass, ws_subscribe_info)
+
+
+@callback
+@websocket_api.require_admin
+@websocket_api.websocket_command({vol.Required("type"): "recorder/info"})
+def ws_info(hass, connection, msg):
+    """Return the recorder backlog and commit latency."""
+    connection.send_result(msg["id"], hass.data[DATA_INSTANCE].info())
+
+
+@callback
+@websocket_api.require_admin
+@websocket_api.websocket_command({vol.Required("type"): "recorder/subscribe_info"})
+def ws_subscribe_info(hass, connection, msg):
+    """Send the recorder backlog and commit latency periodically."""
+    instance = hass.data[DATA_INSTANCE]
+
+    @callback
+    def forward_info(now):
+        """Forward the recorder info to websocket."""
+        connection.send_message(websocket_api.event_message(msg["id"], instance.info()))
+
+    connection.subscriptions[msg["id"]] = async_track_time_interval(
+        hass, forward_info, INFO_INTERVAL
+    )
+    connection.send_result(msg["id"])
+    forward_info(None)
@@ -6,7 +6,11 @@ import statistics
 import voluptuous as vol
 
 from homeassistant.components.recorder.models import States
-from homeassistant.components.recorder.util import execute, session_scope
+from homeassistant.components.recorder.util import (
+    entity_ids_filter,
+    execute,
+    session_scope,
+)
 from homeassistant.components.sensor import PLATFORM_SCHEMA
 from homeassistant.const import (
     ATTR_UNIT_OF_MEASUREMENT,
@@ -327,7 +331,7 @@ class StatisticsSensor(Entity):
 
         with session_scope(hass=self.hass) as session:
             query = session.query(States).filter(
-                States.entity_id == self._entity_id.lower()
+                entity_ids_filter(self.hass, session, [self._entity_id.lower()])
             )
 
             if self._max_age is not None:
@@ -337,11 +341,13 @@ class StatisticsSensor(Entity):
                     self.entity_id,
                     records_older_then,
                 )
-                query = query.filter(States.last_updated >= records_older_then)
+                query = query.filter(
+                    States.last_updated_ts >= records_older_then.timestamp()
+                )
             else:
                 _LOGGER.debug("%s: retrieving all records", self.entity_id)
 
-            query = query.order_by(States.last_updated.desc()).limit(
+            query = query.order_by(States.last_updated_ts.desc()).limit(
                 self._sampling_size
             )
             states = execute(query, to_native=True, validate_entity_ids=False)
@@ -15,6 +15,7 @@ from homeassistant.exceptions import (
 )
 from homeassistant.helpers import config_validation as cv, entity
 from homeassistant.helpers.event import TrackTemplate, async_track_template_result
+from homeassistant.helpers.json import states_json, states_snapshot_json
 from homeassistant.helpers.service import async_get_all_descriptions
 from homeassistant.helpers.template import Template
 from homeassistant.loader import IntegrationNotFound, async_get_integration
@@ -68,27 +69,26 @@ def handle_subscribe_events(hass, connection, msg):
     if event_type == EVENT_STATE_CHANGED:
 
         @callback
-        def forward_events(event):
-            """Forward state changed events to websocket."""
-            if not connection.user.permissions.check_entity(
+        def event_filter(event):
+            """Filter state changed events the user may not read."""
+            return connection.user.permissions.check_entity(
                 event.data["entity_id"], POLICY_READ
-            ):
-                return
-
-            connection.send_message(messages.cached_event_message(msg["id"], event))
+            )
 
     else:
 
         @callback
-        def forward_events(event):
-            """Forward events to websocket."""
-            if event.event_type == EVENT_TIME_CHANGED:
-                return
+        def event_filter(event):
+            """Filter time changed events."""
+            return event.event_type != EVENT_TIME_CHANGED
 
-            connection.send_message(messages.cached_event_message(msg["id"], event))
+    @callback
+    def forward_events(event):
+        """Forward events to websocket."""
+        connection.send_message(messages.cached_event_message(msg["id"], event))
 
     connection.subscriptions[msg["id"]] = hass.bus.async_listen(
-        event_type, forward_events
+        event_type, forward_events, event_filter, run_immediately=True
     )
 
     connection.send_message(messages.result_message(msg["id"]))
@@ -172,17 +172,21 @@ async def handle_call_service(hass, connection, msg):
 @decorators.websocket_command({vol.Required("type"): "get_states"})
 def handle_get_states(hass, connection, msg):
     """Handle get states command."""
+    snapshot = hass.states.async_snapshot()
     if connection.user.permissions.access_all_entities("read"):
-        states = hass.states.async_all()
+        states = snapshot
+        encode = states_snapshot_json
     else:
         entity_perm = connection.user.permissions.check_entity
-        states = [
-            state
-            for state in hass.states.async_all()
-            if entity_perm(state.entity_id, "read")
-        ]
-
-    connection.send_message(messages.result_message(msg["id"], states))
+        states = [state for state in snapshot if entity_perm(state.entity_id, "read")]
+        encode = states_json
+    try:
+        result_json = encode(states)
+    except (ValueError, TypeError):
+        # Let the writer report the attributes that can't be serialized
+        connection.send_message(messages.result_message(msg["id"], list(states)))
+        return
+    connection.send_message(messages.json_result_message(msg["id"], result_json))
 
 
 @decorators.websocket_command({vol.Required("type"): "get_services"})
@@ -37,6 +37,14 @@ def result_message(iden: int, result: Any = None) -> Dict:
     return {"id": iden, "type": const.TYPE_RESULT, "success": True, "result": result}
 
 
+def json_result_message(iden: int, result_json: str) -> str:
+    """Return a success result message with a result already encoded as JSON."""
+    return (
+        f'{{"id": {iden}, "type": "{const.TYPE_RESULT}", "success": true, '
+        f'"result": {result_json}}}'
+    )
+
+
 def error_message(iden: int, code: str, message: str) -> Dict:
     """Return an error result message."""
     return {
@@ -28,6 +28,7 @@ from homeassistant.const import (
     CONF_CUSTOMIZE_DOMAIN,
     CONF_CUSTOMIZE_GLOB,
     CONF_ELEVATION,
+    CONF_EXECUTOR_LIMITS,
     CONF_EXTERNAL_URL,
     CONF_ID,
     CONF_INTERNAL_URL,
@@ -226,6 +227,9 @@ CORE_CONFIG_SCHEMA = CUSTOMIZE_CONFIG_SCHEMA.extend(
         # pylint: disable=no-value-for-parameter
         vol.Optional(CONF_MEDIA_DIRS): cv.schema_with_slug_keys(vol.IsDir()),
         vol.Optional(CONF_LEGACY_TEMPLATES): cv.boolean,
+        vol.Optional(CONF_EXECUTOR_LIMITS): {
+            cv.string: vol.All(vol.Coerce(int), vol.Range(min=1))
+        },
     }
 )
 
@@ -506,6 +510,7 @@ async def async_process_ha_core_config(hass: HomeAssistant, config: Dict) -> Non
         (CONF_EXTERNAL_URL, "external_url"),
         (CONF_MEDIA_DIRS, "media_dirs"),
         (CONF_LEGACY_TEMPLATES, "legacy_templates"),
+        (CONF_EXECUTOR_LIMITS, "executor_limits"),
     ):
         if key in config:
             setattr(hac, attr, config[key])
@@ -95,6 +95,7 @@ CONF_EVENT = "event"
 CONF_EVENT_DATA = "event_data"
 CONF_EVENT_DATA_TEMPLATE = "event_data_template"
 CONF_EXCLUDE = "exclude"
+CONF_EXECUTOR_LIMITS = "executor_limits"
 CONF_EXTERNAL_URL = "external_url"
 CONF_FILENAME = "filename"
 CONF_FILE_PATH = "file_path"
@@ -5,10 +5,13 @@ Home Assistant is a Home Automation framework for observing the state
 of entities and react to changes.
 """
 import asyncio
+from contextvars import ContextVar
 import datetime
 import enum
 import functools
+import heapq
 from ipaddress import ip_address
+import itertools
 import logging
 import os
 import pathlib
@@ -25,10 +28,12 @@ from typing import (
     Coroutine,
     Dict,
     Iterable,
+    Iterator,
     List,
     Mapping,
     Optional,
     Set,
+    Tuple,
     TypeVar,
     Union,
     cast,
@@ -73,6 +78,12 @@ from homeassistant.exceptions import (
 from homeassistant.util import location, network
 from homeassistant.util.async_ import fire_coroutine_threadsafe, run_callback_threadsafe
 import homeassistant.util.dt as dt_util
+from homeassistant.util.job_stats import (
+    ExecutorJob,
+    JobStats,
+    current_integration,
+    integration_from_target,
+)
 from homeassistant.util.timeout import TimeoutManager
 from homeassistant.util.unit_system import IMPERIAL_SYSTEM, METRIC_SYSTEM, UnitSystem
 import homeassistant.util.uuid as uuid_util
@@ -112,12 +123,22 @@ SOURCE_YAML = "yaml"
 # How long to wait until things that run on startup have to finish.
 TIMEOUT_EVENT_START = 15
 
+# Size of the caches keyed by entity_id
+MAX_EXPECTED_ENTITY_IDS = 16384
+
 _LOGGER = logging.getLogger(__name__)
 
+# The integration of the executor job running in the current thread. The
+# jobs it hands to the event loop run in a copy of this context.
+_executor_job_integration: ContextVar[Optional[str]] = ContextVar(
+    "executor_job_integration", default=None
+)
 
-def split_entity_id(entity_id: str) -> List[str]:
+
+@functools.lru_cache(MAX_EXPECTED_ENTITY_IDS)
+def split_entity_id(entity_id: str) -> Tuple[str, ...]:
     """Split a state entity ID into domain and object ID."""
-    return entity_id.split(".", 1)
+    return tuple(entity_id.split(".", 1))
 
 
 VALID_ENTITY_ID = re.compile(r"^(?!.+__)(?!_)[\da-z_]+(?<!_)\.(?!_)[\da-z_]+(?<!_)$")
@@ -193,6 +214,17 @@ def _get_callable_job_type(target: Callable) -> HassJobType:
     return HassJobType.Executor
 
 
+def _run_executor_job(integration: str, target: Callable[..., T], *args: Any) -> T:
+    """Run an executor job as a job of its integration."""
+    token = _executor_job_integration.set(integration)
+    integration_token = current_integration.set(integration)
+    try:
+        return target(*args)
+    finally:
+        current_integration.reset(integration_token)
+        _executor_job_integration.reset(token)
+
+
 class CoreState(enum.Enum):
     """Represent the current state of Home Assistant."""
 
@@ -234,6 +266,10 @@ class HomeAssistant:
         self._stopped: Optional[asyncio.Event] = None
         # Timeout handler for Core/Helper namespace
         self.timeout: TimeoutManager = TimeoutManager()
+        # Loop lag and job time instrumentation, if enabled
+        self.job_stats: Optional[JobStats] = None
+        # Semaphores enforcing config.executor_limits by integration
+        self._executor_semaphores: Dict[str, Tuple[int, asyncio.Semaphore]] = {}
 
     @property
     def is_running(self) -> bool:
@@ -362,15 +398,26 @@ class HomeAssistant:
         hassjob: HassJob to call.
         args: parameters for method to call.
         """
+        job_stats = self.job_stats
         if hassjob.job_type == HassJobType.Coroutinefunction:
-            task = self.loop.create_task(hassjob.target(*args))
+            if job_stats is None:
+                task = self.loop.create_task(hassjob.target(*args))
+            else:
+                task = self.loop.create_task(
+                    job_stats.wrap_coroutine(hassjob.target, hassjob.target(*args))
+                )
         elif hassjob.job_type == HassJobType.Callback:
-            self.loop.call_soon(hassjob.target, *args)
+            if job_stats is None:
+                self.loop.call_soon(hassjob.target, *args)
+            else:
+                self.loop.call_soon(job_stats.run_callback, hassjob.target, *args)
             return None
-        else:
+        elif job_stats is None and not self.config.executor_limits:
             task = self.loop.run_in_executor(  # type: ignore
                 None, hassjob.target, *args
             )
+        else:
+            task = self._async_add_accounted_executor_job(hassjob.target, *args)
 
         # If a task is scheduled
         if self._track_task:
@@ -398,7 +445,10 @@ class HomeAssistant:
         self, target: Callable[..., T], *args: Any
     ) -> Awaitable[T]:
         """Add an executor job from within the event loop."""
-        task = self.loop.run_in_executor(None, target, *args)
+        if self.job_stats is None and not self.config.executor_limits:
+            task = self.loop.run_in_executor(None, target, *args)
+        else:
+            task = self._async_add_accounted_executor_job(target, *args)
 
         # If a task is scheduled
         if self._track_task:
@@ -406,6 +456,72 @@ class HomeAssistant:
 
         return task
 
+    @callback
+    def _async_add_accounted_executor_job(
+        self, target: Callable[..., T], *args: Any
+    ) -> asyncio.Future:
+        """Add an executor job recorded in the job stats and limited by integration.
+
+        The job is charged to the integration running the current job if
+        known, else to the integration of the target. A job of an
+        integration with an executor limit waits for one of its other jobs
+        to finish once the limit is reached, so the integration cannot take
+        all the executor threads. Jobs submitted by a running job of the
+        same integration do not wait, the running job may be waiting for
+        them.
+        """
+        integration = current_integration.get() or integration_from_target(target)
+        if self.job_stats is not None:
+            target = self.job_stats.executor_job(integration, target)
+
+        limit = self.config.executor_limits.get(integration)
+        if limit is None or _executor_job_integration.get() == integration:
+            return self._async_run_in_executor(integration, target, *args)
+
+        limit_semaphore = self._executor_semaphores.get(integration)
+        if limit_semaphore is None or limit_semaphore[0] != limit:
+            limit_semaphore = self._executor_semaphores[integration] = (
+                limit,
+                asyncio.Semaphore(limit),
+            )
+        semaphore = limit_semaphore[1]
+        return self.loop.create_task(
+            self._async_run_limited_executor_job(semaphore, integration, target, *args)
+        )
+
+    async def _async_run_limited_executor_job(
+        self,
+        semaphore: asyncio.Semaphore,
+        integration: str,
+        target: Callable[..., T],
+        *args: Any,
+    ) -> T:
+        """Run an executor job once the semaphore of its integration allows."""
+        acquired = False
+        try:
+            await semaphore.acquire()
+            acquired = True
+        finally:
+            # Cancelled while waiting, the job will never run
+            if not acquired and isinstance(target, ExecutorJob):
+                target.discard()
+        try:
+            return await self._async_run_in_executor(integration, target, *args)
+        finally:
+            semaphore.release()
+
+    @callback
+    def _async_run_in_executor(
+        self, integration: str, target: Callable[..., T], *args: Any
+    ) -> asyncio.Future:
+        """Run a job in the executor, discarding it from the job stats if cancelled."""
+        future = self.loop.run_in_executor(
+            None, _run_executor_job, integration, target, *args
+        )
+        if isinstance(target, ExecutorJob):
+            future.add_done_callback(target.discard)
+        return future
+
     @callback
     def async_track_tasks(self) -> None:
         """Track tasks so you can wait for all tasks to be done."""
@@ -428,7 +544,10 @@ class HomeAssistant:
         args: parameters for method to call.
         """
         if hassjob.job_type == HassJobType.Callback:
-            hassjob.target(*args)
+            if self.job_stats is None:
+                hassjob.target(*args)
+            else:
+                self.job_stats.run_callback(hassjob.target, *args)
             return None
 
         return self.async_add_hass_job(hassjob, *args)
@@ -645,13 +764,19 @@ class Event:
         )
 
 
+_FilterableJobType = Tuple[HassJob, Optional[Callable], bool]
+
+
 class EventBus:
     """Allow the firing of and listening for events."""
 
     def __init__(self, hass: HomeAssistant) -> None:
         """Initialize a new event bus."""
-        self._listeners: Dict[str, List[HassJob]] = {}
+        self._listeners: Dict[str, List[_FilterableJobType]] = {}
         self._hass = hass
+        # Called when EVENT_TIME_CHANGED gets its first listener so the
+        # timer only ticks while someone listens to it
+        self._async_time_changed_listened: Optional[CALLBACK_TYPE] = None
 
     @callback
     def async_listeners(self) -> Dict[str, int]:
@@ -693,9 +818,14 @@ class EventBus:
         """
         listeners = self._listeners.get(event_type, [])
 
-        # EVENT_HOMEASSISTANT_CLOSE should go only to his listeners
+        # EVENT_HOMEASSISTANT_CLOSE and EVENT_TIME_CHANGED should go only
+        # to their listeners
         match_all_listeners = self._listeners.get(MATCH_ALL)
-        if match_all_listeners is not None and event_type != EVENT_HOMEASSISTANT_CLOSE:
+        if (
+            match_all_listeners is not None
+            and event_type != EVENT_HOMEASSISTANT_CLOSE
+            and event_type != EVENT_TIME_CHANGED
+        ):
             listeners = match_all_listeners + listeners
 
         event = Event(event_type, event_data, origin, time_fired, context)
@@ -706,8 +836,31 @@ class EventBus:
         if not listeners:
             return
 
-        for job in listeners:
-            self._hass.async_add_hass_job(job, event)
+        immediate_jobs = []
+        for job, event_filter, run_immediately in listeners:
+            if event_filter is not None:
+                try:
+                    if not event_filter(event):
+                        continue
+                except Exception:  # pylint: disable=broad-except
+                    _LOGGER.exception("Error in event filter")
+                    continue
+            if run_immediately:
+                immediate_jobs.append(job)
+            else:
+                self._hass.async_add_hass_job(job, event)
+
+        # The listeners that run immediately may fire events themselves, they
+        # run last so the other listeners are scheduled for this event first.
+        job_stats = self._hass.job_stats
+        for job in immediate_jobs:
+            try:
+                if job_stats is None:
+                    job.target(event)
+                else:
+                    job_stats.run_callback(job.target, event)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Error running job: %s", job)
 
     def listen(self, event_type: str, listener: Callable) -> CALLBACK_TYPE:
         """Listen for all events or events of a specific type.
@@ -726,23 +879,55 @@ class EventBus:
         return remove_listener
 
     @callback
-    def async_listen(self, event_type: str, listener: Callable) -> CALLBACK_TYPE:
+    def async_listen(
+        self,
+        event_type: str,
+        listener: Callable,
+        event_filter: Optional[Callable] = None,
+        run_immediately: bool = False,
+    ) -> CALLBACK_TYPE:
         """Listen for all events or events of a specific type.
 
         To listen to all events specify the constant ``MATCH_ALL``
         as event_type.
 
+        An optional event_filter, which must be a callable decorated with
+        @callback that returns a boolean value, determines if the
+        listener callable should run. It is called inline when the event
+        is fired so no job is scheduled for the events it rejects.
+
+        With run_immediately the listener, which must be a callback too,
+        runs while the event is fired instead of in a later iteration of
+        the event loop. An exception it raises is logged and does not stop
+        the other listeners.
+
         This method must be run in the event loop.
         """
-        return self._async_listen_job(event_type, HassJob(listener))
+        if event_filter is not None and not is_callback(event_filter):
+            raise HomeAssistantError(f"Event filter {event_filter} is not a callback")
+        if run_immediately and not is_callback(listener):
+            raise HomeAssistantError(f"Event listener {listener} is not a callback")
+        return self._async_listen_filterable_job(
+            event_type, (HassJob(listener), event_filter, run_immediately)
+        )
 
     @callback
-    def _async_listen_job(self, event_type: str, hassjob: HassJob) -> CALLBACK_TYPE:
-        self._listeners.setdefault(event_type, []).append(hassjob)
+    def _async_listen_filterable_job(
+        self, event_type: str, filterable_job: _FilterableJobType
+    ) -> CALLBACK_TYPE:
+        listeners = self._listeners.setdefault(event_type, [])
+        listeners.append(filterable_job)
+
+        if (
+            event_type == EVENT_TIME_CHANGED
+            and len(listeners) == 1
+            and self._async_time_changed_listened is not None
+        ):
+            self._async_time_changed_listened()
 
         def remove_listener() -> None:
             """Remove the listener."""
-            self._async_remove_listener(event_type, hassjob)
+            self._async_remove_listener(event_type, filterable_job)
 
         return remove_listener
 
@@ -775,12 +960,12 @@ class EventBus:
 
         This method must be run in the event loop.
         """
-        job: Optional[HassJob] = None
+        filterable_job: Optional[_FilterableJobType] = None
 
         @callback
         def _onetime_listener(event: Event) -> None:
             """Remove listener from event bus and then fire listener."""
-            nonlocal job
+            nonlocal filterable_job
             if hasattr(_onetime_listener, "run"):
                 return
             # Set variable so that we will never run twice.
@@ -789,22 +974,110 @@ class EventBus:
             # multiple times as well.
             # This will make sure the second time it does nothing.
             setattr(_onetime_listener, "run", True)
-            assert job is not None
-            self._async_remove_listener(event_type, job)
+            assert filterable_job is not None
+            self._async_remove_listener(event_type, filterable_job)
             self._hass.async_run_job(listener, event)
 
-        job = HassJob(_onetime_listener)
+        filterable_job = (HassJob(_onetime_listener), None, False)
+
+        return self._async_listen_filterable_job(event_type, filterable_job)
+
+    def listen_batch(
+        self,
+        event_type: str,
+        listener: Callable,
+        interval: Optional[float] = None,
+        event_filter: Optional[Callable] = None,
+    ) -> CALLBACK_TYPE:
+        """Listen for batches of events of a specific type.
+
+        To listen to all events specify the constant ``MATCH_ALL``
+        as event_type.
+
+        Returns function to unsubscribe the listener.
+        """
+        async_remove_listener = run_callback_threadsafe(
+            self._hass.loop,
+            self.async_listen_batch,
+            event_type,
+            listener,
+            interval,
+            event_filter,
+        ).result()
+
+        def remove_listener() -> None:
+            """Remove the listener."""
+            run_callback_threadsafe(self._hass.loop, async_remove_listener).result()
 
-        return self._async_listen_job(event_type, job)
+        return remove_listener
 
     @callback
-    def _async_remove_listener(self, event_type: str, hassjob: HassJob) -> None:
+    def async_listen_batch(
+        self,
+        event_type: str,
+        listener: Callable,
+        interval: Optional[float] = None,
+        event_filter: Optional[Callable] = None,
+    ) -> CALLBACK_TYPE:
+        """Listen for batches of events of a specific type.
+
+        The events are collected while they are fired and the listener is
+        called with a list of them once per iteration of the event loop,
+        or at most once every interval seconds when one is given.
+
+        Events still waiting are passed to the listener when it is removed.
+
+        This method must be run in the event loop.
+        """
+        job = HassJob(listener)
+        batch: List[Event] = []
+        flush_handle: Optional[asyncio.Handle] = None
+
+        @callback
+        def _flush() -> None:
+            """Pass the collected events to the listener."""
+            nonlocal flush_handle
+            flush_handle = None
+            events = batch.copy()
+            batch.clear()
+            self._hass.async_run_hass_job(job, events)
+
+        @callback
+        def _collect(event: Event) -> None:
+            """Collect an event for the next batch."""
+            nonlocal flush_handle
+            batch.append(event)
+            if flush_handle is not None:
+                return
+            if interval is None:
+                flush_handle = self._hass.loop.call_soon(_flush)
+            else:
+                flush_handle = self._hass.loop.call_later(interval, _flush)
+
+        remove_collector = self.async_listen(
+            event_type, _collect, event_filter, run_immediately=True
+        )
+
+        @callback
+        def remove_listener() -> None:
+            """Remove the listener and flush the waiting events."""
+            remove_collector()
+            if flush_handle is not None:
+                flush_handle.cancel()
+                _flush()
+
+        return remove_listener
+
+    @callback
+    def _async_remove_listener(
+        self, event_type: str, filterable_job: _FilterableJobType
+    ) -> None:
         """Remove a listener of a specific event_type.
 
         This method must be run in the event loop.
         """
         try:
-            self._listeners[event_type].remove(hassjob)
+            self._listeners[event_type].remove(filterable_job)
 
             # delete event_type list if empty
             if not self._listeners[event_type]:
@@ -812,7 +1085,9 @@ class EventBus:
         except (KeyError, ValueError):
             # KeyError is key event_type listener did not exist
             # ValueError if listener did not exist within event_type
-            _LOGGER.exception("Unable to remove unknown job listener %s", hassjob)
+            _LOGGER.exception(
+                "Unable to remove unknown job listener %s", filterable_job
+            )
 
 
 class State:
@@ -838,6 +1113,7 @@ class State:
         "domain",
         "object_id",
         "_as_dict",
+        "_cache",
     ]
 
     def __init__(
@@ -865,14 +1141,48 @@ class State:
                 "State max length is 255 characters."
             )
 
+        if not isinstance(attributes, MappingProxyType):
+            attributes = MappingProxyType(attributes or {})
+
         self.entity_id = entity_id.lower()
         self.state = state
-        self.attributes = MappingProxyType(attributes or {})
+        self.attributes = attributes
         self.last_updated = last_updated or dt_util.utcnow()
         self.last_changed = last_changed or self.last_updated
         self.context = context or Context()
         self.domain, self.object_id = split_entity_id(self.entity_id)
         self._as_dict: Optional[Dict[str, Collection[Any]]] = None
+        self._cache: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_trusted(
+        cls,
+        entity_id: str,
+        state: str,
+        attributes: MappingProxyType,
+        last_changed: datetime.datetime,
+        last_updated: datetime.datetime,
+        context: Context,
+    ) -> "State":
+        """Create a state from values that are known to be valid.
+
+        Async friendly.
+
+        Unlike the constructor this does not validate or lower case the
+        entity_id and does not check the state, which must be a str. The
+        attributes are used as is so they must be a read only mapping.
+        """
+        state_obj = cls.__new__(cls)
+        state_obj.entity_id = entity_id
+        state_obj.state = state
+        state_obj.attributes = attributes
+        state_obj.last_updated = last_updated
+        state_obj.last_changed = last_changed
+        state_obj.context = context
+        state_obj.domain, state_obj.object_id = split_entity_id(entity_id)
+        state_obj._as_dict = None
+        state_obj._cache = None
+        return state_obj
 
     @property
     def name(self) -> str:
@@ -905,6 +1215,22 @@ class State:
             }
         return self._as_dict
 
+    def cached(self, key: str, factory: Callable[[], T]) -> T:
+        """Return the value stored under key, creating it with factory once.
+
+        Async friendly.
+
+        A state never changes, so values derived from it, like its JSON
+        encoding, are computed once and shared by every consumer.
+        """
+        if self._cache is None:
+            self._cache = {}
+        try:
+            return cast(T, self._cache[key])
+        except KeyError:
+            value = self._cache[key] = factory()
+            return value
+
     @classmethod
     def from_dict(cls, json_dict: Dict) -> Any:
         """Initialize a state from a dict.
@@ -959,15 +1285,57 @@ class State:
         )
 
 
+class StatesSnapshot:
+    """Immutable sequence of all the states at one version of the state machine.
+
+    The same snapshot is returned until a state changes, so values derived
+    from it, like its JSON encoding, can be stored on it with cached().
+    """
+
+    __slots__ = ("version", "states", "_cache")
+
+    def __init__(self, version: int, states: Tuple[State, ...]) -> None:
+        """Initialize the snapshot."""
+        self.version = version
+        self.states = states
+        self._cache: Dict[str, Any] = {}
+
+    def __iter__(self) -> Iterator[State]:
+        """Iterate over the states."""
+        return iter(self.states)
+
+    def __len__(self) -> int:
+        """Return the number of states."""
+        return len(self.states)
+
+    def cached(self, key: str, factory: Callable[[], T]) -> T:
+        """Return the value stored under key, creating it with factory once."""
+        try:
+            return cast(T, self._cache[key])
+        except KeyError:
+            value = self._cache[key] = factory()
+            return value
+
+
 class StateMachine:
     """Helper class that tracks the state of different entities."""
 
     def __init__(self, bus: EventBus, loop: asyncio.events.AbstractEventLoop) -> None:
         """Initialize state machine."""
         self._states: Dict[str, State] = {}
+        # The states of each domain by entity_id, kept in sync with
+        # _states so domain filters only visit the matching states.
+        self._domain_index: Dict[str, Dict[str, State]] = {}
+        # When each entity was added, to merge the states of several
+        # domains back into the order of _states
+        self._added: Dict[str, int] = {}
+        self._add_count = itertools.count()
         self._reservations: Set[str] = set()
         self._bus = bus
         self._loop = loop
+        # Increased on every change, the snapshot is rebuilt when stale
+        self._version = 0
+        self._snapshot = StatesSnapshot(0, ())
 
     def entity_ids(self, domain_filter: Optional[str] = None) -> List[str]:
         """List of entity ids that are being tracked."""
@@ -987,13 +1355,12 @@ class StateMachine:
         if domain_filter is None:
             return list(self._states)
 
-        if isinstance(domain_filter, str):
-            domain_filter = (domain_filter.lower(),)
+        domains_states = self._async_domain_states(domain_filter)
+        if len(domains_states) > 1:
+            return list(heapq.merge(*domains_states, key=self._added.__getitem__))
 
         return [
-            state.entity_id
-            for state in self._states.values()
-            if state.domain in domain_filter
+            entity_id for domain_states in domains_states for entity_id in domain_states
         ]
 
     @callback
@@ -1007,11 +1374,9 @@ class StateMachine:
         if domain_filter is None:
             return len(self._states)
 
-        if isinstance(domain_filter, str):
-            domain_filter = (domain_filter.lower(),)
-
-        return len(
-            [None for state in self._states.values() if state.domain in domain_filter]
+        return sum(
+            len(domain_states)
+            for domain_states in self._async_domain_states(domain_filter)
         )
 
     def all(self, domain_filter: Optional[Union[str, Iterable]] = None) -> List[State]:
@@ -1031,11 +1396,59 @@ class StateMachine:
         if domain_filter is None:
             return list(self._states.values())
 
+        domains_states = self._async_domain_states(domain_filter)
+        if len(domains_states) > 1:
+            added = self._added
+            return list(
+                heapq.merge(
+                    *(domain_states.values() for domain_states in domains_states),
+                    key=lambda state: added[state.entity_id],
+                )
+            )
+
+        return [
+            state
+            for domain_states in domains_states
+            for state in domain_states.values()
+        ]
+
+    @property
+    def version(self) -> int:
+        """Return a number increased every time the states change."""
+        return self._version
+
+    @callback
+    def async_snapshot(self) -> StatesSnapshot:
+        """Return an immutable snapshot of all states.
+
+        The snapshot is shared until a state changes, use it instead of
+        async_all when the states are only read.
+
+        This method must be run in the event loop.
+        """
+        if self._snapshot.version != self._version:
+            self._snapshot = StatesSnapshot(self._version, tuple(self._states.values()))
+        return self._snapshot
+
+    @callback
+    def _async_domain_states(
+        self, domain_filter: Union[str, Iterable]
+    ) -> List[Dict[str, State]]:
+        """Return the states by entity_id of each domain in the filter.
+
+        The states of a domain are in the order they were added, like
+        _states, callers merge the states of several domains with _added.
+
+        This method must be run in the event loop.
+        """
         if isinstance(domain_filter, str):
             domain_filter = (domain_filter.lower(),)
 
+        domain_index = self._domain_index
         return [
-            state for state in self._states.values() if state.domain in domain_filter
+            domain_index[domain]
+            for domain in dict.fromkeys(domain_filter)
+            if domain in domain_index
         ]
 
     def get(self, entity_id: str) -> Optional[State]:
@@ -1079,6 +1492,13 @@ class StateMachine:
         if old_state is None:
             return False
 
+        del self._added[entity_id]
+        domain_states = self._domain_index[old_state.domain]
+        del domain_states[entity_id]
+        if not domain_states:
+            del self._domain_index[old_state.domain]
+        self._version += 1
+
         self._bus.async_fire(
             EVENT_STATE_CHANGED,
             {"entity_id": entity_id, "old_state": old_state, "new_state": None},
@@ -1163,7 +1583,7 @@ class StateMachine:
             last_changed = None
         else:
             same_state = old_state.state == new_state and not force_update
-            same_attr = old_state.attributes == MappingProxyType(attributes)
+            same_attr = old_state.attributes == attributes
             last_changed = old_state.last_changed if same_state else None
 
         if same_state and same_attr:
@@ -1174,16 +1594,31 @@ class StateMachine:
 
         now = dt_util.utcnow()
 
-        state = State(
-            entity_id,
-            new_state,
-            attributes,
-            last_changed,
-            now,
-            context,
-            old_state is None,
-        )
+        if old_state is None:
+            state = State(entity_id, new_state, attributes, None, now, context)
+        else:
+            # The entity_id was validated when the entity was added
+            if not valid_state(new_state):
+                raise InvalidStateError(
+                    f"Invalid state encountered for entity ID: {entity_id}. "
+                    "State max length is 255 characters."
+                )
+            state = State.from_trusted(
+                entity_id,
+                new_state,
+                old_state.attributes if same_attr else MappingProxyType(attributes),
+                last_changed or now,
+                now,
+                context,
+            )
         self._states[entity_id] = state
+        if old_state is None:
+            self._added[entity_id] = next(self._add_count)
+        domain_states = self._domain_index.get(state.domain)
+        if domain_states is None:
+            domain_states = self._domain_index[state.domain] = {}
+        domain_states[entity_id] = state
+        self._version += 1
         self._bus.async_fire(
             EVENT_STATE_CHANGED,
             {"entity_id": entity_id, "old_state": old_state, "new_state": state},
@@ -1474,10 +1909,19 @@ class ServiceRegistry:
         self, handler: Service, service_call: ServiceCall
     ) -> None:
         """Execute a service."""
+        job_stats = self._hass.job_stats
         if handler.job.job_type == HassJobType.Coroutinefunction:
-            await handler.job.target(service_call)
+            if job_stats is None:
+                await handler.job.target(service_call)
+            else:
+                await job_stats.wrap_coroutine(
+                    handler.job.target, handler.job.target(service_call)
+                )
         elif handler.job.job_type == HassJobType.Callback:
-            handler.job.target(service_call)
+            if job_stats is None:
+                handler.job.target(service_call)
+            else:
+                job_stats.run_callback(handler.job.target, service_call)
         else:
             await self._hass.async_add_executor_job(handler.job.target, service_call)
 
@@ -1529,6 +1973,9 @@ class Config:
         # Use legacy template behavior
         self.legacy_templates: bool = False
 
+        # Maximum number of executor jobs running at once per integration
+        self.executor_limits: Dict[str, int] = {}
+
     def distance(self, lat: float, lon: float) -> Optional[float]:
         """Calculate distance from Home Assistant.
 
@@ -1739,8 +2186,14 @@ class Config:
 
 
 def _async_create_timer(hass: HomeAssistant) -> None:
-    """Create a timer that will start on HOMEASSISTANT_START."""
+    """Create a timer that will start on HOMEASSISTANT_START.
+
+    The timer only ticks while EVENT_TIME_CHANGED has listeners. Time based
+    helpers schedule their own deadlines on the event loop instead, so an
+    idle instance sleeps until the next deadline.
+    """
     handle = None
+    stopped = False
     timer_context = Context()
 
     def schedule_tick(now: datetime.datetime) -> None:
@@ -1754,6 +2207,16 @@ def _async_create_timer(hass: HomeAssistant) -> None:
     @callback
     def fire_time_event(target: float) -> None:
         """Fire next time event."""
+        nonlocal handle
+
+        # The bus drops the event type once its last listener is removed,
+        # no need to count the listeners of all event types on every tick
+        listeners = hass.bus._listeners  # pylint: disable=protected-access
+        if EVENT_TIME_CHANGED not in listeners:
+            # Sleep until EVENT_TIME_CHANGED gets a listener again
+            handle = None
+            return
+
         now = dt_util.utcnow()
 
         hass.bus.async_fire(
@@ -1772,12 +2235,24 @@ def _async_create_timer(hass: HomeAssistant) -> None:
 
         schedule_tick(now)
 
+    @callback
+    def wake_timer() -> None:
+        """Start ticking again once EVENT_TIME_CHANGED has a listener."""
+        if handle is None and not stopped:
+            schedule_tick(dt_util.utcnow())
+
     @callback
     def stop_timer(_: Event) -> None:
         """Stop the timer."""
+        nonlocal stopped
+
+        stopped = True
         if handle is not None:
             handle.cancel()
 
+    hass.bus._async_time_changed_listened = (  # pylint: disable=protected-access
+        wake_timer
+    )
     hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, stop_timer)
 
     _LOGGER.info("Timer:starting")
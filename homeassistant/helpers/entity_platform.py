@@ -19,6 +19,7 @@ from homeassistant.exceptions import HomeAssistantError, PlatformNotReady
 from homeassistant.helpers import config_validation as cv, service
 from homeassistant.helpers.typing import HomeAssistantType
 from homeassistant.util.async_ import run_callback_threadsafe
+from homeassistant.util.job_stats import current_integration
 
 from .entity_registry import DISABLED_INTEGRATION
 from .event import async_call_later, async_track_time_interval
@@ -610,14 +611,20 @@ class EntityPlatform:
             return
 
         async with self._process_updates:
-            tasks = []
-            for entity in self.entities.values():
-                if not entity.should_poll:
-                    continue
-                tasks.append(entity.async_update_ha_state(True))
-
-            if tasks:
-                await asyncio.gather(*tasks)
+            # Charge the executor jobs of the updates to the integration,
+            # even when their target is a library function
+            token = current_integration.set(self.platform_name)
+            try:
+                tasks = []
+                for entity in self.entities.values():
+                    if not entity.should_poll:
+                        continue
+                    tasks.append(entity.async_update_ha_state(True))
+
+                if tasks:
+                    await asyncio.gather(*tasks)
+            finally:
+                current_integration.reset(token)
 
 
 current_platform: ContextVar[Optional[EntityPlatform]] = ContextVar(
@@ -5,6 +5,7 @@ from dataclasses import dataclass
 from datetime import datetime, timedelta
 import functools as ft
 import logging
+import queue
 import time
 from typing import (
     Any,
@@ -23,10 +24,8 @@ import attr
 
 from homeassistant.const import (
     ATTR_ENTITY_ID,
-    ATTR_NOW,
     EVENT_CORE_CONFIG_UPDATE,
     EVENT_STATE_CHANGED,
-    EVENT_TIME_CHANGED,
     MATCH_ALL,
     SUN_EVENT_SUNRISE,
     SUN_EVENT_SUNSET,
@@ -62,6 +61,12 @@ TRACK_STATE_REMOVED_DOMAIN_LISTENER = "track_state_removed_domain_listener"
 TRACK_ENTITY_REGISTRY_UPDATED_CALLBACKS = "track_entity_registry_updated_callbacks"
 TRACK_ENTITY_REGISTRY_UPDATED_LISTENER = "track_entity_registry_updated_listener"
 
+_SENTINEL = object()
+
+_TEMPLATE_RENDER_HUB = "template_render_hub"
+SLOW_TEMPLATE_RENDER_TIME = 0.05
+MAX_TEMPLATE_RENDER_STATS = 500
+
 _ALL_LISTENER = "all"
 _DOMAINS_LISTENER = "domains"
 _ENTITIES_LISTENER = "entities"
@@ -244,6 +249,11 @@ def async_track_state_change_event(
 
     if TRACK_STATE_CHANGE_LISTENER not in hass.data:
 
+        @callback
+        def _async_state_change_filter(event: Event) -> bool:
+            """Filter state changes by entity_id."""
+            return event.data.get("entity_id") in entity_callbacks
+
         @callback
         def _async_state_change_dispatcher(event: Event) -> None:
             """Dispatch state changes by entity_id."""
@@ -261,7 +271,10 @@ def async_track_state_change_event(
                     )
 
         hass.data[TRACK_STATE_CHANGE_LISTENER] = hass.bus.async_listen(
-            EVENT_STATE_CHANGED, _async_state_change_dispatcher
+            EVENT_STATE_CHANGED,
+            _async_state_change_dispatcher,
+            _async_state_change_filter,
+            run_immediately=True,
         )
 
     job = HassJob(action)
@@ -328,6 +341,12 @@ def async_track_entity_registry_updated_event(
 
     if TRACK_ENTITY_REGISTRY_UPDATED_LISTENER not in hass.data:
 
+        @callback
+        def _async_entity_registry_updated_filter(event: Event) -> bool:
+            """Filter entity registry updates by entity_id."""
+            entity_id = event.data.get("old_entity_id", event.data["entity_id"])
+            return entity_id in entity_callbacks
+
         @callback
         def _async_entity_registry_updated_dispatcher(event: Event) -> None:
             """Dispatch entity registry updates by entity_id."""
@@ -346,7 +365,10 @@ def async_track_entity_registry_updated_event(
                     )
 
         hass.data[TRACK_ENTITY_REGISTRY_UPDATED_LISTENER] = hass.bus.async_listen(
-            EVENT_ENTITY_REGISTRY_UPDATED, _async_entity_registry_updated_dispatcher
+            EVENT_ENTITY_REGISTRY_UPDATED,
+            _async_entity_registry_updated_dispatcher,
+            _async_entity_registry_updated_filter,
+            run_immediately=True,
         )
 
     job = HassJob(action)
@@ -368,13 +390,19 @@ def async_track_entity_registry_updated_event(
     return remove_listener
 
 
+@callback
+def _async_domain_has_listeners(domain: str, callbacks: Dict[str, List]) -> bool:
+    """Check if the domain has any listeners."""
+    return domain in callbacks or MATCH_ALL in callbacks
+
+
 @callback
 def _async_dispatch_domain_event(
     hass: HomeAssistant, event: Event, callbacks: Dict[str, List]
 ) -> None:
     domain = split_entity_id(event.data["entity_id"])[0]
 
-    if domain not in callbacks and MATCH_ALL not in callbacks:
+    if not _async_domain_has_listeners(domain, callbacks):
         return
 
     listeners = callbacks.get(domain, []) + callbacks.get(MATCH_ALL, [])
@@ -403,6 +431,14 @@ def async_track_state_added_domain(
 
     if TRACK_STATE_ADDED_DOMAIN_LISTENER not in hass.data:
 
+        @callback
+        def _async_state_change_filter(event: Event) -> bool:
+            """Filter state changes by entity_id to avoid scheduling jobs."""
+            # Only entities that are added
+            return event.data.get("old_state") is None and _async_domain_has_listeners(
+                split_entity_id(event.data["entity_id"])[0], domain_callbacks
+            )
+
         @callback
         def _async_state_change_dispatcher(event: Event) -> None:
             """Dispatch state changes by entity_id."""
@@ -412,7 +448,10 @@ def async_track_state_added_domain(
             _async_dispatch_domain_event(hass, event, domain_callbacks)
 
         hass.data[TRACK_STATE_ADDED_DOMAIN_LISTENER] = hass.bus.async_listen(
-            EVENT_STATE_CHANGED, _async_state_change_dispatcher
+            EVENT_STATE_CHANGED,
+            _async_state_change_dispatcher,
+            _async_state_change_filter,
+            run_immediately=True,
         )
 
     job = HassJob(action)
@@ -449,6 +488,14 @@ def async_track_state_removed_domain(
 
     if TRACK_STATE_REMOVED_DOMAIN_LISTENER not in hass.data:
 
+        @callback
+        def _async_state_change_filter(event: Event) -> bool:
+            """Filter state changes by entity_id to avoid scheduling jobs."""
+            # Only entities that are removed
+            return event.data.get("new_state") is None and _async_domain_has_listeners(
+                split_entity_id(event.data["entity_id"])[0], domain_callbacks
+            )
+
         @callback
         def _async_state_change_dispatcher(event: Event) -> None:
             """Dispatch state changes by entity_id."""
@@ -458,7 +505,10 @@ def async_track_state_removed_domain(
             _async_dispatch_domain_event(hass, event, domain_callbacks)
 
         hass.data[TRACK_STATE_REMOVED_DOMAIN_LISTENER] = hass.bus.async_listen(
-            EVENT_STATE_CHANGED, _async_state_change_dispatcher
+            EVENT_STATE_CHANGED,
+            _async_state_change_dispatcher,
+            _async_state_change_filter,
+            run_immediately=True,
         )
 
     job = HassJob(action)
@@ -751,6 +801,9 @@ class _TrackTemplateResultInfo:
 
         self._rate_limit = KeyedRateLimit(hass)
         self._info: Dict[Template, RenderInfo] = {}
+        # Templates being rendered in the executor, with whether to
+        # render again when done and the event which caused the render
+        self._executor_renders: Dict[Template, Tuple[bool, Optional[Event]]] = {}
         self._track_state_changes: Optional[_TrackStateChangeFiltered] = None
         self._time_listeners: Dict[Template, Callable] = {}
 
@@ -759,7 +812,9 @@ class _TrackTemplateResultInfo:
         for track_template_ in self._track_templates:
             template = track_template_.template
             variables = track_template_.variables
-            self._info[template] = info = template.async_render_to_info(variables)
+            self._info[template] = info = _async_get_render_hub(
+                self.hass
+            ).async_render_to_info(template, variables)
 
             if info.exception:
                 if raise_on_template_error:
@@ -825,6 +880,7 @@ class _TrackTemplateResultInfo:
         assert self._track_state_changes
         self._track_state_changes.async_remove()
         self._rate_limit.async_remove()
+        self._executor_renders.clear()
         for template in list(self._time_listeners):
             self._time_listeners.pop(template)()
 
@@ -877,10 +933,20 @@ class _TrackTemplateResultInfo:
             )
 
         self._rate_limit.async_triggered(template, now)
-        self._info[template] = info = template.async_render_to_info(
-            track_template_.variables
+        hub = _async_get_render_hub(self.hass)
+        if hub.async_is_slow(template):
+            self._async_render_in_executor(track_template_, event)
+            return False
+
+        self._info[template] = info = hub.async_render_to_info(
+            template, track_template_.variables
         )
+        return self._render_result(template, info)
 
+    def _render_result(
+        self, template: Template, info: RenderInfo
+    ) -> Union[bool, TrackTemplateResult]:
+        """Return True or the TrackTemplateResult if the result changed."""
         try:
             result: Union[str, TemplateError] = info.result()
         except TemplateError as ex:
@@ -916,24 +982,73 @@ class _TrackTemplateResultInfo:
         replayed is True if the event is being replayed because the
         rate limit was hit.
         """
-        updates = []
-        info_changed = False
         now = event.time_fired if not replayed and event else dt_util.utcnow()
+        rendered = []
 
         for track_template_ in track_templates or self._track_templates:
             update = self._render_template_if_ready(track_template_, now, event)
-            if not update:
-                continue
+            if update:
+                rendered.append((track_template_.template, update))
 
-            template = track_template_.template
-            self._setup_time_listener(template, self._info[template].has_time)
+        self._async_apply_renders(event, rendered)
 
-            info_changed = True
+    @callback
+    def _async_render_in_executor(
+        self, track_template_: TrackTemplate, event: Optional[Event]
+    ) -> None:
+        """Render a slow template without holding the event loop."""
+        template = track_template_.template
+        if template in self._executor_renders:
+            # Render again once the running render is done
+            self._executor_renders[template] = (True, event)
+            return
+        self._executor_renders[template] = (False, event)
+        self.hass.async_create_task(
+            self._async_render_template_in_executor(track_template_)
+        )
 
+    async def _async_render_template_in_executor(
+        self, track_template_: TrackTemplate
+    ) -> None:
+        """Render a template in the executor and apply the result."""
+        template = track_template_.template
+        hub = _async_get_render_hub(self.hass)
+        while template in self._executor_renders:
+            event = self._executor_renders[template][1]
+            try:
+                info = await hub.async_render_to_info_in_executor(
+                    template, track_template_.variables
+                )
+            except Exception as err:  # pylint: disable=broad-except
+                # Report the error like a render in the event loop does
+                info = RenderInfo(template)
+                info.exception = TemplateError(err)
+                info._freeze()  # pylint: disable=protected-access
+            if template not in self._executor_renders:
+                # The tracker was removed
+                return
+            self._info[template] = info
+            self._async_apply_renders(
+                event, [(template, self._render_result(template, info))]
+            )
+            render_again, event = self._executor_renders.pop(template)
+            if render_again:
+                self._executor_renders[template] = (False, event)
+
+    @callback
+    def _async_apply_renders(
+        self,
+        event: Optional[Event],
+        rendered: List[Tuple[Template, Union[bool, TrackTemplateResult]]],
+    ) -> None:
+        """Update the listeners and call the action for rendered templates."""
+        updates = []
+        for template, update in rendered:
+            self._setup_time_listener(template, self._info[template].has_time)
             if isinstance(update, TrackTemplateResult):
                 updates.append(update)
 
-        if info_changed:
+        if rendered:
             assert self._track_state_changes
             self._track_state_changes.async_update_listeners(
                 _render_infos_to_track_states(
@@ -1095,6 +1210,32 @@ def async_track_same_state(
 track_same_state = threaded_listener_factory(async_track_same_state)
 
 
+@callback
+@bind_hass
+def async_queue_event_batches(
+    hass: HomeAssistant,
+    event_type: str,
+    batch_queue: queue.Queue,
+    interval: Optional[float] = None,
+    event_filter: Optional[Callable[[Event], bool]] = None,
+) -> CALLBACK_TYPE:
+    """Put batches of events into a queue read by a worker thread.
+
+    Each batch is a single list so the worker handles a burst of events
+    with one queue operation.
+    """
+
+    @callback
+    def put_batch(events: List[Event]) -> None:
+        """Queue the batch for the worker thread."""
+        batch_queue.put(events)
+
+    return hass.bus.async_listen_batch(event_type, put_batch, interval, event_filter)
+
+
+queue_event_batches = threaded_listener_factory(async_queue_event_batches)
+
+
 @callback
 @bind_hass
 def async_track_point_in_time(
@@ -1329,17 +1470,6 @@ def async_track_utc_time_change(
     """Add a listener that will fire if time matches a pattern."""
 
     job = HassJob(action)
-    # We do not have to wrap the function with time pattern matching logic
-    # if no pattern given
-    if all(val is None for val in (hour, minute, second)):
-
-        @callback
-        def time_change_listener(event: Event) -> None:
-            """Fire every time event that comes in."""
-            hass.async_run_hass_job(job, event.data[ATTR_NOW])
-
-        return hass.bus.async_listen(EVENT_TIME_CHANGED, time_change_listener)
-
     matching_seconds = dt_util.parse_time_expression(second, 0, 59)
     matching_minutes = dt_util.parse_time_expression(minute, 0, 59)
     matching_hours = dt_util.parse_time_expression(hour, 0, 23)
@@ -1367,8 +1497,14 @@ def async_track_utc_time_change(
             calculate_next(now + timedelta(seconds=1)),
         )
 
+    # Without a pattern the listener runs every second, starting with the
+    # next one like the time changed events it used to listen to.
+    first = dt_util.utcnow()
+    if all(val is None for val in (hour, minute, second)):
+        first += timedelta(seconds=1)
+
     time_listener = async_track_point_in_utc_time(
-        hass, pattern_time_change_listener, calculate_next(dt_util.utcnow())
+        hass, pattern_time_change_listener, calculate_next(first)
     )
 
     @callback
@@ -1457,13 +1593,163 @@ def _render_infos_to_track_states(render_infos: Iterable[RenderInfo]) -> TrackSt
     return TrackStates(False, *_entities_domains_from_render_infos(render_infos))
 
 
+class _TemplateRenderHub:
+    """Share and time the renders of tracked templates.
+
+    Template entities, automations and websocket subscriptions often
+    track the same template. The first tracker to render a template
+    source with the same variables renders it, the others get the same
+    RenderInfo until the states change. Templates reading the time are
+    never shared.
+
+    The render time of each template source is recorded. A template
+    whose last render took SLOW_TEMPLATE_RENDER_TIME or longer is slow,
+    trackers render it in the executor until a render is fast again.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Initialize the hub."""
+        self.hass = hass
+        self._version: Optional[int] = None
+        self._renders: Dict[Any, RenderInfo] = {}
+        # Per template source: renders, renders in the executor, total,
+        # max and last render time.
+        self._stats: Dict[str, List[Any]] = {}
+
+    @callback
+    def async_is_slow(self, template: Template) -> bool:
+        """Return if the last render of a template was slow."""
+        stats = self._stats.get(template.template)
+        return stats is not None and stats[4] >= SLOW_TEMPLATE_RENDER_TIME
+
+    @callback
+    def async_render_to_info(
+        self, template: Template, variables: TemplateVarsType
+    ) -> RenderInfo:
+        """Render a template or return the render of an identical one."""
+        key = _render_key(template, variables)
+        info = self._async_get_shared(key)
+        if info is None:
+            info = template.async_render_to_info(variables)
+            self._async_record(template, info, False)
+            self._async_share(key, info, self.hass.states.version)
+        return info
+
+    async def async_render_to_info_in_executor(
+        self, template: Template, variables: TemplateVarsType
+    ) -> RenderInfo:
+        """Render a template in the executor or return an identical render."""
+        key = _render_key(template, variables)
+        info = self._async_get_shared(key)
+        if info is None:
+            version = self.hass.states.version
+            info = await template.async_render_to_info_in_executor(variables)
+            self._async_record(template, info, True)
+            self._async_share(key, info, version)
+        return info
+
+    @callback
+    def _async_get_shared(self, key: Any) -> Optional[RenderInfo]:
+        """Return the render shared under key for the current states."""
+        if key is None:
+            return None
+        version = self.hass.states.version
+        if version != self._version:
+            self._version = version
+            self._renders.clear()
+        return self._renders.get(key)
+
+    @callback
+    def _async_share(self, key: Any, info: RenderInfo, version: int) -> None:
+        """Share a render of the states at version with identical templates."""
+        if key is None or info.has_time or version != self.hass.states.version:
+            return
+        if version != self._version:
+            self._version = version
+            self._renders.clear()
+        self._renders[key] = info
+
+    @callback
+    def _async_record(
+        self, template: Template, info: RenderInfo, in_executor: bool
+    ) -> None:
+        """Record the time of a render."""
+        stats = self._stats.get(template.template)
+        if stats is None:
+            if len(self._stats) >= MAX_TEMPLATE_RENDER_STATS:
+                del self._stats[next(iter(self._stats))]
+            stats = self._stats[template.template] = [0, 0, 0.0, 0.0, 0.0]
+        elapsed = info.render_time
+        stats[0] += 1
+        if in_executor:
+            stats[1] += 1
+        stats[2] += elapsed
+        if elapsed > stats[3]:
+            stats[3] = elapsed
+        stats[4] = elapsed
+
+    @callback
+    def async_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return the render stats of the templates, slowest first."""
+        return {
+            source: {
+                "renders": renders,
+                "executor_renders": executor_renders,
+                "time": total,
+                "max_time": max_time,
+                "last_time": last_time,
+                "slow": last_time >= SLOW_TEMPLATE_RENDER_TIME,
+            }
+            for source, (
+                renders,
+                executor_renders,
+                total,
+                max_time,
+                last_time,
+            ) in sorted(self._stats.items(), key=lambda item: item[1][2], reverse=True)
+        }
+
+
+def _render_key(template: Template, variables: TemplateVarsType) -> Any:
+    """Return the key identical renders share, None if they can't be shared."""
+    if template.is_static:
+        return None
+    if not variables:
+        return (template.template, None)
+    try:
+        # Equal values of other types, like 1 and True, render differently
+        return (
+            template.template,
+            frozenset((key, type(value), value) for key, value in variables.items()),
+        )
+    except TypeError:
+        # Variables which can't be hashed, like the trigger of an automation
+        return None
+
+
+@callback
+def _async_get_render_hub(hass: HomeAssistant) -> _TemplateRenderHub:
+    """Return the render hub of tracked templates."""
+    hub: Optional[_TemplateRenderHub] = hass.data.get(_TEMPLATE_RENDER_HUB)
+    if hub is None:
+        hub = hass.data[_TEMPLATE_RENDER_HUB] = _TemplateRenderHub(hass)
+    return hub
+
+
+@callback
+@bind_hass
+def async_get_template_render_stats(hass: HomeAssistant) -> Dict[str, Dict[str, Any]]:
+    """Return the render stats of the tracked templates, slowest first."""
+    return _async_get_render_hub(hass).async_stats()
+
+
 @callback
 def _event_triggers_rerender(event: Event, info: RenderInfo) -> bool:
     """Determine if a template should be re-rendered from an event."""
     entity_id = event.data.get(ATTR_ENTITY_ID)
 
     if info.filter(entity_id):
-        return True
+        return _event_changes_fields_read(event, info, entity_id)
 
     if (
         event.data.get("new_state") is not None
@@ -1474,6 +1760,38 @@ def _event_triggers_rerender(event: Event, info: RenderInfo) -> bool:
     return bool(info.filter_lifecycle(entity_id))
 
 
+@callback
+def _event_changes_fields_read(event: Event, info: RenderInfo, entity_id: str) -> bool:
+    """Determine if a state change touches a field the template read.
+
+    Only entities read directly narrow the fields, the states reached
+    by iterating all states or a domain may be read in any way.
+    """
+    fields = info.entity_fields.get(entity_id)
+    if (
+        fields is None
+        or info.all_states
+        or split_entity_id(entity_id)[0] in info.domains
+    ):
+        return True
+
+    old_state = event.data.get("old_state")
+    new_state = event.data.get("new_state")
+    if old_state is None or new_state is None:
+        return True
+
+    for field in fields:
+        if field is None:
+            if old_state.state != new_state.state:
+                return True
+        elif old_state.attributes.get(field, _SENTINEL) != new_state.attributes.get(
+            field, _SENTINEL
+        ):
+            return True
+
+    return False
+
+
 @callback
 def _rate_limit_for_event(
     event: Event, info: RenderInfo, track_template_: TrackTemplate
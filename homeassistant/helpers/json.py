@@ -1,7 +1,9 @@
 """Helpers to help with encoding Home Assistant objects in JSON."""
 from datetime import datetime
 import json
-from typing import Any
+from typing import Any, Iterable
+
+from homeassistant.core import State, StatesSnapshot
 
 
 class JSONEncoder(json.JSONEncoder):
@@ -20,3 +22,52 @@ class JSONEncoder(json.JSONEncoder):
             return o.as_dict()
 
         return json.JSONEncoder.default(self, o)
+
+
+def _dumps(obj: Any) -> str:
+    """Encode an object the way the APIs do."""
+    return json.dumps(obj, cls=JSONEncoder, allow_nan=False)
+
+
+def state_attributes_json(state: State) -> str:
+    """Return the JSON object of the attributes of a state.
+
+    The encoding is done once per state and shared by every consumer.
+    Raises ValueError or TypeError when the attributes can't be encoded.
+    """
+    return state.cached("attributes_json", lambda: _dumps(dict(state.attributes)))
+
+
+def state_json(state: State) -> str:
+    """Return the JSON object of a state, the encoding of State.as_dict().
+
+    The attributes are taken from state_attributes_json, so they are only
+    encoded once.
+    """
+
+    def encode() -> str:
+        as_dict = state.as_dict()
+        return (
+            f'{{"entity_id": {_dumps(as_dict["entity_id"])}, '
+            f'"state": {_dumps(as_dict["state"])}, '
+            f'"attributes": {state_attributes_json(state)}, '
+            f'"last_changed": {_dumps(as_dict["last_changed"])}, '
+            f'"last_updated": {_dumps(as_dict["last_updated"])}, '
+            f'"context": {_dumps(as_dict["context"])}}}'
+        )
+
+    return state.cached("json", encode)
+
+
+def states_json(states: Iterable[State]) -> str:
+    """Return the JSON list of states, joining the encoding of each state."""
+    return "[" + ", ".join(state_json(state) for state in states) + "]"
+
+
+def states_snapshot_json(snapshot: StatesSnapshot) -> str:
+    """Return the JSON list of the states in a snapshot.
+
+    The encoding is done once and shared until the states change. States
+    which did not change since the previous snapshot reuse their encoding.
+    """
+    return snapshot.cached("json", lambda: states_json(snapshot))
@@ -626,6 +626,8 @@ class _ScriptRun:
         def log_cb(level, msg):
             self._log(msg, level=level)
 
+        # The triggers may fire while they are being initialized
+        done = asyncio.Event()
         to_context = None
         remove_triggers = await async_initialize_triggers(
             self._hass,
@@ -640,7 +642,6 @@ class _ScriptRun:
             return
 
         self._changed()
-        done = asyncio.Event()
         tasks = [
             self._hass.async_create_task(flag.wait()) for flag in (self._stop, done)
         ]
@@ -3,15 +3,35 @@ from ast import literal_eval
 import asyncio
 import base64
 import collections.abc
+from contextvars import ContextVar
 from datetime import datetime, timedelta
 from functools import partial, wraps
+import hashlib
+import importlib.util
 import json
 import logging
+import marshal
 import math
 from operator import attrgetter
+import os
 import random
 import re
-from typing import Any, Dict, Generator, Iterable, Optional, Type, Union, cast
+import tempfile
+from time import thread_time
+from types import CodeType
+from typing import (
+    Any,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Type,
+    Union,
+    cast,
+)
 from urllib.parse import urlencode as urllib_urlencode
 import weakref
 
@@ -23,13 +43,24 @@ import voluptuous as vol
 
 from homeassistant.const import (
     ATTR_ENTITY_ID,
+    ATTR_FRIENDLY_NAME,
     ATTR_LATITUDE,
     ATTR_LONGITUDE,
     ATTR_UNIT_OF_MEASUREMENT,
+    EVENT_HOMEASSISTANT_FINAL_WRITE,
+    EVENT_HOMEASSISTANT_STARTED,
     LENGTH_METERS,
     STATE_UNKNOWN,
+    __version__,
+)
+from homeassistant.core import (
+    Event,
+    State,
+    StatesSnapshot,
+    callback,
+    split_entity_id,
+    valid_entity_id,
 )
-from homeassistant.core import State, callback, split_entity_id, valid_entity_id
 from homeassistant.exceptions import TemplateError
 from homeassistant.helpers import location as loc_helper
 from homeassistant.helpers.typing import HomeAssistantType, TemplateVarsType
@@ -44,9 +75,19 @@ _LOGGER = logging.getLogger(__name__)
 _SENTINEL = object()
 DATE_STR_FORMAT = "%Y-%m-%d %H:%M:%S"
 
-_RENDER_INFO = "template.render_info"
+# The render info collecting what the template being rendered reads
+_RENDER_INFO: ContextVar[Optional["RenderInfo"]] = ContextVar(
+    "template_render_info", default=None
+)
+# The states read by templates rendered outside of the event loop
+_STATES: ContextVar[Optional["FrozenStates"]] = ContextVar(
+    "template_states", default=None
+)
 _ENVIRONMENT = "template.environment"
 
+BYTECODE_CACHE_FILE = "template_bytecode"
+BYTECODE_CACHE_VERSION = 1
+
 _RE_JINJA_DELIMITERS = re.compile(r"\{%|\{\{|\{#")
 # Match "simple" ints and floats. -1.0, 1, +5, 5.0
 _IS_NUMERIC = re.compile(r"^[+-]?(?!0\d)\d*(?:\.\d*)?$")
@@ -203,8 +244,13 @@ class RenderInfo:
         self.domains = set()
         self.domains_lifecycle = set()
         self.entities = set()
+        # The fields read from each entity when the template only read
+        # some of them: None for the state and the names of attributes.
+        # Entities which are not in it were read as a whole.
+        self.entity_fields: Dict[str, Set[Optional[str]]] = {}
         self.rate_limit: Optional[timedelta] = None
         self.has_time = False
+        self.render_time = 0.0
 
     def __repr__(self) -> str:
         """Representation of RenderInfo."""
@@ -237,6 +283,10 @@ class RenderInfo:
 
     def _freeze_sets(self) -> None:
         self.entities = frozenset(self.entities)
+        self.entity_fields = {
+            entity_id: frozenset(fields)
+            for entity_id, fields in self.entity_fields.items()
+        }
         self.domains = frozenset(self.domains)
         self.domains_lifecycle = frozenset(self.domains_lifecycle)
 
@@ -250,6 +300,8 @@ class RenderInfo:
                 self.rate_limit = DOMAIN_STATES_RATE_LIMIT
 
         if self.exception:
+            # What was read before the error is not all the template needs
+            self.entity_fields = {}
             return
 
         if not self.all_states_lifecycle:
@@ -447,7 +499,34 @@ class Template:
         self, variables: TemplateVarsType = None, **kwargs: Any
     ) -> RenderInfo:
         """Render the template and collect an entity filter."""
-        assert self.hass and _RENDER_INFO not in self.hass.data
+        return self._render_to_info(variables, **kwargs)
+
+    async def async_render_to_info_in_executor(
+        self, variables: TemplateVarsType = None, **kwargs: Any
+    ) -> RenderInfo:
+        """Render the template in the executor and collect an entity filter.
+
+        The template reads a snapshot of the states taken before the job
+        is submitted, so an expensive template does not hold the event
+        loop and still sees consistent states.
+
+        This method must be run in the event loop.
+        """
+        assert self.hass
+        states = FrozenStates(self.hass.states.async_snapshot())
+
+        def render_to_info() -> RenderInfo:
+            token = _STATES.set(states)
+            try:
+                return self._render_to_info(variables, **kwargs)
+            finally:
+                _STATES.reset(token)
+
+        return cast(RenderInfo, await self.hass.async_add_executor_job(render_to_info))
+
+    def _render_to_info(self, variables: TemplateVarsType, **kwargs: Any) -> RenderInfo:
+        """Render the template and collect an entity filter."""
+        assert self.hass and _RENDER_INFO.get() is None
 
         render_info = RenderInfo(self)  # type: ignore[no-untyped-call]
 
@@ -457,13 +536,19 @@ class Template:
             render_info._freeze_static()
             return render_info
 
-        self.hass.data[_RENDER_INFO] = render_info
+        token = _RENDER_INFO.set(render_info)
         try:
+            if self._compiled is None:
+                self._ensure_compiled()
+            # The CPU time of the thread, waiting for the GIL is not the
+            # template's fault
+            start = thread_time()
             render_info._result = self.async_render(variables, **kwargs)
+            render_info.render_time = thread_time() - start
         except TemplateError as ex:
             render_info.exception = ex
         finally:
-            del self.hass.data[_RENDER_INFO]
+            _RENDER_INFO.reset(token)
 
         render_info._freeze()
         return render_info
@@ -576,12 +661,12 @@ class AllStates:
     __getitem__ = __getattr__
 
     def _collect_all(self) -> None:
-        render_info = self._hass.data.get(_RENDER_INFO)
+        render_info = _RENDER_INFO.get()
         if render_info is not None:
             render_info.all_states = True
 
     def _collect_all_lifecycle(self) -> None:
-        render_info = self._hass.data.get(_RENDER_INFO)
+        render_info = _RENDER_INFO.get()
         if render_info is not None:
             render_info.all_states_lifecycle = True
 
@@ -593,7 +678,7 @@ class AllStates:
     def __len__(self) -> int:
         """Return number of states."""
         self._collect_all_lifecycle()
-        return self._hass.states.async_entity_ids_count()
+        return _states(self._hass).async_entity_ids_count()
 
     def __call__(self, entity_id):
         """Return the states."""
@@ -622,12 +707,12 @@ class DomainStates:
     __getitem__ = __getattr__
 
     def _collect_domain(self) -> None:
-        entity_collect = self._hass.data.get(_RENDER_INFO)
+        entity_collect = _RENDER_INFO.get()
         if entity_collect is not None:
             entity_collect.domains.add(self._domain)
 
     def _collect_domain_lifecycle(self) -> None:
-        entity_collect = self._hass.data.get(_RENDER_INFO)
+        entity_collect = _RENDER_INFO.get()
         if entity_collect is not None:
             entity_collect.domains_lifecycle.add(self._domain)
 
@@ -639,7 +724,7 @@ class DomainStates:
     def __len__(self) -> int:
         """Return number of states."""
         self._collect_domain_lifecycle()
-        return self._hass.states.async_entity_ids_count(self._domain)
+        return _states(self._hass).async_entity_ids_count(self._domain)
 
     def __repr__(self) -> str:
         """Representation of Domain States."""
@@ -662,18 +747,19 @@ class TemplateState(State):
         self._collect = collect
 
     def _collect_state(self) -> None:
-        if self._collect and _RENDER_INFO in self._hass.data:
-            self._hass.data[_RENDER_INFO].entities.add(self._state.entity_id)
+        if self._collect:
+            _collect_state(self._hass, self._state.entity_id)
+
+    def _collect_fields(self, *fields: Optional[str]) -> None:
+        if self._collect:
+            _collect_fields(self._hass, self._state.entity_id, *fields)
 
     # Jinja will try __getitem__ first and it avoids the need
     # to call is_safe_attribute
     def __getitem__(self, item):
         """Return a property as an attribute for jinja."""
         if item in _COLLECTABLE_STATE_ATTRIBUTES:
-            # _collect_state inlined here for performance
-            if self._collect and _RENDER_INFO in self._hass.data:
-                self._hass.data[_RENDER_INFO].entities.add(self._state.entity_id)
-            return getattr(self._state, item)
+            return getattr(self, item)
         if item == "entity_id":
             return self._state.entity_id
         if item == "state_with_unit":
@@ -691,19 +777,23 @@ class TemplateState(State):
     @property
     def state(self):
         """Wrap State.state."""
-        self._collect_state()
+        self._collect_fields(None)
         return self._state.state
 
     @property
     def attributes(self):
         """Wrap State.attributes."""
-        self._collect_state()
-        return self._state.attributes
+        if not self._collect:
+            return self._state.attributes
+        return TemplateStateAttributes(self._hass, self._state)
 
     @property
     def last_changed(self):
-        """Wrap State.last_changed."""
-        self._collect_state()
+        """Wrap State.last_changed.
+
+        It only changes with the state.
+        """
+        self._collect_fields(None)
         return self._state.last_changed
 
     @property
@@ -721,25 +811,25 @@ class TemplateState(State):
     @property
     def domain(self):
         """Wrap State.domain."""
-        self._collect_state()
+        self._collect_fields()
         return self._state.domain
 
     @property
     def object_id(self):
         """Wrap State.object_id."""
-        self._collect_state()
+        self._collect_fields()
         return self._state.object_id
 
     @property
     def name(self):
         """Wrap State.name."""
-        self._collect_state()
+        self._collect_fields(ATTR_FRIENDLY_NAME)
         return self._state.name
 
     @property
     def state_with_unit(self) -> str:
         """Return the state concatenated with the unit if available."""
-        self._collect_state()
+        self._collect_fields(None, ATTR_UNIT_OF_MEASUREMENT)
         unit = self._state.attributes.get(ATTR_UNIT_OF_MEASUREMENT)
         return f"{self._state.state} {unit}" if unit else self._state.state
 
@@ -753,29 +843,123 @@ class TemplateState(State):
         return f"<template TemplateState({self._state.__repr__()})>"
 
 
+class TemplateStateAttributes(collections.abc.Mapping):
+    """Attributes of a state in a template, collecting the ones read."""
+
+    __slots__ = ("_hass", "_state")
+
+    def __init__(self, hass: HomeAssistantType, state: State) -> None:
+        """Initialize the attributes."""
+        self._hass = hass
+        self._state = state
+
+    def __getitem__(self, key: str) -> Any:
+        """Return an attribute, also used by get and in."""
+        _collect_fields(self._hass, self._state.entity_id, key)
+        return self._state.attributes[key]
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the attribute names."""
+        _collect_state(self._hass, self._state.entity_id)
+        return iter(self._state.attributes)
+
+    def __len__(self) -> int:
+        """Return the number of attributes."""
+        _collect_state(self._hass, self._state.entity_id)
+        return len(self._state.attributes)
+
+    def __str__(self) -> str:
+        """Render like the attributes of a state."""
+        _collect_state(self._hass, self._state.entity_id)
+        return str(self._state.attributes)
+
+    def __repr__(self) -> str:
+        """Representation of Template State Attributes."""
+        return f"<template TemplateStateAttributes({self._state.entity_id})>"
+
+
 def _collect_state(hass: HomeAssistantType, entity_id: str) -> None:
-    entity_collect = hass.data.get(_RENDER_INFO)
+    entity_collect = _RENDER_INFO.get()
     if entity_collect is not None:
         entity_collect.entities.add(entity_id)
+        entity_collect.entity_fields.pop(entity_id, None)
+
+
+def _collect_fields(
+    hass: HomeAssistantType, entity_id: str, *fields: Optional[str]
+) -> None:
+    """Collect the fields of a state read by a template."""
+    entity_collect = _RENDER_INFO.get()
+    if entity_collect is None:
+        return
+    collected = entity_collect.entity_fields.get(entity_id)
+    if collected is not None:
+        collected.update(fields)
+    elif entity_id not in entity_collect.entities:
+        entity_collect.entities.add(entity_id)
+        entity_collect.entity_fields[entity_id] = set(fields)
+
+
+class FrozenStates:
+    """The states of a snapshot, read like the state machine from any thread."""
+
+    def __init__(self, snapshot: StatesSnapshot) -> None:
+        """Initialize the states, must be run in the event loop."""
+        self._snapshot = snapshot
+        self._states: Dict[str, State] = snapshot.cached(
+            "by_entity_id", lambda: {state.entity_id: state for state in snapshot}
+        )
+
+    def get(self, entity_id: str) -> Optional[State]:
+        """Return the state of an entity."""
+        return self._states.get(entity_id.lower())
+
+    def async_all(self, domain: str) -> List[State]:
+        """Return the states of a domain."""
+        return [state for state in self._snapshot if state.domain == domain]
+
+    def async_entity_ids_count(self, domain: Optional[str] = None) -> int:
+        """Return the number of states, of a domain if given."""
+        if domain is None:
+            return len(self._snapshot)
+        return len(self.async_all(domain))
+
+    def async_snapshot(self) -> StatesSnapshot:
+        """Return the snapshot of all the states."""
+        return self._snapshot
+
+
+def _states(hass: HomeAssistantType) -> Any:
+    """Return what templates read the states from."""
+    return _STATES.get() or hass.states
 
 
 def _state_generator(hass: HomeAssistantType, domain: Optional[str]) -> Generator:
     """State generator for a domain or all states."""
-    for state in sorted(hass.states.async_all(domain), key=attrgetter("entity_id")):
+    if domain is None:
+        # All the templates iterating the states share the sorted snapshot
+        snapshot = _states(hass).async_snapshot()
+        states: Iterable[State] = snapshot.cached(
+            "sorted_by_entity_id",
+            lambda: tuple(sorted(snapshot, key=attrgetter("entity_id"))),
+        )
+    else:
+        states = sorted(_states(hass).async_all(domain), key=attrgetter("entity_id"))
+    for state in states:
         yield TemplateState(hass, state, collect=False)
 
 
 def _get_state_if_valid(
     hass: HomeAssistantType, entity_id: str
 ) -> Optional[TemplateState]:
-    state = hass.states.get(entity_id)
+    state = _states(hass).get(entity_id)
     if state is None and not valid_entity_id(entity_id):
         raise TemplateError(f"Invalid entity ID '{entity_id}'")  # type: ignore
     return _get_template_state_from_state(hass, entity_id, state)
 
 
 def _get_state(hass: HomeAssistantType, entity_id: str) -> Optional[TemplateState]:
-    return _get_template_state_from_state(hass, entity_id, hass.states.get(entity_id))
+    return _get_template_state_from_state(hass, entity_id, _states(hass).get(entity_id))
 
 
 def _get_template_state_from_state(
@@ -999,7 +1183,7 @@ def state_attr(hass, entity_id, name):
 
 def now(hass):
     """Record fetching now."""
-    render_info = hass.data.get(_RENDER_INFO)
+    render_info = _RENDER_INFO.get()
     if render_info is not None:
         render_info.has_time = True
 
@@ -1008,7 +1192,7 @@ def now(hass):
 
 def utcnow(hass):
     """Record fetching utcnow."""
-    render_info = hass.data.get(_RENDER_INFO)
+    render_info = _RENDER_INFO.get()
     if render_info is not None:
         render_info.has_time = True
 
@@ -1409,9 +1593,140 @@ class TemplateEnvironment(ImmutableSandboxedEnvironment):
         cached = self.template_cache.get(source)
 
         if cached is None:
-            cached = self.template_cache[source] = super().compile(source)
+            with_hass = self.hass is not None
+            cached = _BYTECODE_CACHE.get(source, with_hass)
+            if cached is None:
+                cached = super().compile(source)
+                _BYTECODE_CACHE.set(source, with_hass, cached)
+            self.template_cache[source] = cached
 
         return cached
 
 
+class BytecodeCache:
+    """Compiled template code kept on disk between restarts.
+
+    The code is stored with marshal, keyed by a hash of the template
+    source and whether it was compiled with hass. The whole file is
+    discarded when Home Assistant, Jinja or Python changes version.
+    Only the templates compiled or used since the file was loaded are
+    written back, so templates removed from the config are dropped.
+    """
+
+    def __init__(self) -> None:
+        """Initialize a disabled cache."""
+        self.path: Optional[str] = None
+        self._loaded: Dict[str, CodeType] = {}
+        self._used: Dict[str, CodeType] = {}
+        self._dirty = False
+
+    @staticmethod
+    def _header() -> tuple:
+        """Return what the stored code depends on."""
+        return (
+            BYTECODE_CACHE_VERSION,
+            __version__,
+            jinja2.__version__,
+            importlib.util.MAGIC_NUMBER,
+        )
+
+    @staticmethod
+    def _key(source: str, with_hass: bool) -> str:
+        """Return the key of a template source."""
+        return hashlib.sha256(f"{int(with_hass)}{source}".encode()).hexdigest()
+
+    def get(self, source: str, with_hass: bool) -> Optional[CodeType]:
+        """Return the stored code of a template."""
+        if self.path is None:
+            return None
+        key = self._key(source, with_hass)
+        code = self._used.get(key)
+        if code is None:
+            code = self._loaded.pop(key, None)
+            if code is not None:
+                self._used[key] = code
+        return code
+
+    def set(self, source: str, with_hass: bool, code: CodeType) -> None:
+        """Store the compiled code of a template."""
+        if self.path is None:
+            return
+        self._used[self._key(source, with_hass)] = code
+        self._dirty = True
+
+    def load(self, path: str) -> None:
+        """Enable the cache and read the code stored at path."""
+        self.path = path
+        self._loaded = {}
+        self._used = {}
+        self._dirty = False
+        try:
+            with open(path, "rb") as fdesc:
+                if marshal.load(fdesc) != self._header():
+                    _LOGGER.debug("Discarding template cache of another version")
+                    return
+                self._loaded = marshal.load(fdesc)
+        except FileNotFoundError:
+            return
+        except (OSError, EOFError, ValueError, TypeError) as err:
+            _LOGGER.warning("Unable to read template cache %s: %s", path, err)
+            self._loaded = {}
+
+    def save(self) -> None:
+        """Write the code used since the cache was loaded."""
+        if self.path is None or not self._dirty:
+            return
+        self._dirty = False
+        data = marshal.dumps(dict(self._used))
+        tmp_filename = ""
+        try:
+            with tempfile.NamedTemporaryFile(
+                dir=os.path.dirname(self.path), delete=False
+            ) as fdesc:
+                tmp_filename = fdesc.name
+                marshal.dump(self._header(), fdesc)
+                fdesc.write(data)
+            os.replace(tmp_filename, self.path)
+        except OSError as err:
+            _LOGGER.warning("Unable to write template cache %s: %s", self.path, err)
+        finally:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+
+    def disable(self) -> None:
+        """Stop caching and drop the stored code."""
+        self.path = None
+        self._loaded = {}
+        self._used = {}
+        self._dirty = False
+
+
+_BYTECODE_CACHE = BytecodeCache()
+
+
+async def async_load_bytecode_cache(hass: HomeAssistantType) -> None:
+    """Load the compiled templates of the previous run.
+
+    The cache is written and disabled once Home Assistant has started, when
+    every configured template has been compiled. Templates compiled later,
+    like those of the template editor, are not kept. If Home Assistant
+    stops before it has started, the cache is written when it stops.
+    """
+    # pylint: disable=import-outside-toplevel
+    from homeassistant.helpers.storage import STORAGE_DIR
+
+    path = hass.config.path(STORAGE_DIR, BYTECODE_CACHE_FILE)
+    if not os.path.isdir(os.path.dirname(path)):
+        return
+    await hass.async_add_executor_job(_BYTECODE_CACHE.load, path)
+
+    async def async_save_and_disable(event: Event) -> None:
+        """Write the compiled templates and stop caching."""
+        await hass.async_add_executor_job(_BYTECODE_CACHE.save)
+        _BYTECODE_CACHE.disable()
+
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STARTED, async_save_and_disable)
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_FINAL_WRITE, async_save_and_disable)
+
+
 _NO_HASS_ENV = TemplateEnvironment(None)  # type: ignore[no-untyped-call]
@@ -3,15 +3,22 @@ import argparse
 import asyncio
 import collections
 from contextlib import suppress
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 import logging
+import os
+import queue
+from tempfile import TemporaryDirectory
+import threading
+import time
 from timeit import default_timer as timer
+from types import SimpleNamespace
 from typing import Callable, Dict, TypeVar
 
 from homeassistant import core
 from homeassistant.components.websocket_api.const import JSON_DUMP
 from homeassistant.const import ATTR_NOW, EVENT_STATE_CHANGED, EVENT_TIME_CHANGED
+from homeassistant.helpers import template
 from homeassistant.helpers.entityfilter import convert_include_exclude_filter
 from homeassistant.helpers.json import JSONEncoder
 from homeassistant.util import dt as dt_util
@@ -60,6 +67,17 @@ def benchmark(func: CALLABLE_T) -> CALLABLE_T:
 @benchmark
 async def fire_events(hass):
     """Fire a million events."""
+    return await _fire_events(hass, False)
+
+
+@benchmark
+async def fire_events_run_immediately(hass):
+    """Fire a million events to a listener that runs immediately."""
+    return await _fire_events(hass, True)
+
+
+async def _fire_events(hass, run_immediately):
+    """Fire a million events to a callback listener."""
     count = 0
     event_name = "benchmark_event"
     event = asyncio.Event()
@@ -73,13 +91,13 @@ async def fire_events(hass):
         if count == 10 ** 6:
             event.set()
 
-    hass.bus.async_listen(event_name, listener)
+    hass.bus.async_listen(event_name, listener, run_immediately=run_immediately)
+
+    start = timer()
 
     for _ in range(10 ** 6):
         hass.bus.async_fire(event_name)
 
-    start = timer()
-
     await event.wait()
 
     return timer() - start
@@ -139,11 +157,11 @@ async def state_changed_helper(hass):
         "new_state": core.State(entity_id, "on"),
     }
 
+    start = timer()
+
     for _ in range(10 ** 6):
         hass.bus.async_fire(EVENT_STATE_CHANGED, event_data)
 
-    start = timer()
-
     await event.wait()
 
     return timer() - start
@@ -175,12 +193,50 @@ async def state_changed_event_helper(hass):
         "new_state": core.State(entity_id, "on"),
     }
 
+    start = timer()
+
     for _ in range(10 ** 6):
         hass.bus.async_fire(EVENT_STATE_CHANGED, event_data)
 
+    await event.wait()
+
+    return timer() - start
+
+
+@benchmark
+async def numeric_state_triggers(hass):
+    """Run 10000 state changes through 800 numeric_state triggers of one entity."""
+    # pylint: disable=import-outside-toplevel
+    from homeassistant.components.homeassistant.triggers import numeric_state
+
+    entity_id = "sensor.temperature"
+    fired = 0
+
+    @core.callback
+    def action(variables, context=None):
+        """Count the triggers fired."""
+        nonlocal fired
+        fired += 1
+
+    for idx in range(800):
+        await numeric_state.async_attach_trigger(
+            hass,
+            numeric_state.TRIGGER_SCHEMA(
+                {
+                    "platform": "numeric_state",
+                    "entity_id": entity_id,
+                    "above": idx / 8,
+                }
+            ),
+            action,
+            {"name": f"automation {idx}"},
+        )
+
     start = timer()
 
-    await event.wait()
+    for idx in range(10 ** 4):
+        hass.states.async_set(entity_id, idx % 100)
+        await hass.async_block_till_done()
 
     return timer() - start
 
@@ -310,6 +366,37 @@ async def valid_entity_id(hass):
     return timer() - start
 
 
+@benchmark
+async def state_machine_set(hass):
+    """Update the state of 1,000 entities a million times."""
+    entity_ids = [f"sensor.entity_{idx}" for idx in range(1000)]
+    attributes = {"unit_of_measurement": "W", "friendly_name": "Power"}
+    for entity_id in entity_ids:
+        hass.states.async_set(entity_id, "0", attributes)
+
+    start = timer()
+    for value in range(1, 1001):
+        for entity_id in entity_ids:
+            hass.states.async_set(entity_id, value, attributes)
+    return timer() - start
+
+
+@benchmark
+async def state_machine_domain_filter(hass):
+    """Filter the states of 4,000 entities by domain 100k times."""
+    for domain_idx in range(20):
+        for idx in range(200):
+            hass.states.async_set(f"domain{domain_idx}.entity_{idx}", "on")
+
+    start = timer()
+    for _ in range(25000):
+        hass.states.async_entity_ids("domain0")
+        hass.states.async_entity_ids_count("domain1")
+        hass.states.async_all("domain2")
+        hass.states.async_all(["domain3", "domain4"])
+    return timer() - start
+
+
 @benchmark
 async def json_serialize_states(hass):
     """Serialize million states with websocket default encoder."""
@@ -323,6 +410,317 @@ async def json_serialize_states(hass):
     return timer() - start
 
 
+@benchmark
+async def get_states_snapshot(hass):
+    """Answer 1,000 get_states requests for 2,000 entities, a state changing every 10."""
+    # pylint: disable=import-outside-toplevel
+    from homeassistant.components.websocket_api.commands import handle_get_states
+
+    for idx in range(2000):
+        hass.states.async_set(f"sensor.entity_{idx}", idx, {"unit": "W"})
+
+    messages: list = []
+    connection = SimpleNamespace(
+        user=SimpleNamespace(
+            permissions=SimpleNamespace(access_all_entities=lambda _: True)
+        ),
+        send_message=messages.append,
+    )
+    start = timer()
+    for idx in range(1000):
+        if idx % 10 == 0:
+            hass.states.async_set("sensor.entity_0", idx, {"unit": "W"})
+        handle_get_states(hass, connection, {"id": idx, "type": "get_states"})
+        message = messages.pop()
+        # Encode like the websocket writer does
+        if not isinstance(message, str):
+            JSON_DUMP(message)
+    return timer() - start
+
+
+@benchmark
+async def template_compile(hass):
+    """Compile 1,500 templates like a cold start without a template cache."""
+    return await _template_compile(hass, False)
+
+
+@benchmark
+async def template_compile_cached(hass):
+    """Compile 1,500 templates like a cold start with the template cache."""
+    return await _template_compile(hass, True)
+
+
+async def _template_compile(hass, cached):
+    # pylint: disable=protected-access
+    sources = [
+        f"{{% if is_state('light.entity_{idx}', 'on') %}}"
+        f"{{{{ (states('sensor.entity_{idx}') | float * 1.8 + 32) | round(1) }}}}"
+        f"{{% else %}}{{{{ state_attr('sensor.entity_{idx}', 'unit') }}}}{{% endif %}}"
+        for idx in range(1500)
+    ]
+
+    with TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, template.BYTECODE_CACHE_FILE)
+        if cached:
+            # A previous run compiled and stored the templates
+            template._BYTECODE_CACHE.load(path)
+            env = template.TemplateEnvironment(hass)
+            for source in sources:
+                env.compile(source)
+            template._BYTECODE_CACHE.save()
+
+        start = timer()
+        if cached:
+            template._BYTECODE_CACHE.load(path)
+        env = template.TemplateEnvironment(hass)
+        for source in sources:
+            env.compile(source)
+        runtime = timer() - start
+        template._BYTECODE_CACHE.disable()
+
+    return runtime
+
+
+@benchmark
+async def recorder_orm_insert(hass):
+    """Write 100k state changes through the recorder ORM session."""
+    return await _recorder_insert(hass, False)
+
+
+@benchmark
+async def recorder_bulk_insert(hass):
+    """Write 100k state changes through the recorder bulk insert path."""
+    return await _recorder_insert(hass, True)
+
+
+async def _recorder_insert(hass, bulk_insert):
+    # pylint: disable=import-outside-toplevel,protected-access
+    from homeassistant.components import recorder
+
+    count = 10 ** 5
+    # Number of state changes committed together, ~1s of a busy instance
+    commit_every = 300
+
+    instance = recorder.Recorder(
+        hass,
+        auto_purge=False,
+        keep_days=1,
+        commit_interval=1,
+        uri="sqlite://",
+        db_max_retries=1,
+        db_retry_wait=0,
+        entity_filter=lambda entity_id: True,
+        exclude_t=[],
+        db_integrity_check=False,
+        bulk_insert=bulk_insert,
+    )
+
+    old_states = {}
+    events = []
+    for idx in range(count):
+        entity_id = f"sensor.benchmark_{idx % 500}"
+        new_state = core.State(
+            entity_id, str(idx), {"unit_of_measurement": "W", "friendly_name": "B"}
+        )
+        events.append(
+            core.Event(
+                EVENT_STATE_CHANGED,
+                {
+                    "entity_id": entity_id,
+                    "old_state": old_states.get(entity_id),
+                    "new_state": new_state,
+                },
+            )
+        )
+        old_states[entity_id] = new_state
+
+    def _write_events():
+        instance._setup_connection()
+        instance._setup_run()
+        instance.event_session = instance.get_session()
+        instance.event_session.expire_on_commit = False
+
+        start = timer()
+        for idx, event in enumerate(events, 1):
+            instance._process_one_event(event)
+            if idx % commit_every == 0:
+                instance._commit_event_session_or_retry()
+        instance._commit_event_session_or_retry()
+        runtime = timer() - start
+
+        instance._close_run()
+        instance._close_connection()
+        return runtime
+
+    runtime = await hass.async_add_executor_job(_write_events)
+    # Each state change writes one events row and one states row
+    print(f"{count / runtime:.0f} state changes/sec")
+    return runtime
+
+
+@benchmark
+async def recorder_purge(hass):
+    """Purge 1M old rows while writing state changes, report the slowest write."""
+    # pylint: disable=import-outside-toplevel,protected-access
+    from homeassistant.components import recorder
+    from homeassistant.components.recorder import purge
+    from homeassistant.components.recorder.models import Events, States
+
+    count = 5 * 10 ** 5
+    instance = recorder.Recorder(
+        hass,
+        auto_purge=False,
+        keep_days=1,
+        commit_interval=1,
+        uri="sqlite://",
+        db_max_retries=1,
+        db_retry_wait=0,
+        entity_filter=lambda entity_id: True,
+        exclude_t=[],
+        db_integrity_check=False,
+    )
+    old = (dt_util.utcnow() - timedelta(days=11)).timestamp()
+
+    def _purge():
+        instance._setup_connection()
+        instance._setup_run()
+        with instance.engine.begin() as connection:
+            connection.execute(
+                Events.__table__.insert(),
+                [
+                    {"event_type": "state_changed", "time_fired_ts": old}
+                    for _ in range(count)
+                ],
+            )
+            connection.execute(
+                States.__table__.insert(),
+                [
+                    {
+                        "entity_id": f"sensor.benchmark_{idx % 500}",
+                        "state": str(idx),
+                        "event_id": idx + 1,
+                        "last_updated_ts": old,
+                    }
+                    for idx in range(count)
+                ],
+            )
+
+        instance.event_session = instance.get_session()
+        instance.event_session.expire_on_commit = False
+        writes = queue.SimpleQueue()
+        stop = threading.Event()
+
+        def _write_states():
+            """Queue a state change every 10 ms like a busy instance."""
+            idx = 0
+            while not stop.is_set():
+                entity_id = "sensor.benchmark_writer"
+                event = core.Event(
+                    EVENT_STATE_CHANGED,
+                    {"entity_id": entity_id, "new_state": core.State(entity_id, idx)},
+                )
+                writes.put((timer(), event))
+                idx += 1
+                time.sleep(0.01)
+
+        writer = threading.Thread(target=_write_states)
+        writer.start()
+        latencies = []
+        start = timer()
+        finished = False
+        while not finished:
+            # Like the recorder thread, the state changes that queued up
+            # during a batch are committed before the next batch
+            pending = []
+            while not writes.empty():
+                pending.append(writes.get())
+            for _, event in pending:
+                instance._process_one_event(event)
+            instance._commit_event_session_or_retry()
+            committed = timer()
+            latencies.extend(committed - written for written, _ in pending)
+            finished = purge.purge_old_data(instance, 1)
+        runtime = timer() - start
+        stop.set()
+        writer.join()
+
+        instance._close_run()
+        instance._close_connection()
+        print(
+            f"{len(latencies)} state changes written during the purge, "
+            f"the slowest took {max(latencies, default=0) * 1000:.0f} ms"
+        )
+        return runtime
+
+    return await hass.async_add_executor_job(_purge)
+
+
+@benchmark
+async def recorder_history_period(hass):
+    """Read and serialize 100k recorded states like /api/history/period."""
+    # pylint: disable=import-outside-toplevel,protected-access
+    from sqlalchemy.ext import baked
+
+    from homeassistant.components import history, recorder
+
+    count = 10 ** 5
+    instance = recorder.Recorder(
+        hass,
+        auto_purge=False,
+        keep_days=1,
+        commit_interval=1,
+        uri="sqlite://",
+        db_max_retries=1,
+        db_retry_wait=0,
+        entity_filter=lambda entity_id: True,
+        exclude_t=[],
+        db_integrity_check=False,
+        bulk_insert=True,
+    )
+    hass.data[recorder.DATA_INSTANCE] = instance
+    hass.data[history.HISTORY_BAKERY] = baked.bakery()
+    start_time = dt_util.utcnow() - timedelta(hours=1)
+
+    def _read_history():
+        instance._setup_connection()
+        instance._setup_run()
+        instance.event_session = instance.get_session()
+        instance.event_session.expire_on_commit = False
+        for idx in range(count):
+            entity_id = f"sensor.benchmark_{idx % 500}"
+            instance._process_one_event(
+                core.Event(
+                    EVENT_STATE_CHANGED,
+                    {
+                        "entity_id": entity_id,
+                        "new_state": core.State(
+                            entity_id,
+                            str(idx),
+                            {"unit_of_measurement": "W"},
+                            last_changed=start_time + timedelta(milliseconds=idx),
+                            last_updated=start_time + timedelta(milliseconds=idx),
+                        ),
+                    },
+                    time_fired=start_time + timedelta(milliseconds=idx),
+                )
+            )
+        instance._commit_event_session_or_retry()
+        instance.states_meta_migrated = True
+
+        start = timer()
+        states = history.get_significant_states(hass, start_time)
+        query_runtime = timer() - start
+        json.dumps(list(states.values()), cls=JSONEncoder)
+        runtime = timer() - start
+
+        instance._close_run()
+        instance._close_connection()
+        print(f"Query {query_runtime:.2f}s, serialize {runtime - query_runtime:.2f}s")
+        return runtime
+
+    return await hass.async_add_executor_job(_read_history)
+
+
 def _create_state_changed_event_from_old_new(
     entity_id, event_time_fired, old_state, new_state
 ):
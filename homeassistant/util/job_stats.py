@@ -0,0 +1,252 @@
+"""Measure the event loop lag and the time spent running jobs."""
+import asyncio
+from collections import deque
+from contextvars import ContextVar
+import functools
+import threading
+from time import monotonic
+import types
+from typing import Any, Callable, Coroutine, Deque, Dict, Generator, List, Optional
+
+LAG_INTERVAL = 1.0
+LAG_SAMPLES = 60
+
+# The integration running the current job. Executor jobs are charged to
+# it rather than to the module of their target, which may be a library.
+current_integration: ContextVar[Optional[str]] = ContextVar(
+    "current_integration", default=None
+)
+
+
+@functools.lru_cache(maxsize=None)
+def integration_from_module(module: str) -> str:
+    """Return the integration a module belongs to, or the module itself."""
+    parts = module.split(".")
+    if len(parts) > 2 and parts[0] == "homeassistant" and parts[1] == "components":
+        return parts[2]
+    if len(parts) > 1 and parts[0] == "custom_components":
+        return parts[1]
+    return module
+
+
+def integration_from_target(target: Callable) -> str:
+    """Return the integration of a job target."""
+    while isinstance(target, functools.partial):
+        target = target.func
+    module = getattr(target, "__module__", None) or type(target).__module__
+    return integration_from_module(module)
+
+
+class JobStats:
+    """Collect the event loop lag and the time spent running jobs.
+
+    The lag is how late a timer scheduled every second runs. The time
+    of a job only counts the time it holds the event loop: for a
+    coroutine the time of each step, without the time it awaits. Jobs
+    run by other jobs are not counted in the time of their caller.
+
+    Executor jobs are recorded separately with the time they wait for a
+    thread, the time they run and how many are queued or running.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Initialize the stats."""
+        self._loop = loop
+        self._lag_samples: Deque[float] = deque(maxlen=LAG_SAMPLES)
+        self._lag_handle: Optional[asyncio.TimerHandle] = None
+        # Per integration: calls, total time and max time
+        self._jobs: Dict[str, List[Any]] = {}
+        self._child_time = 0.0
+        # Per integration: calls, queued, in flight, total and max wait
+        # time, total and max run time. Updated from the executor threads.
+        self._executor_jobs: Dict[str, List[Any]] = {}
+        self._executor_lock = threading.Lock()
+
+    def async_start(self) -> None:
+        """Start measuring the loop lag."""
+        self._schedule_lag_check()
+
+    def async_stop(self) -> None:
+        """Stop measuring the loop lag."""
+        if self._lag_handle is not None:
+            self._lag_handle.cancel()
+            self._lag_handle = None
+
+    def _schedule_lag_check(self) -> None:
+        """Schedule the next loop lag sample."""
+        expected = self._loop.time() + LAG_INTERVAL
+        self._lag_handle = self._loop.call_at(expected, self._check_lag, expected)
+
+    def _check_lag(self, expected: float) -> None:
+        """Record how late the timer ran."""
+        self._lag_samples.append(max(self._loop.time() - expected, 0.0))
+        self._schedule_lag_check()
+
+    def _record(self, target: Callable, elapsed: float, call: bool) -> None:
+        """Record time spent running a job."""
+        integration = integration_from_target(target)
+        stats = self._jobs.get(integration)
+        if stats is None:
+            stats = self._jobs[integration] = [0, 0.0, 0.0]
+        if call:
+            stats[0] += 1
+        stats[1] += elapsed
+        if elapsed > stats[2]:
+            stats[2] = elapsed
+
+    def _run_timed(self, target: Callable, func: Callable, *args: Any) -> Any:
+        """Run func and record the time spent in it for target."""
+        parent_child_time = self._child_time
+        self._child_time = 0.0
+        start = monotonic()
+        try:
+            return func(*args)
+        finally:
+            elapsed = monotonic() - start
+            self._record(target, elapsed - self._child_time, func is target)
+            self._child_time = parent_child_time + elapsed
+
+    def run_callback(self, target: Callable, *args: Any) -> Any:
+        """Run a callback job and record its time."""
+        return self._run_timed(target, target, *args)
+
+    def wrap_coroutine(self, target: Callable, coro: Coroutine) -> Coroutine:
+        """Return a coroutine recording the time of each step of coro."""
+        self._record(target, 0.0, True)
+        return self._timed_coroutine(target, coro)
+
+    async def _timed_coroutine(self, target: Callable, coro: Coroutine) -> Any:
+        """Await a coroutine recording the time of its steps."""
+        return await self._timed_steps(target, coro)
+
+    @types.coroutine
+    def _timed_steps(self, target: Callable, coro: Coroutine) -> Generator:
+        """Drive a coroutine one step at a time."""
+        send: Any = None
+        throw: Optional[BaseException] = None
+        while True:
+            try:
+                if throw is None:
+                    yielded = self._run_timed(target, coro.send, send)
+                else:
+                    yielded = self._run_timed(target, coro.throw, throw)
+            except StopIteration as stop:
+                return stop.value
+            send = throw = None
+            try:
+                send = yield yielded
+            except GeneratorExit:
+                coro.close()
+                raise
+            except BaseException as err:  # pylint: disable=broad-except
+                throw = err
+
+    def executor_job(self, integration: str, target: Callable) -> "ExecutorJob":
+        """Return a job running target and recording its wait and run time.
+
+        The wait time starts now, when the job is submitted to the executor.
+        """
+        with self._executor_lock:
+            stats = self._executor_jobs.get(integration)
+            if stats is None:
+                stats = self._executor_jobs[integration] = [0, 0, 0, 0.0, 0.0, 0.0, 0.0]
+            stats[1] += 1
+        return ExecutorJob(self._executor_lock, stats, target)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the loop lag and job stats."""
+        samples = self._lag_samples
+        return {
+            "loop_lag": {
+                "last": samples[-1] if samples else None,
+                "mean": sum(samples) / len(samples) if samples else None,
+                "max": max(samples) if samples else None,
+            },
+            "integrations": {
+                integration: {"calls": calls, "time": total, "max_time": max_time}
+                for integration, (calls, total, max_time) in sorted(
+                    self._jobs.items(), key=lambda item: item[1][1], reverse=True
+                )
+            },
+            "executor": self._executor_as_dict(),
+        }
+
+    def _executor_as_dict(self) -> Dict[str, Any]:
+        """Return the executor job stats."""
+        with self._executor_lock:
+            executor_jobs = [
+                (integration, list(stats))
+                for integration, stats in self._executor_jobs.items()
+            ]
+        return {
+            integration: {
+                "calls": calls,
+                "queued": queued,
+                "in_flight": in_flight,
+                "wait_time": wait_time,
+                "max_wait_time": max_wait_time,
+                "run_time": run_time,
+                "max_run_time": max_run_time,
+            }
+            for integration, (
+                calls,
+                queued,
+                in_flight,
+                wait_time,
+                max_wait_time,
+                run_time,
+                max_run_time,
+            ) in sorted(executor_jobs, key=lambda item: item[1][5], reverse=True)
+        }
+
+
+class ExecutorJob:
+    """Run a job in an executor thread and record its wait and run time.
+
+    The job is counted as queued until it starts. A job that never
+    starts, because its future was cancelled, must be discarded.
+    """
+
+    __slots__ = ("_lock", "_stats", "_target", "_submitted", "_dequeued")
+
+    def __init__(self, lock: threading.Lock, stats: List[Any], target: Callable):
+        """Initialize the job."""
+        self._lock = lock
+        self._stats = stats
+        self._target = target
+        self._submitted = monotonic()
+        self._dequeued = False
+
+    def __call__(self, *args: Any) -> Any:
+        """Run the job in an executor thread."""
+        stats = self._stats
+        start = monotonic()
+        wait = start - self._submitted
+        with self._lock:
+            if not self._dequeued:
+                self._dequeued = True
+                stats[1] -= 1
+            stats[2] += 1
+            stats[3] += wait
+            if wait > stats[4]:
+                stats[4] = wait
+        try:
+            return self._target(*args)
+        finally:
+            elapsed = monotonic() - start
+            with self._lock:
+                stats[0] += 1
+                stats[2] -= 1
+                stats[5] += elapsed
+                if elapsed > stats[6]:
+                    stats[6] = elapsed
+
+    def discard(self, _future: Any = None) -> None:
+        """Stop counting the job as queued if it did not start.
+
+        Can be added as done callback of the future of the job.
+        """
+        with self._lock:
+            if not self._dequeued:
+                self._dequeued = True
+                self._stats[1] -= 1
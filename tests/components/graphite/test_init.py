@@ -70,8 +70,8 @@ class TestGraphite(unittest.TestCase):
                 mock.call(EVENT_HOMEASSISTANT_STOP, gf.shutdown),
             ]
         )
-        assert fake_hass.bus.listen.call_count == 1
-        assert fake_hass.bus.listen.call_args == mock.call(
+        assert fake_hass.bus.listen_batch.call_count == 1
+        assert fake_hass.bus.listen_batch.call_args == mock.call(
             EVENT_STATE_CHANGED, gf.event_listener
         )
 
@@ -89,12 +89,25 @@ class TestGraphite(unittest.TestCase):
             assert mock_queue.put.call_count == 1
             assert mock_queue.put.call_args == mock.call(self.gf._quit_object)
 
+    def test_shutdown_flushes_batch(self):
+        """Test events waiting for a batch are queued before the stop."""
+        with mock.patch.object(self.gf, "_queue") as mock_queue, mock.patch.object(
+            self.gf,
+            "_remove_batch_listener",
+            side_effect=lambda: self.gf.event_listener(["foo"]),
+        ):
+            self.gf.shutdown("event")
+            assert mock_queue.put.call_args_list == [
+                mock.call(["foo"]),
+                mock.call(self.gf._quit_object),
+            ]
+
     def test_event_listener(self):
         """Test the event listener."""
         with mock.patch.object(self.gf, "_queue") as mock_queue:
-            self.gf.event_listener("foo")
+            self.gf.event_listener(["foo"])
             assert mock_queue.put.call_count == 1
-            assert mock_queue.put.call_args == mock.call("foo")
+            assert mock_queue.put.call_args == mock.call(["foo"])
 
     @patch("time.time")
     def test_report_attributes(self, mock_time):
@@ -111,7 +124,7 @@ class TestGraphite(unittest.TestCase):
 
         state = mock.MagicMock(state=0, attributes=attrs)
         with mock.patch.object(self.gf, "_send_to_graphite") as mock_send:
-            self.gf._report_attributes("entity", state)
+            self.gf._report_attributes([("entity", state)])
             actual = mock_send.call_args_list[0][0][0].split("\n")
             assert sorted(expected) == sorted(actual)
 
@@ -123,7 +136,7 @@ class TestGraphite(unittest.TestCase):
 
         state = mock.MagicMock(state="above_horizon", attributes={"foo": 1.0})
         with mock.patch.object(self.gf, "_send_to_graphite") as mock_send:
-            self.gf._report_attributes("entity", state)
+            self.gf._report_attributes([("entity", state)])
             actual = mock_send.call_args_list[0][0][0].split("\n")
             assert sorted(expected) == sorted(actual)
 
@@ -133,7 +146,7 @@ class TestGraphite(unittest.TestCase):
         mock_time.return_value = 12345
         state = ha.State("domain.entity", STATE_ON, {"foo": 1.0})
         with mock.patch.object(self.gf, "_send_to_graphite") as mock_send:
-            self.gf._report_attributes("entity", state)
+            self.gf._report_attributes([("entity", state)])
             expected = [
                 "ha.entity.foo 1.000000 12345",
                 "ha.entity.state 1.000000 12345",
@@ -143,7 +156,7 @@ class TestGraphite(unittest.TestCase):
 
         state.state = STATE_OFF
         with mock.patch.object(self.gf, "_send_to_graphite") as mock_send:
-            self.gf._report_attributes("entity", state)
+            self.gf._report_attributes([("entity", state)])
             expected = [
                 "ha.entity.foo 1.000000 12345",
                 "ha.entity.state 0.000000 12345",
@@ -158,9 +171,41 @@ class TestGraphite(unittest.TestCase):
         state = ha.State("domain.entity", STATE_ON, {"foo": 1.0})
         with mock.patch.object(self.gf, "_send_to_graphite") as mock_send:
             mock_send.side_effect = socket.error
-            self.gf._report_attributes("entity", state)
+            self.gf._report_attributes([("entity", state)])
             mock_send.side_effect = socket.gaierror
-            self.gf._report_attributes("entity", state)
+            self.gf._report_attributes([("entity", state)])
+
+    @patch("time.time")
+    def test_report_batch(self, mock_time):
+        """Test the states of a batch are sent in one write."""
+        mock_time.return_value = 12345
+        states = [
+            ("entity1", ha.State("domain.entity1", STATE_ON)),
+            ("entity2", ha.State("domain.entity2", "2.5", {"foo": 1.0})),
+        ]
+        with mock.patch.object(self.gf, "_send_to_graphite") as mock_send:
+            self.gf._report_attributes(states)
+            assert mock_send.call_count == 1
+            expected = [
+                "ha.entity1.state 1.000000 12345",
+                "ha.entity2.foo 1.000000 12345",
+                "ha.entity2.state 2.500000 12345",
+            ]
+            actual = mock_send.call_args_list[0][0][0].split("\n")
+            assert sorted(expected) == sorted(actual)
+
+    @patch("time.time")
+    def test_report_batch_with_bad_state(self, mock_time):
+        """Test a state that fails to be reported does not drop the batch."""
+        mock_time.return_value = 12345
+        states = [
+            ("entity1", ha.State("domain.entity1", "1", {1: 2.0})),
+            ("entity2", ha.State("domain.entity2", "2.5")),
+        ]
+        with mock.patch.object(self.gf, "_send_to_graphite") as mock_send:
+            self.gf._report_attributes(states)
+            assert mock_send.call_count == 1
+            assert mock_send.call_args == mock.call("ha.entity2.state 2.500000 12345")
 
     @patch("socket.socket")
     def test_send_to_graphite(self, mock_socket):
@@ -195,23 +240,29 @@ class TestGraphite(unittest.TestCase):
             event_type=EVENT_STATE_CHANGED,
             data={"entity_id": "entity", "new_state": mock.MagicMock()},
         )
+        no_state = mock.MagicMock(
+            event_type=EVENT_STATE_CHANGED,
+            data={"entity_id": "entity", "new_state": None},
+        )
 
         def fake_get():
             if len(runs) >= 2:
                 return self.gf._quit_object
             if runs:
                 runs.append(1)
-                return mock.MagicMock(
-                    event_type="somethingelse", data={"new_event": None}
-                )
+                return [
+                    mock.MagicMock(event_type="somethingelse", data={"new_event": None})
+                ]
             runs.append(1)
-            return event
+            return [event, no_state]
 
         with mock.patch.object(self.gf, "_queue") as mock_queue:
             with mock.patch.object(self.gf, "_report_attributes") as mock_r:
                 mock_queue.get.side_effect = fake_get
                 self.gf.run()
-                # Twice for two events, once for the stop
+                # Twice for two batches, once for the stop
                 assert mock_queue.task_done.call_count == 3
                 assert mock_r.call_count == 1
-                assert mock_r.call_args == mock.call("entity", event.data["new_state"])
+                assert mock_r.call_args == mock.call(
+                    [("entity", event.data["new_state"])]
+                )
@@ -256,8 +256,8 @@ async def test_open_covers(hass, setup_comp):
         DOMAIN, SERVICE_OPEN_COVER, {ATTR_ENTITY_ID: COVER_GROUP}, blocking=True
     )
 
-    for _ in range(10):
-        future = dt_util.utcnow() + timedelta(seconds=1)
+    for seconds in range(1, 11):
+        future = dt_util.utcnow() + timedelta(seconds=seconds)
         async_fire_time_changed(hass, future)
         await hass.async_block_till_done()
 
@@ -277,8 +277,8 @@ async def test_close_covers(hass, setup_comp):
         DOMAIN, SERVICE_CLOSE_COVER, {ATTR_ENTITY_ID: COVER_GROUP}, blocking=True
     )
 
-    for _ in range(10):
-        future = dt_util.utcnow() + timedelta(seconds=1)
+    for seconds in range(1, 11):
+        future = dt_util.utcnow() + timedelta(seconds=seconds)
         async_fire_time_changed(hass, future)
         await hass.async_block_till_done()
 
@@ -298,8 +298,8 @@ async def test_toggle_covers(hass, setup_comp):
     await hass.services.async_call(
         DOMAIN, SERVICE_OPEN_COVER, {ATTR_ENTITY_ID: COVER_GROUP}, blocking=True
     )
-    for _ in range(10):
-        future = dt_util.utcnow() + timedelta(seconds=1)
+    for seconds in range(1, 11):
+        future = dt_util.utcnow() + timedelta(seconds=seconds)
         async_fire_time_changed(hass, future)
         await hass.async_block_till_done()
 
@@ -310,8 +310,8 @@ async def test_toggle_covers(hass, setup_comp):
     await hass.services.async_call(
         DOMAIN, SERVICE_TOGGLE, {ATTR_ENTITY_ID: COVER_GROUP}, blocking=True
     )
-    for _ in range(10):
-        future = dt_util.utcnow() + timedelta(seconds=1)
+    for seconds in range(1, 11):
+        future = dt_util.utcnow() + timedelta(seconds=seconds)
         async_fire_time_changed(hass, future)
         await hass.async_block_till_done()
 
@@ -327,8 +327,8 @@ async def test_toggle_covers(hass, setup_comp):
     await hass.services.async_call(
         DOMAIN, SERVICE_TOGGLE, {ATTR_ENTITY_ID: COVER_GROUP}, blocking=True
     )
-    for _ in range(10):
-        future = dt_util.utcnow() + timedelta(seconds=1)
+    for seconds in range(1, 11):
+        future = dt_util.utcnow() + timedelta(seconds=seconds)
         async_fire_time_changed(hass, future)
         await hass.async_block_till_done()
 
@@ -376,8 +376,8 @@ async def test_set_cover_position(hass, setup_comp):
         {ATTR_ENTITY_ID: COVER_GROUP, ATTR_POSITION: 50},
         blocking=True,
     )
-    for _ in range(4):
-        future = dt_util.utcnow() + timedelta(seconds=1)
+    for seconds in range(1, 5):
+        future = dt_util.utcnow() + timedelta(seconds=seconds)
         async_fire_time_changed(hass, future)
         await hass.async_block_till_done()
 
@@ -396,8 +396,8 @@ async def test_open_tilts(hass, setup_comp):
     await hass.services.async_call(
         DOMAIN, SERVICE_OPEN_COVER_TILT, {ATTR_ENTITY_ID: COVER_GROUP}, blocking=True
     )
-    for _ in range(5):
-        future = dt_util.utcnow() + timedelta(seconds=1)
+    for seconds in range(1, 6):
+        future = dt_util.utcnow() + timedelta(seconds=seconds)
         async_fire_time_changed(hass, future)
         await hass.async_block_till_done()
 
@@ -416,8 +416,8 @@ async def test_close_tilts(hass, setup_comp):
     await hass.services.async_call(
         DOMAIN, SERVICE_CLOSE_COVER_TILT, {ATTR_ENTITY_ID: COVER_GROUP}, blocking=True
     )
-    for _ in range(5):
-        future = dt_util.utcnow() + timedelta(seconds=1)
+    for seconds in range(1, 6):
+        future = dt_util.utcnow() + timedelta(seconds=seconds)
         async_fire_time_changed(hass, future)
         await hass.async_block_till_done()
 
@@ -435,8 +435,8 @@ async def test_toggle_tilts(hass, setup_comp):
     await hass.services.async_call(
         DOMAIN, SERVICE_OPEN_COVER_TILT, {ATTR_ENTITY_ID: COVER_GROUP}, blocking=True
     )
-    for _ in range(10):
-        future = dt_util.utcnow() + timedelta(seconds=1)
+    for seconds in range(1, 11):
+        future = dt_util.utcnow() + timedelta(seconds=seconds)
         async_fire_time_changed(hass, future)
         await hass.async_block_till_done()
 
@@ -452,8 +452,8 @@ async def test_toggle_tilts(hass, setup_comp):
     await hass.services.async_call(
         DOMAIN, SERVICE_TOGGLE_COVER_TILT, {ATTR_ENTITY_ID: COVER_GROUP}, blocking=True
     )
-    for _ in range(10):
-        future = dt_util.utcnow() + timedelta(seconds=1)
+    for seconds in range(1, 11):
+        future = dt_util.utcnow() + timedelta(seconds=seconds)
         async_fire_time_changed(hass, future)
         await hass.async_block_till_done()
 
@@ -467,8 +467,8 @@ async def test_toggle_tilts(hass, setup_comp):
     await hass.services.async_call(
         DOMAIN, SERVICE_TOGGLE_COVER_TILT, {ATTR_ENTITY_ID: COVER_GROUP}, blocking=True
     )
-    for _ in range(10):
-        future = dt_util.utcnow() + timedelta(seconds=1)
+    for seconds in range(1, 11):
+        future = dt_util.utcnow() + timedelta(seconds=seconds)
         async_fire_time_changed(hass, future)
         await hass.async_block_till_done()
 
@@ -514,8 +514,8 @@ async def test_set_tilt_positions(hass, setup_comp):
         {ATTR_ENTITY_ID: COVER_GROUP, ATTR_TILT_POSITION: 80},
         blocking=True,
     )
-    for _ in range(3):
-        future = dt_util.utcnow() + timedelta(seconds=1)
+    for seconds in range(1, 4):
+        future = dt_util.utcnow() + timedelta(seconds=seconds)
         async_fire_time_changed(hass, future)
         await hass.async_block_till_done()
 
@@ -538,8 +538,8 @@ async def test_is_opening_closing(hass, setup_comp):
     assert hass.states.get(DEMO_COVER_TILT).state == STATE_OPENING
     assert hass.states.get(COVER_GROUP).state == STATE_OPENING
 
-    for _ in range(10):
-        future = dt_util.utcnow() + timedelta(seconds=1)
+    for seconds in range(1, 11):
+        future = dt_util.utcnow() + timedelta(seconds=seconds)
         async_fire_time_changed(hass, future)
         await hass.async_block_till_done()
 
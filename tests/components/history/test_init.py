@@ -6,7 +6,11 @@ import json
 import unittest
 from unittest.mock import patch, sentinel
 
+from aiohttp import ClientPayloadError
+import pytest
+
 from homeassistant.components import history, recorder
+from homeassistant.components.recorder import statistics
 from homeassistant.components.recorder.models import process_timestamp
 import homeassistant.core as ha
 from homeassistant.helpers.json import JSONEncoder
@@ -390,6 +394,27 @@ class TestComponentHistory(unittest.TestCase):
         )
         self.check_significant_states(zero, four, states, config)
 
+    def test_significant_states_query_uses_metadata_id(self):
+        """Test filters and sorting use the metadata_id once all states have one."""
+        self.init_recorder()
+        assert setup_component(self.hass, history.DOMAIN, {})
+        assert self.hass.data[recorder.DATA_INSTANCE].states_meta_migrated
+
+        filters = history.Filters()
+        filters.included_entities = ["media_player.test"]
+        filters.included_entity_globs = ["thermostat.*"]
+        with recorder.session_scope(hass=self.hass) as session:
+            sql = str(
+                history._significant_states_query(
+                    self.hass, session, dt_util.utcnow(), None, None, filters, True
+                )
+            )
+
+        assert "ORDER BY states.metadata_id, states.last_updated_ts" in sql
+        assert "states.entity_id IN" not in sql
+        assert "states.entity_id LIKE" not in sql
+        assert "states_meta.entity_id LIKE" in sql
+
     def test_get_significant_states_exclude(self):
         """Test significant states when excluding entities and domains.
 
@@ -1008,3 +1033,406 @@ async def test_entity_ids_limit_via_api_with_skip_initial_state(hass, hass_clien
     assert len(response_json) == 2
     assert response_json[0][0]["entity_id"] == "light.kitchen"
     assert response_json[1][0]["entity_id"] == "light.cow"
+
+
+async def test_fetch_period_api_with_use_statistics(hass, hass_client):
+    """Test wide windows are served from statistics where available."""
+    await hass.async_add_executor_job(init_recorder_component, hass)
+    await async_setup_component(hass, "history", {})
+    instance = hass.data[recorder.DATA_INSTANCE]
+    await hass.async_add_executor_job(instance.block_till_done)
+    start = statistics.get_start_time(dt_util.utcnow() + timedelta(minutes=5))
+    hass.states.async_set("sensor.power", "10", {"unit_of_measurement": "W"})
+    hass.states.async_set("light.kitchen", "on")
+    await hass.async_block_till_done()
+    await hass.async_add_executor_job(trigger_db_commit, hass)
+    await hass.async_block_till_done()
+    await hass.async_add_executor_job(instance.block_till_done)
+    await hass.async_add_executor_job(statistics.compile_statistics, instance, start)
+
+    client = await hass_client()
+    end = start + timedelta(days=1)
+    response = await client.get(
+        f"/api/history/period/{start.isoformat()}",
+        params={
+            "end_time": end.isoformat(),
+            "filter_entity_id": "sensor.power,light.kitchen",
+            "use_statistics": "",
+        },
+    )
+    assert response.status == 200
+    response_json = await response.json()
+    assert len(response_json) == 2
+    assert response_json[0][0]["statistic_id"] == "sensor.power"
+    assert response_json[0][0]["mean"] == pytest.approx(10.0)
+    assert response_json[1][0]["entity_id"] == "light.kitchen"
+
+    # Short windows keep returning states
+    response = await client.get(
+        f"/api/history/period/{start.isoformat()}",
+        params={
+            "end_time": (start + timedelta(hours=1)).isoformat(),
+            "filter_entity_id": "sensor.power",
+            "use_statistics": "",
+        },
+    )
+    assert response.status == 200
+    response_json = await response.json()
+    assert response_json[0][0]["entity_id"] == "sensor.power"
+
+
+async def _record_states(hass, changes):
+    """Record state changes and wait for them to be committed."""
+    for entity_id, state in changes:
+        hass.states.async_set(entity_id, state)
+    await hass.async_block_till_done()
+    await hass.async_add_executor_job(trigger_db_commit, hass)
+    await hass.async_block_till_done()
+    await hass.async_add_executor_job(hass.data[recorder.DATA_INSTANCE].block_till_done)
+
+
+@pytest.mark.parametrize("query", ["", "&minimal_response"])
+async def test_fetch_period_api_stream(hass, hass_client, query):
+    """Test the streamed history matches the history in one response."""
+    await hass.async_add_executor_job(init_recorder_component, hass)
+    await async_setup_component(hass, "history", {})
+    await _record_states(hass, [("sensor.initial", "on"), ("sensor.a", "0")])
+    start_time = dt_util.utcnow()
+    await _record_states(
+        hass,
+        [
+            ("sensor.b", "1"),
+            ("sensor.a", "1"),
+            ("sensor.a", "2"),
+            ("sensor.b", "2"),
+            ("sensor.a", "3"),
+        ],
+    )
+
+    client = await hass_client()
+    url = f"/api/history/period/{start_time.isoformat()}?{query}"
+    response = await client.get(url)
+    assert response.status == 200
+    expected = sorted(await response.json(), key=lambda states: states[0]["entity_id"])
+
+    with patch("homeassistant.components.history.STREAM_CHUNK_SIZE", 2):
+        response = await client.get(f"{url}&stream")
+    assert response.status == 200
+    assert response.headers["Content-Type"] == "application/json"
+    assert await response.json() == expected
+    assert [states[0]["entity_id"] for states in expected] == [
+        "sensor.a",
+        "sensor.b",
+        "sensor.initial",
+    ]
+    assert len(expected[0]) == 4
+
+
+async def test_fetch_period_api_stream_empty(hass, hass_client):
+    """Test streaming a period without states."""
+    await hass.async_add_executor_job(init_recorder_component, hass)
+    await async_setup_component(hass, "history", {})
+    await hass.async_add_executor_job(hass.data[recorder.DATA_INSTANCE].block_till_done)
+
+    client = await hass_client()
+    response = await client.get(
+        f"/api/history/period/{dt_util.utcnow().isoformat()}?stream&skip_initial_state"
+    )
+    assert response.status == 200
+    assert await response.json() == []
+
+
+async def test_fetch_period_api_stream_error(hass, hass_client, caplog):
+    """Test a stream failing part way through is aborted."""
+    await hass.async_add_executor_job(init_recorder_component, hass)
+    await async_setup_component(hass, "history", {})
+    start_time = dt_util.utcnow()
+    await _record_states(
+        hass, [("sensor.a", "1"), ("sensor.a", "2"), ("sensor.a", "3")]
+    )
+    await _record_states(hass, [("sensor.b", "1"), ("sensor.b", "2")])
+    entity_states = history._entity_states
+
+    def _failing_entity_states(start_state, group, minimal_response):
+        """Fail after the states of the first entity."""
+        states = entity_states(start_state, group, minimal_response)
+        first_state = next(states)
+        if first_state.entity_id == "sensor.b":
+            raise ValueError("query failed")
+        yield first_state
+        yield from states
+
+    client = await hass_client()
+    with patch("homeassistant.components.history.STREAM_CHUNK_SIZE", 2), patch(
+        "homeassistant.components.history._entity_states",
+        side_effect=_failing_entity_states,
+    ):
+        response = await client.get(
+            f"/api/history/period/{start_time.isoformat()}?stream&skip_initial_state"
+        )
+        assert response.status == 200
+        with pytest.raises(ClientPayloadError):
+            await response.read()
+
+    assert "Error streaming history" in caplog.text
+
+
+async def test_fetch_period_api_compact(hass, hass_client):
+    """Test the history in the compact columnar format."""
+    await hass.async_add_executor_job(init_recorder_component, hass)
+    await async_setup_component(hass, "history", {})
+    await _record_states(hass, [("sensor.a", "0")])
+    start_time = dt_util.utcnow()
+    await _record_states(
+        hass,
+        [
+            ("sensor.a", "1.5"),
+            ("sensor.a", "1.5"),
+            ("sensor.a", "unavailable"),
+            ("sensor.b", "on"),
+        ],
+    )
+    hass.states.async_set("sensor.a", "2", {"unit_of_measurement": "W"})
+    await _record_states(hass, [])
+
+    client = await hass_client()
+    response = await client.get(
+        f"/api/history/period/{start_time.isoformat()}?compact"
+        "&filter_entity_id=sensor.b,sensor.a"
+    )
+    assert response.status == 200
+    result = await response.json()
+    assert list(result) == ["sensor.b", "sensor.a"]
+
+    sensor_a = result["sensor.a"]
+    assert sensor_a["v"] == [0.0, 1.5, "unavailable", 2.0]
+    assert sensor_a["a"] == {"unit_of_measurement": "W"}
+    assert "av" not in sensor_a
+    assert sensor_a["t"][0] == round(start_time.timestamp() * 1000)
+    assert all(delta >= 0 for delta in sensor_a["t"][1:])
+
+    state = hass.states.get("sensor.a")
+    assert sum(sensor_a["t"]) == round(state.last_updated.timestamp() * 1000)
+    assert result["sensor.b"] == {
+        "t": [round(hass.states.get("sensor.b").last_updated.timestamp() * 1000)],
+        "v": ["on"],
+        "a": {},
+    }
+
+
+def test_compact_value():
+    """Test only finite numeric states are parsed."""
+    assert history._compact_value("1") == 1.0
+    assert history._compact_value("-2.5") == -2.5
+    assert history._compact_value("on") == "on"
+    assert history._compact_value("nan") == "nan"
+    assert history._compact_value("inf") == "inf"
+    assert history._compact_value(None) is None
+
+
+@pytest.mark.parametrize("compact", [False, True])
+async def test_history_during_period_websocket(hass, hass_ws_client, compact):
+    """Test fetching the history of a period over websocket."""
+    await hass.async_add_executor_job(init_recorder_component, hass)
+    await async_setup_component(hass, "history", {})
+    start_time = dt_util.utcnow()
+    await _record_states(hass, [("sensor.a", "1"), ("sensor.a", "2")])
+
+    client = await hass_ws_client(hass)
+    await client.send_json(
+        {
+            "id": 1,
+            "type": "history/history_during_period",
+            "start_time": start_time.isoformat(),
+            "entity_ids": ["sensor.a"],
+            "compact": compact,
+        }
+    )
+    response = await client.receive_json()
+    assert response["success"]
+    result = response["result"]
+    assert list(result) == ["sensor.a"]
+    if compact:
+        assert result["sensor.a"]["v"] == [1.0, 2.0]
+    else:
+        assert [state["state"] for state in result["sensor.a"]] == ["1", "2"]
+
+
+async def test_history_during_period_websocket_bad_times(hass, hass_ws_client):
+    """Test invalid and future times over websocket."""
+    await hass.async_add_executor_job(init_recorder_component, hass)
+    await async_setup_component(hass, "history", {})
+    client = await hass_ws_client(hass)
+
+    await client.send_json(
+        {"id": 1, "type": "history/history_during_period", "start_time": "cats"}
+    )
+    response = await client.receive_json()
+    assert not response["success"]
+    assert response["error"]["code"] == "invalid_start_time"
+
+    now = dt_util.utcnow()
+    await client.send_json(
+        {
+            "id": 2,
+            "type": "history/history_during_period",
+            "start_time": now.isoformat(),
+            "end_time": "cats",
+        }
+    )
+    response = await client.receive_json()
+    assert response["error"]["code"] == "invalid_end_time"
+
+    await client.send_json(
+        {
+            "id": 3,
+            "type": "history/history_during_period",
+            "start_time": (now + timedelta(days=1)).isoformat(),
+        }
+    )
+    response = await client.receive_json()
+    assert response["success"]
+    assert response["result"] == {}
+
+
+async def test_history_stream_websocket(hass, hass_ws_client):
+    """Test the history is followed by live changes without gaps or duplicates."""
+    await hass.async_add_executor_job(init_recorder_component, hass)
+    await async_setup_component(hass, "history", {})
+    start_time = dt_util.utcnow()
+    await _record_states(hass, [("sensor.a", "1"), ("sensor.b", "1")])
+    # Not committed by the recorder yet
+    hass.states.async_set("sensor.a", "2")
+
+    client = await hass_ws_client(hass)
+    await client.send_json(
+        {
+            "id": 1,
+            "type": "history/stream",
+            "start_time": start_time.isoformat(),
+            "entity_ids": ["sensor.a"],
+        }
+    )
+    response = await client.receive_json()
+    assert response["success"]
+
+    response = await client.receive_json()
+    history_states = response["event"]["states"]
+    assert list(history_states) == ["sensor.a"]
+    assert [state["state"] for state in history_states["sensor.a"]] == ["1"]
+
+    response = await client.receive_json()
+    assert [state["state"] for state in response["event"]["states"]["sensor.a"]] == [
+        "2"
+    ]
+
+    # Attribute changes are not significant for sensors
+    hass.states.async_set("sensor.a", "2", {"unit_of_measurement": "W"})
+    hass.states.async_set("sensor.b", "2")
+    hass.states.async_set("sensor.a", "3")
+    response = await client.receive_json()
+    assert [state["state"] for state in response["event"]["states"]["sensor.a"]] == [
+        "3"
+    ]
+
+    await client.send_json({"id": 2, "type": "unsubscribe_events", "subscription": 1})
+    response = await client.receive_json()
+    assert response["success"]
+
+
+async def test_history_stream_websocket_no_duplicates(hass, hass_ws_client):
+    """Test committed changes are not sent again after the history."""
+    await hass.async_add_executor_job(init_recorder_component, hass)
+    await async_setup_component(hass, "history", {})
+    start_time = dt_util.utcnow()
+    await _record_states(hass, [("sensor.a", "1"), ("sensor.a", "2")])
+
+    client = await hass_ws_client(hass)
+    await client.send_json(
+        {
+            "id": 1,
+            "type": "history/stream",
+            "start_time": start_time.isoformat(),
+            "entity_ids": ["sensor.a"],
+        }
+    )
+    assert (await client.receive_json())["success"]
+    response = await client.receive_json()
+    assert [state["state"] for state in response["event"]["states"]["sensor.a"]] == [
+        "1",
+        "2",
+    ]
+
+    hass.states.async_set("sensor.a", "3")
+    response = await client.receive_json()
+    assert [state["state"] for state in response["event"]["states"]["sensor.a"]] == [
+        "3"
+    ]
+
+
+async def test_history_stream_websocket_change_during_query(hass, hass_ws_client):
+    """Test a change while the history is fetched is sent after it."""
+    await hass.async_add_executor_job(init_recorder_component, hass)
+    await async_setup_component(hass, "history", {})
+    start_time = dt_util.utcnow()
+    await _record_states(hass, [("sensor.a", "1")])
+    stream_history = history._stream_history
+
+    def _stream_history_with_change(*args):
+        """Change the state after subscribing, before the history is fetched."""
+        # Executor jobs run in the event loop in tests
+        hass.states.async_set("sensor.a", "2")
+        return stream_history(*args)
+
+    client = await hass_ws_client(hass)
+    with patch(
+        "homeassistant.components.history._stream_history",
+        side_effect=_stream_history_with_change,
+    ):
+        await client.send_json(
+            {
+                "id": 1,
+                "type": "history/stream",
+                "start_time": start_time.isoformat(),
+                "entity_ids": ["sensor.a"],
+            }
+        )
+        assert (await client.receive_json())["success"]
+        response = await client.receive_json()
+        assert [
+            state["state"] for state in response["event"]["states"]["sensor.a"]
+        ] == ["1"]
+        response = await client.receive_json()
+        assert [
+            state["state"] for state in response["event"]["states"]["sensor.a"]
+        ] == ["2"]
+
+
+async def test_history_stream_websocket_current_state_significant(hass, hass_ws_client):
+    """Test the current state is not sent when only its attributes changed."""
+    await hass.async_add_executor_job(init_recorder_component, hass)
+    await async_setup_component(hass, "history", {})
+    start_time = dt_util.utcnow()
+    await _record_states(hass, [("sensor.a", "1")])
+    hass.states.async_set("sensor.a", "1", {"unit_of_measurement": "W"})
+
+    client = await hass_ws_client(hass)
+    await client.send_json(
+        {
+            "id": 1,
+            "type": "history/stream",
+            "start_time": start_time.isoformat(),
+            "entity_ids": ["sensor.a"],
+        }
+    )
+    assert (await client.receive_json())["success"]
+    response = await client.receive_json()
+    assert [state["state"] for state in response["event"]["states"]["sensor.a"]] == [
+        "1"
+    ]
+
+    hass.states.async_set("sensor.a", "2")
+    response = await client.receive_json()
+    assert [state["state"] for state in response["event"]["states"]["sensor.a"]] == [
+        "2"
+    ]
@@ -10,7 +10,7 @@ from homeassistant.components.homeassistant.triggers import (
     numeric_state as numeric_state_trigger,
 )
 from homeassistant.const import ATTR_ENTITY_ID, ENTITY_MATCH_ALL, SERVICE_TURN_OFF
-from homeassistant.core import Context
+from homeassistant.core import Context, callback
 from homeassistant.setup import async_setup_component
 import homeassistant.util.dt as dt_util
 
@@ -1621,3 +1621,134 @@ async def test_attribute_if_not_fires_on_entities_change_with_for_after_stop(
     async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=10))
     await hass.async_block_till_done()
     assert len(calls) == 1
+
+
+async def test_if_fires_on_thresholds_crossed(hass, calls):
+    """Test triggers sharing an entity only fire when their threshold is crossed."""
+    hass.states.async_set("test.entity", 5)
+
+    assert await async_setup_component(
+        hass,
+        automation.DOMAIN,
+        {
+            automation.DOMAIN: [
+                {
+                    "trigger": {
+                        "platform": "numeric_state",
+                        "entity_id": "test.entity",
+                        "above": above,
+                    },
+                    "action": {
+                        "service": "test.automation",
+                        "data_template": {"above": "{{ trigger.above }}"},
+                    },
+                }
+                for above in range(10)
+            ]
+        },
+    )
+    await hass.async_block_till_done()
+    assert list(hass.data[numeric_state_trigger.DATA_NUMERIC_STATE_INDEX]) == [
+        ("test.entity", None)
+    ]
+
+    async def fired(value):
+        """Set the state and return the thresholds of the triggers fired."""
+        calls.clear()
+        hass.states.async_set("test.entity", value)
+        await hass.async_block_till_done()
+        return sorted(int(call.data["above"]) for call in calls)
+
+    assert await fired(6) == [0, 1, 2, 3, 4, 5]
+    assert await fired(8) == [6, 7]
+    assert await fired(7) == []
+    assert await fired(3) == []
+    assert await fired(9) == [3, 4, 5, 6, 7, 8]
+    assert await fired("unavailable") == []
+    assert await fired(4) == [0, 1, 2, 3]
+    assert await fired("bla") == []
+    assert await fired(1) == [0]
+
+    await hass.services.async_call(
+        automation.DOMAIN,
+        SERVICE_TURN_OFF,
+        {ATTR_ENTITY_ID: ENTITY_MATCH_ALL},
+        blocking=True,
+    )
+    assert hass.data[numeric_state_trigger.DATA_NUMERIC_STATE_INDEX] == {}
+    assert await fired(10) == []
+
+
+async def test_if_fires_on_thresholds_crossed_with_invalid_for_template(hass, calls):
+    """Test a trigger which failed to render its for template is checked again."""
+    hass.states.async_set("test.entity", 5)
+
+    assert await async_setup_component(
+        hass,
+        automation.DOMAIN,
+        {
+            automation.DOMAIN: {
+                "trigger": {
+                    "platform": "numeric_state",
+                    "entity_id": "test.entity",
+                    "above": 8,
+                    "for": "{{ states('test.delay') }}",
+                },
+                "action": {"service": "test.automation"},
+            }
+        },
+    )
+
+    hass.states.async_set("test.entity", 9)
+    await hass.async_block_till_done()
+    hass.states.async_set("test.delay", 5)
+    hass.states.async_set("test.entity", 10)
+    await hass.async_block_till_done()
+    assert len(calls) == 0
+
+    async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=10))
+    await hass.async_block_till_done()
+    assert len(calls) == 1
+
+
+async def test_if_fires_on_thresholds_crossed_with_failing_trigger(hass, caplog):
+    """Test a trigger raising an error does not stop the other triggers."""
+    hass.states.async_set("test.entity", 5)
+    fired = []
+
+    @callback
+    def failing_action(variables, context=None):
+        """Raise an error."""
+        raise ValueError("failed")
+
+    @callback
+    def action(variables, context=None):
+        """Record the trigger."""
+        fired.append(variables["trigger"]["above"])
+
+    unsubs = [
+        await numeric_state_trigger.async_attach_trigger(
+            hass,
+            numeric_state_trigger.TRIGGER_SCHEMA(
+                {"platform": "numeric_state", "entity_id": "test.entity", "above": 6}
+            ),
+            failing_action,
+            {"name": "failing"},
+        ),
+        await numeric_state_trigger.async_attach_trigger(
+            hass,
+            numeric_state_trigger.TRIGGER_SCHEMA(
+                {"platform": "numeric_state", "entity_id": "test.entity", "above": 7}
+            ),
+            action,
+            {"name": "working"},
+        ),
+    ]
+
+    hass.states.async_set("test.entity", 8)
+    await hass.async_block_till_done()
+    assert fired == [7]
+    assert "Error in numeric_state trigger for test.entity" in caplog.text
+
+    for unsub in unsubs:
+        unsub()
@@ -11,10 +11,16 @@ from homeassistant.components.profiler import (
     SERVICE_DUMP_LOG_OBJECTS,
     SERVICE_MEMORY,
     SERVICE_START,
+    SERVICE_START_JOB_STATS,
     SERVICE_START_LOG_OBJECTS,
+    SERVICE_STOP_JOB_STATS,
     SERVICE_STOP_LOG_OBJECTS,
 )
 from homeassistant.components.profiler.const import DOMAIN
+from homeassistant.const import STATE_UNAVAILABLE
+from homeassistant.core import callback
+from homeassistant.helpers.event import TrackTemplate, async_track_template_result
+from homeassistant.helpers.template import Template
 import homeassistant.util.dt as dt_util
 
 from tests.common import MockConfigEntry, async_fire_time_changed
@@ -147,3 +153,69 @@ async def test_dump_log_object(hass, caplog):
 
     assert await hass.config_entries.async_unload(entry.entry_id)
     await hass.async_block_till_done()
+
+
+async def test_job_stats(hass, hass_ws_client):
+    """Test the job stats are collected between the start and stop services."""
+    entry = MockConfigEntry(domain=DOMAIN)
+    entry.add_to_hass(hass)
+
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    client = await hass_ws_client()
+    await client.send_json({"id": 1, "type": "profiler/job_stats"})
+    response = await client.receive_json()
+    assert response["success"]
+    assert response["result"] == {"enabled": False}
+    assert hass.states.get("sensor.event_loop_lag").state == STATE_UNAVAILABLE
+
+    await hass.services.async_call(DOMAIN, SERVICE_START_JOB_STATS, blocking=True)
+    assert hass.job_stats is not None
+    hass.bus.async_listen("test_event", callback(lambda event: None))
+    hass.bus.async_fire("test_event")
+    await hass.async_block_till_done()
+
+    await client.send_json({"id": 2, "type": "profiler/job_stats"})
+    response = await client.receive_json()
+    assert response["success"]
+    assert response["result"]["enabled"]
+    assert __name__ in response["result"]["integrations"]
+
+    async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=31))
+    await hass.async_block_till_done()
+    state = hass.states.get("sensor.event_loop_lag")
+    assert state.state != STATE_UNAVAILABLE
+    assert "slowest_integrations" in state.attributes
+
+    await hass.services.async_call(DOMAIN, SERVICE_STOP_JOB_STATS, blocking=True)
+    assert hass.job_stats is None
+
+    await hass.services.async_call(DOMAIN, SERVICE_START_JOB_STATS, blocking=True)
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
+    assert hass.job_stats is None
+
+
+async def test_template_stats(hass, hass_ws_client):
+    """Test the render time of tracked templates is returned."""
+    entry = MockConfigEntry(domain=DOMAIN)
+    entry.add_to_hass(hass)
+
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    async_track_template_result(
+        hass,
+        [TrackTemplate(Template("{{ states('sensor.test') }}", hass), None)],
+        lambda event, updates: None,
+    )
+
+    client = await hass_ws_client()
+    await client.send_json({"id": 1, "type": "profiler/template_stats"})
+    response = await client.receive_json()
+    assert response["success"]
+    stats = response["result"]["templates"]["{{ states('sensor.test') }}"]
+    assert stats["renders"] == 1
+    assert stats["executor_renders"] == 0
+    assert not stats["slow"]
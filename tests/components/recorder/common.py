@@ -1,11 +1,7 @@
 """Common test utils for working with recorder."""
 
-from datetime import timedelta
-
 from homeassistant.components import recorder
-from homeassistant.util import dt as dt_util
-
-from tests.common import fire_time_changed
+from homeassistant.util.async_ import run_callback_threadsafe
 
 
 def wait_recording_done(hass):
@@ -18,6 +14,7 @@ def wait_recording_done(hass):
 
 def trigger_db_commit(hass):
     """Force the recorder to commit."""
-    for _ in range(recorder.DEFAULT_COMMIT_INTERVAL):
-        # We only commit on time change
-        fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=1))
+    # Queued from the event loop so it follows the events fired before
+    run_callback_threadsafe(
+        hass.loop, hass.data[recorder.DATA_INSTANCE].queue.put, recorder.CommitTask()
+    ).result()
@@ -0,0 +1,104 @@
+"""The tests for the recorder backlog queue."""
+import threading
+
+from homeassistant.components.recorder import PurgeTask
+from homeassistant.components.recorder.backlog import (
+    POLICY_COALESCE_STATES,
+    POLICY_DROP_OLDEST,
+    POLICY_PAUSE_EVENTS,
+    RecorderQueue,
+)
+from homeassistant.const import EVENT_STATE_CHANGED
+from homeassistant.core import Event
+
+
+def _state_changed(entity_id, state):
+    """Return a state changed event."""
+    return Event(EVENT_STATE_CHANGED, {"entity_id": entity_id, "state": state})
+
+
+def _drain(rec_queue):
+    """Return everything waiting in the queue."""
+    items = []
+    while not rec_queue.empty():
+        items.append(rec_queue.get())
+    return items
+
+
+def test_unbounded_queue():
+    """Test a max_backlog of 0 never drops events."""
+    rec_queue = RecorderQueue()
+    for idx in range(100):
+        rec_queue.put(Event("test", {"idx": idx}))
+
+    assert rec_queue.backlog == 100
+    assert rec_queue.dropped == 0
+    assert [event.data["idx"] for event in _drain(rec_queue)] == list(range(100))
+    assert rec_queue.backlog == 0
+    assert rec_queue.peak_backlog == 100
+
+
+def test_drop_oldest():
+    """Test the oldest events are dropped and tasks are kept."""
+    rec_queue = RecorderQueue(3, POLICY_DROP_OLDEST)
+    task = PurgeTask(1, False)
+    rec_queue.put(task)
+    for idx in range(5):
+        rec_queue.put(Event("test", {"idx": idx}))
+
+    assert rec_queue.backlog == 3
+    assert rec_queue.qsize() == 4
+    assert rec_queue.dropped == 2
+    items = _drain(rec_queue)
+    assert items[0] is task
+    assert [event.data["idx"] for event in items[1:]] == [2, 3, 4]
+
+
+def test_coalesce_states():
+    """Test state changes of the same entity are coalesced when full."""
+    rec_queue = RecorderQueue(2, POLICY_COALESCE_STATES)
+    rec_queue.put(_state_changed("sensor.a", "1"))
+    rec_queue.put(_state_changed("sensor.b", "1"))
+    rec_queue.put(_state_changed("sensor.a", "2"))
+    rec_queue.put(_state_changed("sensor.a", "3"))
+
+    assert rec_queue.backlog == 2
+    assert rec_queue.coalesced == 2
+    assert rec_queue.dropped == 0
+
+    # Nothing to coalesce into, the oldest event is dropped
+    rec_queue.put(Event("test"))
+    assert rec_queue.dropped == 1
+
+    items = _drain(rec_queue)
+    assert [item.data.get("state") for item in items] == ["1", None]
+    assert items[0].data["entity_id"] == "sensor.b"
+
+    # The dropped state change is no longer coalesced into
+    rec_queue.put(_state_changed("sensor.a", "4"))
+    assert [item.data["state"] for item in _drain(rec_queue)] == ["4"]
+
+
+def test_pause_events():
+    """Test events other than state changes are dropped when full."""
+    rec_queue = RecorderQueue(2, POLICY_PAUSE_EVENTS)
+    rec_queue.put(Event("test", {"idx": 0}))
+    rec_queue.put(_state_changed("sensor.a", "1"))
+    rec_queue.put(Event("test", {"idx": 1}))
+
+    assert rec_queue.dropped == 1
+    assert rec_queue.backlog == 2
+
+    rec_queue.put(_state_changed("sensor.a", "2"))
+    assert rec_queue.dropped == 2
+    assert [item.data["state"] for item in _drain(rec_queue)] == ["1", "2"]
+
+
+def test_get_waits_for_items():
+    """Test get blocks until an item is put from another thread."""
+    rec_queue = RecorderQueue()
+    event = Event("test")
+    thread = threading.Thread(target=rec_queue.put, args=(event,))
+    thread.start()
+    assert rec_queue.get() is event
+    thread.join()
@@ -1,6 +1,7 @@
 """The tests for the Recorder component."""
 # pylint: disable=protected-access
 from datetime import datetime, timedelta
+import threading
 from unittest.mock import patch
 
 from sqlalchemy.exc import OperationalError
@@ -9,12 +10,20 @@ from homeassistant.components.recorder import (
     CONFIG_SCHEMA,
     DOMAIN,
     Recorder,
+    StatesMetaTask,
+    migration,
     run_information,
     run_information_from_instance,
     run_information_with_session,
 )
 from homeassistant.components.recorder.const import DATA_INSTANCE
-from homeassistant.components.recorder.models import Events, RecorderRuns, States
+from homeassistant.components.recorder.models import (
+    Events,
+    RecorderRuns,
+    StateAttributes,
+    States,
+    StatesMeta,
+)
 from homeassistant.components.recorder.util import session_scope
 from homeassistant.const import MATCH_ALL, STATE_LOCKED, STATE_UNLOCKED
 from homeassistant.core import Context, callback
@@ -349,6 +358,8 @@ async def test_defaults_set(hass):
     # pylint: disable=unsubscriptable-object
     assert recorder_config["auto_purge"]
     assert recorder_config["purge_keep_days"] == 10
+    assert recorder_config["max_backlog"] == 40000
+    assert recorder_config["overflow_policy"] == "drop_oldest"
 
 
 def run_tasks_at_time(hass, test_time):
@@ -455,6 +466,306 @@ def test_saving_state_with_serializable_data(hass_recorder, caplog):
     assert "State is not JSON serializable" in caplog.text
 
 
+def test_bulk_insert_saving_state_and_event(hass_recorder):
+    """Test the bulk insert path saves states and events."""
+    hass = hass_recorder({"bulk_insert": True})
+
+    entity_id = "test.recorder"
+    attributes = {"test_attr": 5, "test_attr_10": "nice"}
+
+    hass.states.set(entity_id, "restoring_from_db", attributes)
+    hass.bus.fire("EVENT_TEST", {"test_attr": 5})
+    wait_recording_done(hass)
+
+    with session_scope(hass=hass) as session:
+        db_states = list(session.query(States))
+        assert len(db_states) == 1
+        assert db_states[0].event.event_type == "state_changed"
+        assert db_states[0].to_native() == _state_empty_context(hass, entity_id)
+
+        db_events = list(session.query(Events).filter_by(event_type="EVENT_TEST"))
+        assert len(db_events) == 1
+        assert db_events[0].to_native().data == {"test_attr": 5}
+
+
+def test_bulk_insert_sets_old_state(hass_recorder):
+    """Test the bulk insert path links old states within and across commits."""
+    hass = hass_recorder({"bulk_insert": True})
+
+    hass.states.set("test.one", "on", {})
+    hass.states.set("test.two", "on", {})
+    hass.states.set("test.one", "off", {})
+    wait_recording_done(hass)
+    hass.states.set("test.two", "off", {})
+    hass.states.remove("test.one")
+    wait_recording_done(hass)
+    hass.states.set("test.one", "on", {})
+    wait_recording_done(hass)
+
+    with session_scope(hass=hass) as session:
+        states = list(session.query(States))
+        assert len(states) == 6
+
+        assert [state.entity_id for state in states] == [
+            "test.one",
+            "test.two",
+            "test.one",
+            "test.two",
+            "test.one",
+            "test.one",
+        ]
+        assert states[0].old_state_id is None
+        assert states[1].old_state_id is None
+        assert states[2].old_state_id == states[0].state_id
+        assert states[3].old_state_id == states[1].state_id
+        assert states[4].old_state_id == states[2].state_id
+        assert states[4].state is None
+        assert states[5].old_state_id is None
+
+
+def test_bulk_insert_continues_existing_ids(hass_recorder):
+    """Test the bulk insert path continues after rows written by the ORM."""
+    hass = hass_recorder()
+    instance = hass.data[DATA_INSTANCE]
+
+    hass.states.set("test.one", "on", {})
+    wait_recording_done(hass)
+
+    instance.bulk_insert = True
+    hass.states.set("test.one", "off", {})
+    wait_recording_done(hass)
+
+    with session_scope(hass=hass) as session:
+        states = list(session.query(States))
+        assert len(states) == 2
+        assert states[1].state_id == states[0].state_id + 1
+        assert states[1].event_id == states[0].event_id + 1
+
+
+def test_bulk_insert_after_failed_commit(hass_recorder):
+    """Test a failed bulk commit does not leave ids the next commit references."""
+    hass = hass_recorder({"bulk_insert": True})
+    instance = hass.data[DATA_INSTANCE]
+
+    hass.states.set("test.one", "on", {})
+    wait_recording_done(hass)
+
+    with patch.object(
+        instance, "_insert_pending_rows", side_effect=ValueError("failed")
+    ):
+        hass.states.set("test.one", "off", {})
+        wait_recording_done(hass)
+
+    hass.states.set("test.one", "on", {})
+    wait_recording_done(hass)
+
+    with session_scope(hass=hass) as session:
+        states = list(session.query(States))
+        assert [state.state for state in states] == ["on", "on"]
+        assert states[1].state_id == states[0].state_id + 1
+        assert states[1].old_state_id is None
+
+
+def _assert_shared_attributes(hass):
+    """Assert identical attributes are stored once and restored for each state."""
+    with session_scope(hass=hass) as session:
+        states = list(session.query(States))
+        assert len(states) == 4
+        assert all(state.attributes is None for state in states)
+        assert states[0].attributes_id == states[1].attributes_id
+        assert states[0].attributes_id == states[3].attributes_id
+        assert states[2].attributes_id != states[0].attributes_id
+        assert [state.to_native().attributes for state in states] == [
+            {"unit_of_measurement": "W"},
+            {"unit_of_measurement": "W"},
+            {"unit_of_measurement": "kWh"},
+            {"unit_of_measurement": "W"},
+        ]
+        assert session.query(StateAttributes).count() == 2
+
+
+def test_saving_state_shares_attributes(hass_recorder):
+    """Test identical attributes are stored once."""
+    hass = hass_recorder()
+
+    hass.states.set("sensor.one", "1", {"unit_of_measurement": "W"})
+    hass.states.set("sensor.two", "1", {"unit_of_measurement": "W"})
+    wait_recording_done(hass)
+    hass.data[DATA_INSTANCE]._state_attributes_ids.clear()
+    hass.states.set("sensor.three", "1", {"unit_of_measurement": "kWh"})
+    hass.states.set("sensor.one", "2", {"unit_of_measurement": "W"})
+    wait_recording_done(hass)
+
+    _assert_shared_attributes(hass)
+
+
+def test_bulk_insert_shares_attributes(hass_recorder):
+    """Test identical attributes are stored once with bulk insert."""
+    hass = hass_recorder({"bulk_insert": True})
+
+    hass.states.set("sensor.one", "1", {"unit_of_measurement": "W"})
+    hass.states.set("sensor.two", "1", {"unit_of_measurement": "W"})
+    wait_recording_done(hass)
+    hass.data[DATA_INSTANCE]._state_attributes_ids.clear()
+    hass.states.set("sensor.three", "1", {"unit_of_measurement": "kWh"})
+    hass.states.set("sensor.one", "2", {"unit_of_measurement": "W"})
+    wait_recording_done(hass)
+
+    _assert_shared_attributes(hass)
+
+
+def test_state_attributes_cache_is_bounded(hass_recorder):
+    """Test the attributes id cache evicts the least recently used entries."""
+    hass = hass_recorder()
+    instance = hass.data[DATA_INSTANCE]
+
+    with patch("homeassistant.components.recorder.STATE_ATTRIBUTES_ID_CACHE_SIZE", 2):
+        hass.states.set("sensor.one", "1", {"idx": 1})
+        hass.states.set("sensor.one", "2", {"idx": 2})
+        wait_recording_done(hass)
+        hass.states.set("sensor.one", "3", {"idx": 1})
+        hass.states.set("sensor.one", "4", {"idx": 3})
+        wait_recording_done(hass)
+
+    assert list(instance._state_attributes_ids) == ['{"idx": 1}', '{"idx": 3}']
+
+
+def _assert_states_meta(hass):
+    """Assert each entity_id is stored once in states_meta."""
+    with session_scope(hass=hass) as session:
+        metadata_ids = dict(session.query(StatesMeta.entity_id, StatesMeta.metadata_id))
+        assert sorted(metadata_ids) == ["sensor.one", "sensor.two"]
+        states = session.query(States).order_by(States.state_id).all()
+        assert [(state.entity_id, state.metadata_id) for state in states] == [
+            ("sensor.one", metadata_ids["sensor.one"]),
+            ("sensor.two", metadata_ids["sensor.two"]),
+            ("sensor.one", metadata_ids["sensor.one"]),
+        ]
+
+
+def test_saving_state_links_states_meta(hass_recorder):
+    """Test states reference their entity_id through states_meta."""
+    hass = hass_recorder()
+
+    hass.states.set("sensor.one", "1")
+    hass.states.set("sensor.two", "1")
+    wait_recording_done(hass)
+    hass.data[DATA_INSTANCE]._states_meta_ids.clear()
+    hass.states.set("sensor.one", "2")
+    wait_recording_done(hass)
+
+    _assert_states_meta(hass)
+
+
+def test_bulk_insert_links_states_meta(hass_recorder):
+    """Test states reference their entity_id through states_meta in bulk."""
+    hass = hass_recorder({"bulk_insert": True})
+
+    hass.states.set("sensor.one", "1")
+    hass.states.set("sensor.two", "1")
+    wait_recording_done(hass)
+    hass.data[DATA_INSTANCE]._states_meta_ids.clear()
+    hass.states.set("sensor.one", "2")
+    wait_recording_done(hass)
+
+    _assert_states_meta(hass)
+
+
+def test_migrate_states_meta(hass_recorder):
+    """Test states recorded before states_meta are migrated in batches."""
+    hass = hass_recorder()
+    instance = hass.data[DATA_INSTANCE]
+    wait_recording_done(hass)
+    assert instance.states_meta_migrated
+
+    hass.states.set("sensor.one", "1")
+    hass.states.set("sensor.two", "1")
+    hass.states.set("sensor.one", "2")
+    wait_recording_done(hass)
+    with session_scope(hass=hass) as session:
+        session.query(States).update({States.metadata_id: None})
+        session.query(StatesMeta).delete()
+
+    with patch.object(migration, "STATES_META_BATCH_SIZE", 2):
+        assert not migration.migrate_states_meta(instance)
+        assert not migration.migrate_states_meta(instance)
+        assert migration.migrate_states_meta(instance)
+
+    _assert_states_meta(hass)
+
+
+def test_migrate_states_meta_with_bulk_insert(hass_recorder):
+    """Test new entities do not reuse metadata_ids taken by the migration."""
+    hass = hass_recorder({"bulk_insert": True})
+    instance = hass.data[DATA_INSTANCE]
+
+    hass.states.set("sensor.one", "1")
+    wait_recording_done(hass)
+    with session_scope(hass=hass) as session:
+        session.add(
+            States(
+                entity_id="sensor.legacy",
+                domain="sensor",
+                state="1",
+                last_updated_ts=dt_util.utcnow().timestamp(),
+            )
+        )
+
+    instance.queue.put(StatesMetaTask())
+    wait_recording_done(hass)
+    hass.states.set("sensor.new", "1")
+    wait_recording_done(hass)
+
+    with session_scope(hass=hass) as session:
+        metadata_ids = dict(session.query(StatesMeta.entity_id, StatesMeta.metadata_id))
+        assert sorted(metadata_ids) == ["sensor.legacy", "sensor.new", "sensor.one"]
+        assert len(set(metadata_ids.values())) == 3
+        states = session.query(States).order_by(States.state_id).all()
+        assert [(state.entity_id, state.metadata_id) for state in states] == [
+            (entity_id, metadata_ids[entity_id])
+            for entity_id in ("sensor.one", "sensor.legacy", "sensor.new")
+        ]
+
+
+def test_backlog_is_bounded_while_database_stalls(hass_recorder):
+    """Test events are dropped instead of queued while a commit stalls."""
+    hass = hass_recorder({"max_backlog": 10})
+    instance = hass.data[DATA_INSTANCE]
+    stalled = threading.Event()
+    release = threading.Event()
+    commit = instance._commit_event_session
+
+    def stalled_commit():
+        stalled.set()
+        release.wait()
+        commit()
+
+    with patch.object(instance, "_commit_event_session", side_effect=stalled_commit):
+        fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=1))
+        assert stalled.wait(5)
+        for idx in range(30):
+            hass.states.set(f"sensor.stalled_{idx}", "on")
+        hass.block_till_done()
+
+        assert instance.queue.backlog == 10
+        # The event that triggered the stalled commit may be dropped as well
+        dropped = instance.queue.dropped
+        assert dropped >= 20
+
+        release.set()
+        instance.block_till_done()
+        wait_recording_done(hass)
+
+    info = instance.info()
+    assert info["backlog"] == 0
+    assert info["peak_backlog"] == 10
+    assert info["dropped"] == dropped
+    assert info["peak_commit_latency"] >= info["commit_latency"]
+    with session_scope(hass=hass) as session:
+        entity_ids = {state.entity_id for state in session.query(States)}
+    assert entity_ids == {f"sensor.stalled_{idx}" for idx in range(20, 30)}
+
+
 def test_run_information(hass_recorder):
     """Ensure run_information returns expected data."""
     before_start_recording = dt_util.utcnow()
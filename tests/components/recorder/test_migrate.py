@@ -1,5 +1,6 @@
 """The tests for the Recorder component."""
 # pylint: disable=protected-access
+from datetime import datetime
 from unittest.mock import call, patch
 
 import pytest
@@ -8,6 +9,7 @@ from sqlalchemy.pool import StaticPool
 
 from homeassistant.bootstrap import async_setup_component
 from homeassistant.components.recorder import const, migration, models
+import homeassistant.util.dt as dt_util
 
 from tests.components.recorder import models_original
 
@@ -79,3 +81,28 @@ def test_forgiving_add_index():
     engine = create_engine("sqlite://", poolclass=StaticPool)
     models.Base.metadata.create_all(engine)
     migration._create_index(engine, "states", "ix_states_context_id")
+
+
+def test_migrate_columns_to_timestamp():
+    """Test the DateTime columns are converted to UNIX timestamps."""
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    models.Base.metadata.create_all(engine)
+    fired = datetime(2021, 1, 4, 10, 0, 0, 123456, tzinfo=dt_util.UTC)
+    changed = datetime(2021, 1, 4, 9, 0, tzinfo=dt_util.UTC)
+    with engine.begin() as connection:
+        connection.execute(
+            models.Events.__table__.insert(), {"event_id": 1, "time_fired": fired}
+        )
+        connection.execute(
+            models.States.__table__.insert(),
+            {"state_id": 1, "last_changed": changed, "last_updated": fired},
+        )
+
+    migration._migrate_columns_to_timestamp(engine)
+
+    assert list(engine.execute("SELECT time_fired_ts FROM events")) == [
+        (fired.timestamp(),)
+    ]
+    assert list(
+        engine.execute("SELECT last_changed_ts, last_updated_ts FROM states")
+    ) == [(changed.timestamp(), fired.timestamp())]
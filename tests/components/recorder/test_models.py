@@ -10,9 +10,12 @@ from homeassistant.components.recorder.models import (
     Base,
     Events,
     RecorderRuns,
+    StateAttributes,
     States,
     process_timestamp,
     process_timestamp_to_utc_isoformat,
+    timestamp_to_datetime,
+    timestamp_to_utc_isoformat,
 )
 from homeassistant.const import EVENT_STATE_CHANGED
 import homeassistant.core as ha
@@ -41,6 +44,52 @@ def test_from_event_to_db_state():
     assert state == States.from_event(event).to_native()
 
 
+def test_from_event_to_db_state_attributes():
+    """Test the attributes share the encoding of the state."""
+    state = ha.State("sensor.temperature", "18", {"unit": "C"})
+    event = ha.Event(
+        EVENT_STATE_CHANGED,
+        {"entity_id": "sensor.temperature", "old_state": None, "new_state": state},
+    )
+    attributes = States.row_from_event(event)["attributes"]
+    assert attributes == '{"unit": "C"}'
+    assert States.row_from_event(event)["attributes"] is attributes
+
+    # Out of range floats are still recorded
+    state = ha.State("sensor.temperature", "18", {"value": float("nan")})
+    event.data["new_state"] = state
+    assert States.row_from_event(event)["attributes"] == '{"value": NaN}'
+
+
+def test_state_attributes_from_shared_attrs():
+    """Test converting json encoded attributes to db state attributes."""
+    db_attributes = StateAttributes.from_shared_attrs('{"friendly_name": "Kitchen"}')
+
+    assert db_attributes.hash == StateAttributes.hash_shared_attrs(
+        '{"friendly_name": "Kitchen"}'
+    )
+    assert db_attributes.hash != StateAttributes.hash_shared_attrs("{}")
+    assert db_attributes.to_native() == {"friendly_name": "Kitchen"}
+
+
+def test_db_state_with_shared_attributes_to_native():
+    """Test converting a db state that references shared attributes."""
+    db_state = States.from_event(
+        ha.Event(
+            EVENT_STATE_CHANGED,
+            {
+                "entity_id": "sensor.temperature",
+                "old_state": None,
+                "new_state": ha.State("sensor.temperature", "18", {"unit": "C"}),
+            },
+        )
+    )
+    db_state.state_attributes = StateAttributes.from_shared_attrs(db_state.attributes)
+    db_state.attributes = None
+
+    assert db_state.to_native().attributes == {"unit": "C"}
+
+
 def test_from_event_to_delete_state():
     """Test converting deleting state event to db state."""
     event = ha.Event(
@@ -56,8 +105,8 @@ def test_from_event_to_delete_state():
     assert db_state.entity_id == "sensor.temperature"
     assert db_state.domain == "sensor"
     assert db_state.state == ""
-    assert db_state.last_changed == event.time_fired
-    assert db_state.last_updated == event.time_fired
+    assert db_state.last_changed_ts == event.time_fired.timestamp()
+    assert db_state.last_updated_ts == event.time_fired.timestamp()
 
 
 def test_entity_ids():
@@ -94,16 +143,16 @@ def test_entity_ids():
         States(
             entity_id="sensor.temperature",
             state="20",
-            last_changed=before_run,
-            last_updated=before_run,
+            last_changed_ts=before_run.timestamp(),
+            last_updated_ts=before_run.timestamp(),
         )
     )
     session.add(
         States(
             entity_id="sensor.sound",
             state="10",
-            last_changed=after_run,
-            last_updated=after_run,
+            last_changed_ts=after_run.timestamp(),
+            last_updated_ts=after_run.timestamp(),
         )
     )
 
@@ -111,16 +160,16 @@ def test_entity_ids():
         States(
             entity_id="sensor.humidity",
             state="76",
-            last_changed=in_run,
-            last_updated=in_run,
+            last_changed_ts=in_run.timestamp(),
+            last_updated_ts=in_run.timestamp(),
         )
     )
     session.add(
         States(
             entity_id="sensor.lux",
             state="5",
-            last_changed=in_run3,
-            last_updated=in_run3,
+            last_changed_ts=in_run3.timestamp(),
+            last_updated_ts=in_run3.timestamp(),
         )
     )
 
@@ -205,6 +254,18 @@ async def test_process_timestamp_to_utc_isoformat():
     assert process_timestamp_to_utc_isoformat(None) is None
 
 
+async def test_timestamp_to_datetime_and_utc_isoformat():
+    """Test converting UNIX timestamps to UTC."""
+    timestamp = datetime(2016, 7, 9, 11, 0, 0, 123456, tzinfo=dt.UTC).timestamp()
+
+    assert timestamp_to_datetime(timestamp) == datetime(
+        2016, 7, 9, 11, 0, 0, 123456, tzinfo=dt.UTC
+    )
+    assert timestamp_to_utc_isoformat(timestamp) == "2016-07-09T11:00:00.123456+00:00"
+    assert timestamp_to_datetime(None) is None
+    assert timestamp_to_utc_isoformat(None) is None
+
+
 async def test_event_to_db_model():
     """Test we can round trip Event conversion."""
     event = ha.Event(
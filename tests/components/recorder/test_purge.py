@@ -1,12 +1,19 @@
 """Test data purging."""
 from datetime import datetime, timedelta
 import json
-from unittest.mock import patch
+import threading
+import time
+from unittest.mock import call, patch
 
 from homeassistant.components import recorder
 from homeassistant.components.recorder.const import DATA_INSTANCE
-from homeassistant.components.recorder.models import Events, RecorderRuns, States
-from homeassistant.components.recorder.purge import purge_old_data
+from homeassistant.components.recorder.models import (
+    Events,
+    RecorderRuns,
+    StateAttributes,
+    States,
+)
+from homeassistant.components.recorder.purge import PURGE_BATCH_SIZE, purge_old_data
 from homeassistant.components.recorder.util import session_scope
 from homeassistant.util import dt as dt_util
 
@@ -23,16 +30,12 @@ def test_purge_old_states(hass, hass_recorder):
         states = session.query(States)
         assert states.count() == 6
 
-        # run purge_old_data()
-        finished = purge_old_data(hass.data[DATA_INSTANCE], 4, repack=False)
-        assert not finished
-        assert states.count() == 4
-
-        finished = purge_old_data(hass.data[DATA_INSTANCE], 4, repack=False)
+        # run purge_old_data(), all old states fit in one batch
+        finished = purge_old_data(hass.data[DATA_INSTANCE], 4)
         assert not finished
         assert states.count() == 2
 
-        finished = purge_old_data(hass.data[DATA_INSTANCE], 4, repack=False)
+        finished = purge_old_data(hass.data[DATA_INSTANCE], 4)
         assert finished
         assert states.count() == 2
 
@@ -46,21 +49,200 @@ def test_purge_old_events(hass, hass_recorder):
         events = session.query(Events).filter(Events.event_type.like("EVENT_TEST%"))
         assert events.count() == 6
 
-        # run purge_old_data()
-        finished = purge_old_data(hass.data[DATA_INSTANCE], 4, repack=False)
-        assert not finished
-        assert events.count() == 4
-
-        finished = purge_old_data(hass.data[DATA_INSTANCE], 4, repack=False)
+        # run purge_old_data(), all old events fit in one batch
+        finished = purge_old_data(hass.data[DATA_INSTANCE], 4)
         assert not finished
         assert events.count() == 2
 
         # we should only have 2 events left
-        finished = purge_old_data(hass.data[DATA_INSTANCE], 4, repack=False)
+        finished = purge_old_data(hass.data[DATA_INSTANCE], 4)
         assert finished
         assert events.count() == 2
 
 
+def test_purge_old_state_attributes(hass, hass_recorder):
+    """Test deleting state attributes no longer referenced by any state."""
+    hass = hass_recorder()
+    instance = hass.data[DATA_INSTANCE]
+
+    hass.states.set("test.old", "on", {"name": "old"})
+    hass.states.set("test.kept", "on", {"name": "kept"})
+    wait_recording_done(hass)
+
+    with session_scope(hass=hass) as session:
+        session.query(States).filter(States.entity_id == "test.old").update(
+            {"last_updated_ts": (dt_util.utcnow() - timedelta(days=11)).timestamp()}
+        )
+
+    with session_scope(hass=hass) as session:
+        state_attributes = session.query(StateAttributes)
+        assert state_attributes.count() == 2
+
+        while not purge_old_data(instance, 4):
+            pass
+        assert [attrs.shared_attrs for attrs in state_attributes] == [
+            '{"name": "kept"}'
+        ]
+
+    # The purged attributes are no longer cached and are written again
+    hass.states.set("test.old", "off", {"name": "old"})
+    wait_recording_done(hass)
+
+    with session_scope(hass=hass) as session:
+        state = session.query(States).filter(States.entity_id == "test.old").one()
+        assert state.to_native().attributes == {"name": "old"}
+        assert session.query(StateAttributes).count() == 2
+
+
+def test_purge_in_batches_reports_progress(hass, hass_recorder):
+    """Test old states are purged in id range batches with progress."""
+    hass = hass_recorder()
+    instance = hass.data[DATA_INSTANCE]
+    _add_old_states(hass, 25)
+
+    with patch(
+        "homeassistant.components.recorder.purge.PURGE_BATCH_SIZE", 10
+    ), session_scope(hass=hass) as session:
+        states = session.query(States).filter(States.entity_id == "test.batch")
+
+        assert not purge_old_data(instance, 4)
+        assert states.count() == 15
+        progress = instance.purge_progress
+        assert progress.total == 25
+        assert progress.deleted == 10
+        assert progress.eta is not None
+        assert instance.info()["purge_progress"]["deleted"] == 10
+
+        assert not purge_old_data(instance, 4)
+        assert not purge_old_data(instance, 4)
+        assert states.count() == 0
+        assert progress.deleted == 25
+        assert progress.eta == 0
+
+        assert purge_old_data(instance, 4)
+        assert instance.purge_progress is None
+        assert instance.info()["purge_progress"] is None
+
+
+def test_purge_batches_interleave_with_commits(hass, hass_recorder):
+    """Test the recorder commits pending events between purge batches."""
+    hass = hass_recorder()
+    instance = hass.data[DATA_INSTANCE]
+    _add_old_states(hass, 25)
+
+    calls = []
+    commit = instance._commit_event_session_or_retry
+
+    def _commit():
+        calls.append("commit")
+        commit()
+
+    def _purge(*args):
+        calls.append("purge")
+        return purge_old_data(*args)
+
+    with patch(
+        "homeassistant.components.recorder.purge.PURGE_BATCH_SIZE", 10
+    ), patch.object(
+        instance, "_commit_event_session_or_retry", side_effect=_commit
+    ), patch(
+        "homeassistant.components.recorder.purge.purge_old_data", side_effect=_purge
+    ):
+        hass.services.call("recorder", "purge", {"keep_days": 4})
+        hass.block_till_done()
+        _wait_purge_done(hass)
+
+    assert calls.count("purge") == 4
+    purges = [idx for idx, call_name in enumerate(calls) if call_name == "purge"]
+    assert all(calls[idx - 1] == "commit" for idx in purges)
+
+    with session_scope(hass=hass) as session:
+        assert (
+            session.query(States).filter(States.entity_id == "test.batch").count() == 0
+        )
+
+
+def test_purge_write_stall_is_bounded(hass, hass_recorder):
+    """Test state changes written while a large purge runs are not held up."""
+    hass = hass_recorder({"commit_interval": 0})
+    instance = hass.data[DATA_INSTANCE]
+    count = 100000
+    eleven_days_ago = (dt_util.utcnow() - timedelta(days=11)).timestamp()
+    wait_recording_done(hass)
+
+    with instance.engine.begin() as connection:
+        connection.execute(
+            Events.__table__.insert(),
+            [
+                {"event_type": "state_changed", "time_fired_ts": eleven_days_ago}
+                for _ in range(count)
+            ],
+        )
+        connection.execute(
+            States.__table__.insert(),
+            [
+                {
+                    "entity_id": f"sensor.stall_{idx % 100}",
+                    "state": str(idx),
+                    "last_updated_ts": eleven_days_ago,
+                }
+                for idx in range(count)
+            ],
+        )
+
+    # The time each state change was set and was committed
+    written = {}
+    committed = {}
+    processed = []
+    process_one_event = instance._process_one_event
+    commit = instance._commit_event_session_or_retry
+
+    def _process_one_event(event):
+        if event.data.get("entity_id") == "sensor.writer":
+            processed.append(event.data["new_state"].state)
+        process_one_event(event)
+
+    def _commit():
+        commit()
+        now = time.monotonic()
+        for state in processed:
+            committed[state] = now
+        processed.clear()
+
+    stop = threading.Event()
+
+    def _write_states():
+        idx = 0
+        while not stop.is_set():
+            written[str(idx)] = time.monotonic()
+            hass.states.set("sensor.writer", str(idx))
+            idx += 1
+            time.sleep(0.01)
+
+    writer = threading.Thread(target=_write_states)
+    with patch.object(
+        instance, "_process_one_event", side_effect=_process_one_event
+    ), patch.object(instance, "_commit_event_session_or_retry", side_effect=_commit):
+        writer.start()
+        hass.services.call("recorder", "purge", {"keep_days": 4})
+        hass.block_till_done()
+        _wait_purge_done(hass)
+        stop.set()
+        writer.join()
+        wait_recording_done(hass)
+
+    with session_scope(hass=hass) as session:
+        assert (
+            session.query(States).filter(States.entity_id != "sensor.writer").count()
+            == 0
+        )
+
+    latencies = [committed[state] - written[state] for state in committed]
+    # The writes kept going during the purge
+    assert len(latencies) > 2 * count // PURGE_BATCH_SIZE
+    assert max(latencies) < 0.5
+
+
 def test_purge_old_recorder_runs(hass, hass_recorder):
     """Test deleting old recorder runs keeps current run."""
     hass = hass_recorder()
@@ -71,9 +253,9 @@ def test_purge_old_recorder_runs(hass, hass_recorder):
         recorder_runs = session.query(RecorderRuns)
         assert recorder_runs.count() == 7
 
-        # run purge_old_data()
-        finished = purge_old_data(hass.data[DATA_INSTANCE], 0, repack=False)
-        assert finished
+        # run purge_old_data(), recorder runs are purged in the last batch
+        while not purge_old_data(hass.data[DATA_INSTANCE], 0):
+            assert recorder_runs.count() == 7
         assert recorder_runs.count() == 1
 
 
@@ -104,8 +286,7 @@ def test_purge_method(hass, hass_recorder):
         hass.block_till_done()
 
         # Small wait for recorder thread
-        hass.data[DATA_INSTANCE].block_till_done()
-        wait_recording_done(hass)
+        _wait_purge_done(hass)
 
         # only purged old events
         assert states.count() == 4
@@ -116,8 +297,7 @@ def test_purge_method(hass, hass_recorder):
         hass.block_till_done()
 
         # Small wait for recorder thread
-        hass.data[DATA_INSTANCE].block_till_done()
-        wait_recording_done(hass)
+        _wait_purge_done(hass)
 
         # we should only have 2 states left after purging
         assert states.count() == 2
@@ -135,11 +315,9 @@ def test_purge_method(hass, hass_recorder):
             service_data["repack"] = True
             hass.services.call("recorder", "purge", service_data=service_data)
             hass.block_till_done()
-            hass.data[DATA_INSTANCE].block_till_done()
-            wait_recording_done(hass)
+            _wait_purge_done(hass)
             assert (
-                mock_logger.debug.mock_calls[5][1][0]
-                == "Vacuuming SQL DB to free space"
+                call("Vacuuming SQL DB to free space") in mock_logger.debug.mock_calls
             )
 
 
@@ -172,14 +350,47 @@ def _add_test_states(hass):
                     domain="sensor",
                     state=state,
                     attributes=json.dumps(attributes),
-                    last_changed=timestamp,
-                    last_updated=timestamp,
+                    last_changed_ts=timestamp.timestamp(),
+                    last_updated_ts=timestamp.timestamp(),
                     created=timestamp,
                     event_id=event_id + 1000,
                 )
             )
 
 
+def _wait_purge_done(hass):
+    """Block till a purge running in batches is done."""
+    instance = hass.data[DATA_INSTANCE]
+    instance.block_till_done()
+    # Each batch queues the next one behind the pending events
+    while instance.purge_progress is not None:
+        instance.block_till_done()
+    wait_recording_done(hass)
+
+
+def _add_old_states(hass, count):
+    """Add count states that are eleven days old."""
+    eleven_days_ago = datetime.now() - timedelta(days=11)
+
+    hass.block_till_done()
+    hass.data[DATA_INSTANCE].block_till_done()
+    wait_recording_done(hass)
+
+    with recorder.session_scope(hass=hass) as session:
+        for idx in range(count):
+            session.add(
+                States(
+                    entity_id="test.batch",
+                    domain="test",
+                    state=str(idx),
+                    attributes="{}",
+                    last_changed_ts=eleven_days_ago.timestamp(),
+                    last_updated_ts=eleven_days_ago.timestamp(),
+                    created=eleven_days_ago,
+                )
+            )
+
+
 def _add_test_events(hass):
     """Add a few events for testing."""
     now = datetime.now()
@@ -209,7 +420,7 @@ def _add_test_events(hass):
                     event_data=json.dumps(event_data),
                     origin="LOCAL",
                     created=timestamp,
-                    time_fired=timestamp,
+                    time_fired_ts=timestamp.timestamp(),
                 )
             )
 
@@ -0,0 +1,280 @@
+"""The tests for the recorder statistics."""
+# pylint: disable=protected-access
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from homeassistant.components.recorder import StatisticsTask
+from homeassistant.components.recorder.const import DATA_INSTANCE
+from homeassistant.components.recorder.models import (
+    Statistics,
+    StatisticsShortTerm,
+    process_timestamp,
+)
+from homeassistant.components.recorder.statistics import (
+    PERIOD_5MINUTE,
+    PERIOD_HOUR,
+    compile_missing_statistics,
+    compile_statistics,
+    get_start_time,
+    statistics_during_period,
+)
+from homeassistant.components.recorder.util import session_scope
+import homeassistant.util.dt as dt_util
+
+from .common import wait_recording_done
+
+from tests.common import fire_time_changed
+
+ZERO = datetime(2021, 1, 4, 10, 0, 0, tzinfo=dt_util.UTC)
+FIRST_RESET = "2021-01-01T00:00:00+00:00"
+SECOND_RESET = "2021-01-04T10:04:00+00:00"
+
+
+def _record_states(hass):
+    """Record power and energy sensors during the first 5 minute period."""
+    power = {"unit_of_measurement": "W"}
+    changes = [
+        (1, "sensor.power", "10", power),
+        (
+            1,
+            "sensor.energy",
+            "100",
+            {"unit_of_measurement": "kWh", "last_reset": FIRST_RESET},
+        ),
+        (
+            2,
+            "sensor.energy",
+            "110",
+            {"unit_of_measurement": "kWh", "last_reset": FIRST_RESET},
+        ),
+        (3, "sensor.power", "20", power),
+        (3, "sensor.text", "unknown", power),
+        (
+            4,
+            "sensor.energy",
+            "5",
+            {"unit_of_measurement": "kWh", "last_reset": SECOND_RESET},
+        ),
+        (4, "sensor.no_unit", "5", {}),
+    ]
+    for minutes, entity_id, state, attributes in changes:
+        with patch(
+            "homeassistant.components.recorder.dt_util.utcnow",
+            return_value=ZERO + timedelta(minutes=minutes),
+        ):
+            hass.states.set(entity_id, state, attributes)
+    wait_recording_done(hass)
+
+
+def test_compile_short_term_statistics(hass_recorder):
+    """Test compiling mean, min, max for sensors and sum for meters."""
+    hass = hass_recorder()
+    instance = hass.data[DATA_INSTANCE]
+    _record_states(hass)
+
+    assert compile_statistics(instance, ZERO)
+
+    stats = statistics_during_period(hass, ZERO, period=PERIOD_5MINUTE)
+    assert list(stats) == ["sensor.energy", "sensor.power"]
+    assert stats["sensor.power"] == [
+        {
+            "statistic_id": "sensor.power",
+            "start": ZERO.isoformat(),
+            "mean": 15.0,
+            "min": 10.0,
+            "max": 20.0,
+            "last_reset": None,
+            "state": 20.0,
+            "sum": None,
+        }
+    ]
+    energy = stats["sensor.energy"][0]
+    assert energy["state"] == 5.0
+    assert energy["sum"] == 15.0
+    assert energy["last_reset"] == SECOND_RESET
+
+    # Compiling the same period again does not add rows
+    assert compile_statistics(instance, ZERO)
+    with session_scope(hass=hass) as session:
+        assert session.query(StatisticsShortTerm).count() == 2
+
+
+def test_compile_statistics_carries_unchanged_sensors(hass_recorder):
+    """Test sensors without state changes keep their last value."""
+    hass = hass_recorder()
+    instance = hass.data[DATA_INSTANCE]
+    _record_states(hass)
+
+    with patch(
+        "homeassistant.components.recorder.dt_util.utcnow",
+        return_value=ZERO + timedelta(minutes=7),
+    ):
+        hass.states.set(
+            "sensor.energy",
+            "8",
+            {"unit_of_measurement": "kWh", "last_reset": SECOND_RESET},
+        )
+    wait_recording_done(hass)
+
+    compile_statistics(instance, ZERO)
+    compile_statistics(instance, ZERO + timedelta(minutes=5))
+
+    stats = statistics_during_period(
+        hass, ZERO + timedelta(minutes=5), period=PERIOD_5MINUTE
+    )
+    power = stats["sensor.power"][0]
+    assert (power["mean"], power["min"], power["max"]) == (20.0, 20.0, 20.0)
+    energy = stats["sensor.energy"][0]
+    assert energy["sum"] == 18.0
+    # Weighted 2 minutes at 5 and 3 minutes at 8
+    assert energy["mean"] == 6.8
+
+
+def test_compile_statistics_ends_series_without_numeric_state(hass_recorder):
+    """Test sensors which are unavailable, lost their unit or were removed are not carried."""
+    hass = hass_recorder()
+    instance = hass.data[DATA_INSTANCE]
+    with patch(
+        "homeassistant.components.recorder.dt_util.utcnow",
+        return_value=ZERO + timedelta(minutes=1),
+    ):
+        hass.states.set("sensor.temperature", "21", {"unit_of_measurement": "°C"})
+    _record_states(hass)
+
+    changes = [
+        (6, lambda: hass.states.set("sensor.power", "unavailable", {})),
+        (7, lambda: hass.states.remove("sensor.energy")),
+        (8, lambda: hass.states.set("sensor.temperature", "21", {"other": 1})),
+    ]
+    for minutes, change in changes:
+        with patch(
+            "homeassistant.components.recorder.dt_util.utcnow",
+            return_value=ZERO + timedelta(minutes=minutes),
+        ):
+            change()
+    wait_recording_done(hass)
+
+    for minutes in (0, 5, 10):
+        compile_statistics(instance, ZERO + timedelta(minutes=minutes))
+
+    stats = statistics_during_period(hass, ZERO, period=PERIOD_5MINUTE)
+    assert list(stats) == ["sensor.energy", "sensor.power", "sensor.temperature"]
+    for rows in stats.values():
+        assert [row["start"] for row in rows] == [ZERO.isoformat()]
+
+
+def test_compile_hourly_statistics(hass_recorder):
+    """Test the hourly statistics are rolled up from the short term ones."""
+    hass = hass_recorder()
+    instance = hass.data[DATA_INSTANCE]
+    _record_states(hass)
+
+    compile_statistics(instance, ZERO)
+    compile_statistics(instance, ZERO + timedelta(minutes=5))
+    with session_scope(hass=hass) as session:
+        assert session.query(Statistics).count() == 0
+
+    compile_statistics(instance, ZERO + timedelta(minutes=55))
+
+    stats = statistics_during_period(hass, ZERO, statistic_ids=["sensor.power"])
+    assert list(stats) == ["sensor.power"]
+    power = stats["sensor.power"][0]
+    assert process_timestamp(dt_util.parse_datetime(power["start"])) == ZERO
+    assert (power["mean"], power["min"], power["max"]) == (17.5, 10.0, 20.0)
+
+    stats = statistics_during_period(
+        hass, ZERO, ZERO + timedelta(minutes=5), period=PERIOD_HOUR
+    )
+    assert list(stats) == ["sensor.energy", "sensor.power"]
+    assert stats["sensor.energy"][0]["sum"] == 15.0
+
+
+def test_statistics_missed_across_restart(hass_recorder):
+    """Test periods missed while stopped are compiled, including the hour."""
+    hass = hass_recorder()
+    instance = hass.data[DATA_INSTANCE]
+    _record_states(hass)
+
+    # The last periodic run before stopping
+    for minutes in range(0, 55, 5):
+        compile_statistics(instance, ZERO + timedelta(minutes=minutes))
+
+    # The first periodic run after starting again
+    instance.queue.put(StatisticsTask(ZERO + timedelta(minutes=65)))
+    instance.block_till_done()
+
+    stats = statistics_during_period(
+        hass, ZERO, statistic_ids=["sensor.power"], period=PERIOD_5MINUTE
+    )
+    assert [
+        process_timestamp(dt_util.parse_datetime(row["start"]))
+        for row in stats["sensor.power"]
+    ] == [ZERO + timedelta(minutes=minutes) for minutes in range(0, 70, 5)]
+
+    stats = statistics_during_period(hass, ZERO, statistic_ids=["sensor.power"])
+    power = stats["sensor.power"]
+    assert len(power) == 1
+    assert process_timestamp(dt_util.parse_datetime(power[0]["start"])) == ZERO
+    assert power[0]["max"] == 20.0
+
+
+def test_missed_statistics_are_compiled_in_batches(hass_recorder):
+    """Test missed periods are compiled a few at a time by requeued tasks."""
+    hass = hass_recorder()
+    instance = hass.data[DATA_INSTANCE]
+    _record_states(hass)
+    compile_statistics(instance, ZERO)
+
+    with patch("homeassistant.components.recorder.statistics.MAX_PERIODS_PER_RUN", 2):
+        next_period = compile_missing_statistics(instance, ZERO + timedelta(minutes=65))
+        assert next_period == ZERO + timedelta(minutes=15)
+
+        tasks = []
+        put = instance.queue.put
+        with patch.object(
+            instance.queue,
+            "put",
+            side_effect=lambda task: put(tasks.append(task) or task),
+        ):
+            instance.queue.put(
+                StatisticsTask(ZERO + timedelta(minutes=65), next_period)
+            )
+            # Each requeued task is behind the wait task of the last call
+            for _ in range(6):
+                instance.block_till_done()
+
+    # Each task compiled two periods and queued a task for the rest
+    assert [task.period for task in tasks if isinstance(task, StatisticsTask)] == [
+        ZERO + timedelta(minutes=minutes) for minutes in (15, 25, 35, 45, 55, 65)
+    ]
+    stats = statistics_during_period(
+        hass, ZERO, statistic_ids=["sensor.power"], period=PERIOD_5MINUTE
+    )
+    assert [
+        process_timestamp(dt_util.parse_datetime(row["start"]))
+        for row in stats["sensor.power"]
+    ] == [ZERO + timedelta(minutes=minutes) for minutes in range(0, 70, 5)]
+
+
+def test_get_start_time():
+    """Test the start of the last completed short term period."""
+    assert get_start_time(ZERO + timedelta(minutes=5, seconds=10)) == ZERO
+    assert get_start_time(ZERO + timedelta(minutes=9, seconds=59)) == ZERO
+    assert get_start_time(ZERO + timedelta(minutes=2)) == ZERO - timedelta(minutes=5)
+
+
+def test_statistics_are_compiled_periodically(hass_recorder):
+    """Test the recorder compiles statistics every 5 minutes."""
+    hass = hass_recorder()
+
+    now = dt_util.utcnow().replace(second=0, microsecond=0)
+    period_start = now.replace(minute=now.minute - now.minute % 5)
+    with patch(
+        "homeassistant.components.recorder.statistics.compile_statistics"
+    ) as compile_mock:
+        fire_time_changed(hass, period_start + timedelta(minutes=5, seconds=11))
+        hass.block_till_done()
+        hass.data[DATA_INSTANCE].block_till_done()
+
+    assert len(compile_mock.mock_calls) == 1
+    assert compile_mock.mock_calls[0][1][1] == period_start
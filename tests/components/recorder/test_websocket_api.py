@@ -0,0 +1,59 @@
+"""The tests for the recorder websocket API."""
+from datetime import timedelta
+
+from homeassistant.components.recorder.const import DATA_INSTANCE
+from homeassistant.components.websocket_api.const import TYPE_RESULT
+import homeassistant.util.dt as dt_util
+
+from tests.common import async_fire_time_changed, async_init_recorder_component
+
+
+async def test_recorder_info(hass, hass_ws_client):
+    """Test getting the recorder backlog and commit latency."""
+    await async_init_recorder_component(hass, {"max_backlog": 100})
+    await hass.async_add_executor_job(hass.data[DATA_INSTANCE].block_till_done)
+
+    client = await hass_ws_client(hass)
+    await client.send_json({"id": 1, "type": "recorder/info"})
+    response = await client.receive_json()
+
+    assert response["success"]
+    assert response["result"]["max_backlog"] == 100
+    assert response["result"]["overflow_policy"] == "drop_oldest"
+    assert response["result"]["dropped"] == 0
+    assert "commit_latency" in response["result"]
+
+
+async def test_recorder_subscribe_info(hass, hass_ws_client):
+    """Test the recorder info is sent periodically."""
+    await async_init_recorder_component(hass)
+    await hass.async_add_executor_job(hass.data[DATA_INSTANCE].block_till_done)
+
+    client = await hass_ws_client(hass)
+    await client.send_json({"id": 1, "type": "recorder/subscribe_info"})
+    response = await client.receive_json()
+    assert response["type"] == TYPE_RESULT
+    assert response["success"]
+
+    response = await client.receive_json()
+    assert response["type"] == "event"
+    assert response["event"]["max_backlog"] == 40000
+
+    async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=5))
+    response = await client.receive_json()
+    assert response["id"] == 1
+    assert response["type"] == "event"
+    assert "backlog" in response["event"]
+
+
+async def test_recorder_info_requires_admin(hass, hass_ws_client, hass_admin_user):
+    """Test the recorder info is only available to admins."""
+    hass_admin_user.groups = []
+    await async_init_recorder_component(hass)
+
+    client = await hass_ws_client(hass)
+    await client.send_json({"id": 1, "type": "recorder/info"})
+    response = await client.receive_json()
+
+    assert not response["success"]
+    assert response["error"]["code"] == "unauthorized"
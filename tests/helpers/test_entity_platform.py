@@ -1,6 +1,7 @@
 """Tests for the EntityPlatform helper."""
 import asyncio
 from datetime import timedelta
+import json
 import logging
 from unittest.mock import Mock, patch
 
@@ -16,6 +17,7 @@ from homeassistant.helpers.entity_component import (
     EntityComponent,
 )
 import homeassistant.util.dt as dt_util
+from homeassistant.util.job_stats import JobStats
 
 from tests.common import (
     MockConfigEntry,
@@ -90,6 +92,28 @@ async def test_polling_updates_entities_with_exception(hass):
     assert len(update_err) == 1
 
 
+async def test_polling_executor_jobs_charged_to_integration(hass):
+    """Test executor jobs run by polling updates are charged to the integration."""
+    component = EntityComponent(_LOGGER, DOMAIN, hass, timedelta(seconds=20))
+    hass.job_stats = JobStats(hass.loop)
+
+    async def async_update():
+        """Run a library function in the executor."""
+        await hass.async_add_executor_job(json.dumps, {})
+
+    ent = MockEntity(should_poll=True)
+    ent.async_update = async_update
+    await component.async_add_entities([ent])
+
+    async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=20))
+    await hass.async_block_till_done()
+
+    executor = hass.job_stats.as_dict()["executor"]
+    assert "json" not in executor
+    assert executor[DOMAIN]["calls"] == 1
+    hass.job_stats = None
+
+
 async def test_update_state_adds_entities(hass):
     """Test if updating poll entities cause an entity to be added works."""
     component = EntityComponent(_LOGGER, DOMAIN, hass)
@@ -2,6 +2,7 @@
 # pylint: disable=protected-access
 import asyncio
 from datetime import datetime, timedelta
+import queue
 from unittest.mock import patch
 
 from astral import Astral
@@ -19,6 +20,8 @@ from homeassistant.helpers.event import (
     TrackTemplate,
     TrackTemplateResult,
     async_call_later,
+    async_get_template_render_stats,
+    async_queue_event_batches,
     async_track_point_in_time,
     async_track_point_in_utc_time,
     async_track_same_state,
@@ -935,6 +938,181 @@ async def test_track_template_time_change(hass, caplog):
     assert calls[0] == (None, None, None)
 
 
+async def test_track_template_result_fields_read(hass):
+    """Test templates only re-render when a field they read changes."""
+    hass.states.async_set("sensor.test", "on", {"friendly_name": "Test", "seen": 1})
+    hass.states.async_set("light.test", "on", {"seen": 1})
+    renders = []
+    results = []
+    render_to_info = Template.async_render_to_info
+
+    def counting_render_to_info(self, *args, **kwargs):
+        renders.append(self)
+        return render_to_info(self, *args, **kwargs)
+
+    template = Template(
+        "{{ states.sensor.test.state }} {{ state_attr('sensor.test', 'friendly_name') }}"
+        " {{ states.light.test.attributes | length }}",
+        hass,
+    )
+
+    with patch.object(Template, "async_render_to_info", counting_render_to_info):
+        async_track_template_result(
+            hass,
+            [TrackTemplate(template, None)],
+            lambda event, updates: results.append(updates.pop().result),
+        )
+        await hass.async_block_till_done()
+        assert len(renders) == 1
+
+        # An attribute which is not read changes
+        hass.states.async_set("sensor.test", "on", {"friendly_name": "Test", "seen": 2})
+        await hass.async_block_till_done()
+        assert len(renders) == 1
+
+        hass.states.async_set("sensor.test", "on", {"friendly_name": "New", "seen": 2})
+        await hass.async_block_till_done()
+        assert len(renders) == 2
+        assert results == ["on New 1"]
+
+        hass.states.async_set("sensor.test", "off", {"friendly_name": "New", "seen": 2})
+        await hass.async_block_till_done()
+        assert len(renders) == 3
+
+        # Iterating the attributes reads all of them
+        hass.states.async_set("light.test", "on", {"seen": 2})
+        await hass.async_block_till_done()
+        assert len(renders) == 4
+
+        hass.states.async_remove("sensor.test")
+        await hass.async_block_till_done()
+        assert len(renders) == 5
+
+
+async def test_track_template_result_shared_renders(hass):
+    """Test identical templates are rendered once per state change."""
+    renders = []
+    render_to_info = Template.async_render_to_info
+
+    def counting_render_to_info(self, *args, **kwargs):
+        renders.append(self.template)
+        return render_to_info(self, *args, **kwargs)
+
+    results = []
+
+    def track(source, variables=None):
+        async_track_template_result(
+            hass,
+            [TrackTemplate(Template(source, hass), variables)],
+            lambda event, updates: results.append(updates.pop().result),
+        )
+
+    with patch.object(Template, "async_render_to_info", counting_render_to_info):
+        track("{{ states('sensor.test') }}")
+        track("{{ states('sensor.test') }}")
+        track("{{ states('sensor.test') }} {{ unit }}", {"unit": "W"})
+        track("{{ states('sensor.test') }} {{ unit }}", {"unit": "W"})
+        track("{{ states('sensor.test') }} {{ unit }}", {"unit": "kW"})
+        # Equal variables of other types are not shared
+        track("{{ states('sensor.test') }} {{ x }}", {"x": 1})
+        track("{{ states('sensor.test') }} {{ x }}", {"x": True})
+        track("{{ states('sensor.test') }} {{ x }}", {"x": 1.0})
+        # Variables which can't be hashed are not shared
+        track("{{ states('sensor.test') }}{{ trigger.x }}", {"trigger": {"x": 1}})
+        track("{{ states('sensor.test') }}{{ trigger.x }}", {"trigger": {"x": 1}})
+        # Templates reading the time are not shared
+        track("{{ states('sensor.test') }} {{ now().year > 2000 }}")
+        track("{{ states('sensor.test') }} {{ now().year > 2000 }}")
+        await hass.async_block_till_done()
+        assert len(renders) == 10
+
+        renders.clear()
+        hass.states.async_set("sensor.test", "5")
+        await hass.async_block_till_done()
+
+    assert len(renders) == 10
+    assert sorted(str(result) for result in results) == sorted(
+        ["5", "5", "5 W", "5 W", "5 kW", "5 1", "5 True", "5 1.0"]
+        + ["51", "51", "5 True", "5 True"]
+    )
+
+
+async def test_track_template_result_slow_in_executor(hass):
+    """Test slow templates are rendered in the executor."""
+    hass.states.async_set("sensor.test", "1")
+    results = []
+    template = Template("{{ states('sensor.test') }}", hass)
+
+    info = async_track_template_result(
+        hass,
+        [TrackTemplate(template, None)],
+        lambda event, updates: results.append(updates.pop().result),
+    )
+    await hass.async_block_till_done()
+    stats = async_get_template_render_stats(hass)[template.template]
+    assert stats["renders"] == 1
+    assert not stats["slow"]
+
+    with patch(
+        "homeassistant.helpers.event.SLOW_TEMPLATE_RENDER_TIME", 0
+    ), patch.object(
+        hass, "async_add_executor_job", wraps=hass.async_add_executor_job
+    ) as mock_executor:
+        hass.states.async_set("sensor.test", "2")
+        # The render is done in the executor, the result comes later
+        assert results == []
+        await hass.async_block_till_done()
+        assert results == [2]
+        assert mock_executor.called
+
+        # Changes while rendering are rendered once the render is done
+        hass.states.async_set("sensor.test", "3")
+        hass.states.async_set("sensor.test", "4")
+        hass.states.async_set("sensor.test", "5")
+        await hass.async_block_till_done()
+        assert results[-1] == 5
+        assert len(results) <= 4
+
+        stats = async_get_template_render_stats(hass)[template.template]
+        assert stats["executor_renders"] >= 2
+        assert stats["slow"]
+
+        info.async_remove()
+        hass.states.async_set("sensor.test", "6")
+        await hass.async_block_till_done()
+        assert results[-1] == 5
+
+
+async def test_track_template_result_slow_in_executor_error(hass):
+    """Test errors rendering slow templates in the executor are reported."""
+    hass.states.async_set("sensor.test", "1")
+    results = []
+    template = Template("{{ states('sensor.test') }}", hass)
+
+    info = async_track_template_result(
+        hass,
+        [TrackTemplate(template, None)],
+        lambda event, updates: results.append(updates.pop().result),
+    )
+    await hass.async_block_till_done()
+    assert results == []
+
+    with patch("homeassistant.helpers.event.SLOW_TEMPLATE_RENDER_TIME", 0):
+        with patch.object(Template, "_render_to_info", side_effect=KeyError("bad")):
+            hass.states.async_set("sensor.test", "2")
+            await hass.async_block_till_done()
+        assert len(results) == 1
+        assert isinstance(results[0], TemplateError)
+        assert "KeyError" in str(results[0])
+
+        # The tracker keeps rendering once the error is gone
+        info.async_refresh()
+        await hass.async_block_till_done()
+        assert results[-1] == 2
+
+    info.async_remove()
+
+
 async def test_track_template_result(hass):
     """Test tracking template."""
     specific_runs = []
@@ -2321,6 +2499,25 @@ async def test_async_track_template_result_multiple_templates_mixing_listeners(h
     ]
 
 
+async def test_queue_event_batches(hass):
+    """Test batches of events are put in a queue."""
+    batch_queue = queue.Queue()
+    unsub = async_queue_event_batches(hass, "test", batch_queue)
+
+    hass.bus.async_fire("test", {"idx": 0})
+    hass.bus.async_fire("test", {"idx": 1})
+    hass.bus.async_fire("other")
+    await hass.async_block_till_done()
+
+    assert batch_queue.qsize() == 1
+    assert [event.data["idx"] for event in batch_queue.get()] == [0, 1]
+
+    unsub()
+    hass.bus.async_fire("test", {"idx": 2})
+    await hass.async_block_till_done()
+    assert batch_queue.empty()
+
+
 async def test_track_same_state_simple_no_trigger(hass):
     """Test track_same_change with no trigger."""
     callback_runs = []
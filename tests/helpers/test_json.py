@@ -1,8 +1,15 @@
 """Test Home Assistant remote methods and classes."""
+import json
+
 import pytest
 
 from homeassistant import core
-from homeassistant.helpers.json import JSONEncoder
+from homeassistant.helpers.json import (
+    JSONEncoder,
+    state_attributes_json,
+    state_json,
+    states_snapshot_json,
+)
 from homeassistant.util import dt as dt_util
 
 
@@ -19,3 +26,39 @@ def test_json_encoder(hass):
 
     now = dt_util.utcnow()
     assert ha_json_enc.default(now) == now.isoformat()
+
+
+def test_state_json():
+    """Test the JSON of a state is encoded once and matches its dict."""
+    now = dt_util.utcnow()
+    state = core.State(
+        "test.test", "hello", {"name": "Test", "values": {1, 2}}, now, now
+    )
+
+    encoded = state_json(state)
+    assert encoded == json.dumps(state.as_dict(), cls=JSONEncoder)
+    assert state_json(state) is encoded
+    assert state_attributes_json(state) == json.dumps(
+        dict(state.attributes), cls=JSONEncoder
+    )
+
+    state = core.State("test.test", "nan", {"value": float("nan")})
+    with pytest.raises(ValueError):
+        state_json(state)
+
+
+async def test_states_snapshot_json(hass):
+    """Test the JSON of a states snapshot is shared until a state changes."""
+    hass.states.async_set("test.one", "on", {"value": 1})
+    snapshot = hass.states.async_snapshot()
+
+    states_json = states_snapshot_json(snapshot)
+    assert json.loads(states_json) == [hass.states.get("test.one").as_dict()]
+    assert states_snapshot_json(hass.states.async_snapshot()) is states_json
+
+    hass.states.async_set("test.two", "off")
+    new_json = states_snapshot_json(hass.states.async_snapshot())
+    assert new_json is not states_json
+    assert len(json.loads(new_json)) == 2
+    # The state which did not change is not encoded again
+    assert state_json(hass.states.get("test.one")) in new_json
@@ -1,4 +1,5 @@
 """Test Home Assistant template helper methods."""
+import asyncio
 from datetime import datetime
 import math
 import random
@@ -12,6 +13,8 @@ from homeassistant.components import group
 from homeassistant.config import async_process_ha_core_config
 from homeassistant.const import (
     ATTR_UNIT_OF_MEASUREMENT,
+    EVENT_HOMEASSISTANT_FINAL_WRITE,
+    EVENT_HOMEASSISTANT_STARTED,
     LENGTH_METERS,
     MASS_GRAMS,
     PRESSURE_PA,
@@ -63,6 +66,52 @@ def assert_result_info(info, result, entities=None, domains=None, all_states=Fal
         assert not hasattr(info, "_domains")
 
 
+async def test_render_info_entity_fields(hass):
+    """Test the state fields read by a template are collected."""
+    hass.states.async_set(
+        "sensor.test", "on", {"friendly_name": "Test", "unit_of_measurement": "W"}
+    )
+    hass.states.async_set("light.test", "on", {"brightness": 10})
+
+    info = template.Template(
+        "{{ states.sensor.test.name }} {{ is_state('light.test', 'on') }}"
+        " {{ state_attr('light.test', 'brightness') }}",
+        hass,
+    ).async_render_to_info()
+    assert info.entity_fields == {
+        "sensor.test": {"friendly_name"},
+        "light.test": {None, "brightness"},
+    }
+
+    info = template.Template(
+        "{{ states.sensor.test.state_with_unit }} {{ 'color' in states.light.test.attributes }}"
+        " {{ states.sensor.test.domain }}",
+        hass,
+    ).async_render_to_info()
+    assert info.entity_fields == {
+        "sensor.test": {None, "unit_of_measurement"},
+        "light.test": {"color"},
+    }
+
+    # Reading the whole state or all attributes depends on all fields
+    info = template.Template(
+        "{{ states.sensor.test.state }} {{ states.sensor.test.last_updated }}"
+        " {{ states.light.test.attributes }}",
+        hass,
+    ).async_render_to_info()
+    assert info.entities == {"sensor.test", "light.test"}
+    assert info.entity_fields == {}
+    assert info.result() == (
+        f"on {hass.states.get('sensor.test').last_updated} {{'brightness': 10}}"
+    )
+
+    info = template.Template(
+        "{{ expand('sensor.test') | map(attribute='state') | list }}", hass
+    ).async_render_to_info()
+    assert info.entities == {"sensor.test"}
+    assert info.entity_fields == {}
+
+
 def test_template_equality():
     """Test template comparison and hashing."""
     template_one = template.Template("{{ template_one }}")
@@ -2434,3 +2483,121 @@ async def test_parse_result(hass):
         ("0011101.00100001010001", "0011101.00100001010001"),
     ):
         assert template.Template(tpl, hass).async_render() == result
+
+
+async def test_bytecode_cache(hass, tmp_path):
+    """Test compiled templates are stored on disk and reused."""
+    path = str(tmp_path / template.BYTECODE_CACHE_FILE)
+    source = "{{ states('sensor.temperature') | float * 2 }}"
+    hass.states.async_set("sensor.temperature", "21")
+    cache = template.BytecodeCache()
+
+    with patch.object(template, "_BYTECODE_CACHE", cache):
+        cache.load(path)
+        template.TemplateEnvironment(hass).compile(source)
+        cache.save()
+
+        cache.load(path)
+        with patch.object(
+            template.ImmutableSandboxedEnvironment, "compile"
+        ) as mock_compile:
+            tpl = template.Template(source, hass)
+            assert tpl.async_render() == 42.0
+        assert not mock_compile.called
+
+        # Templates not used since the cache was loaded are dropped
+        cache.load(path)
+        template.TemplateEnvironment(hass).compile("{{ 1 }}")
+        cache.save()
+        cache.load(path)
+        assert cache.get(source, True) is None
+        assert cache.get("{{ 1 }}", True) is not None
+        # Templates compiled without hass are kept apart
+        assert cache.get("{{ 1 }}", False) is None
+        cache.disable()
+
+
+async def test_bytecode_cache_other_version(hass, tmp_path):
+    """Test the cache of another version or a corrupt cache is discarded."""
+    path = str(tmp_path / template.BYTECODE_CACHE_FILE)
+    cache = template.BytecodeCache()
+    cache.load(path)
+    cache.set("{{ 1 }}", True, compile("1", "<template>", "exec"))
+    cache.save()
+
+    with patch.object(template, "BYTECODE_CACHE_VERSION", 0):
+        cache.load(path)
+    assert cache.get("{{ 1 }}", True) is None
+
+    with open(path, "wb") as fdesc:
+        fdesc.write(b"corrupt")
+    cache.load(path)
+    assert cache.get("{{ 1 }}", True) is None
+    cache.disable()
+
+    # A disabled cache stores nothing
+    cache.set("{{ 1 }}", True, compile("1", "<template>", "exec"))
+    assert cache.get("{{ 1 }}", True) is None
+
+
+async def test_async_load_bytecode_cache(hass, tmp_path):
+    """Test the cache is written and disabled once started."""
+    (tmp_path / ".storage").mkdir()
+    hass.config.config_dir = str(tmp_path)
+    path = str(tmp_path / ".storage" / template.BYTECODE_CACHE_FILE)
+    cache = template.BytecodeCache()
+
+    with patch.object(template, "_BYTECODE_CACHE", cache):
+        await template.async_load_bytecode_cache(hass)
+        template.Template("{{ 1 + 1 }}", hass).ensure_valid()
+        hass.bus.async_fire(EVENT_HOMEASSISTANT_STARTED)
+        await hass.async_block_till_done()
+        assert cache.path is None
+
+        # Templates compiled once started are not kept
+        template.Template("{{ 1 + 2 }}", hass).ensure_valid()
+        hass.bus.async_fire(EVENT_HOMEASSISTANT_FINAL_WRITE)
+        await hass.async_block_till_done()
+
+    cache.load(path)
+    assert cache.get("{{ 1 + 1 }}", True) is not None
+    assert cache.get("{{ 1 + 2 }}", True) is None
+    cache.disable()
+
+
+async def test_async_load_bytecode_cache_stopped_before_started(hass, tmp_path):
+    """Test the cache is written when stopping before started."""
+    (tmp_path / ".storage").mkdir()
+    hass.config.config_dir = str(tmp_path)
+    cache = template.BytecodeCache()
+
+    with patch.object(template, "_BYTECODE_CACHE", cache):
+        await template.async_load_bytecode_cache(hass)
+        template.Template("{{ 1 + 1 }}", hass).ensure_valid()
+        hass.bus.async_fire(EVENT_HOMEASSISTANT_FINAL_WRITE)
+        await hass.async_block_till_done()
+        assert (tmp_path / ".storage" / template.BYTECODE_CACHE_FILE).exists()
+        assert cache.path is None
+
+
+async def test_render_to_info_in_executor(hass):
+    """Test rendering in the executor reads a snapshot of the states."""
+    hass.states.async_set("sensor.one", "1", {"unit": "W"})
+    hass.states.async_set("sensor.two", "2")
+    hass.states.async_set("light.one", "on")
+    tpl = template.Template(
+        "{{ states('sensor.one') }} {{ state_attr('sensor.one', 'unit') }}"
+        " {{ states.sensor | count }} {{ states | map(attribute='entity_id') | list }}",
+        hass,
+    )
+
+    render = hass.async_create_task(tpl.async_render_to_info_in_executor())
+    await asyncio.sleep(0)
+    # Changes once the render started are not seen by it
+    hass.states.async_set("sensor.one", "3")
+    info = await render
+    assert info.result() == ("1 W 2 ['light.one', 'sensor.one', 'sensor.two']")
+    assert info.entities == {"sensor.one"}
+    assert info.domains_lifecycle == {"sensor"}
+    assert info.all_states
+    assert info.render_time > 0
@@ -472,6 +472,7 @@ async def test_loading_configuration(hass):
             "internal_url": "http://example.local",
             "media_dirs": {"mymedia": "/usr"},
             "legacy_templates": True,
+            "executor_limits": {"hue": 2},
         },
     )
 
@@ -489,6 +490,7 @@ async def test_loading_configuration(hass):
     assert hass.config.media_dirs == {"mymedia": "/usr"}
     assert hass.config.config_source == config_util.SOURCE_YAML
     assert hass.config.legacy_templates is True
+    assert hass.config.executor_limits == {"hue": 2}
 
 
 async def test_loading_configuration_temperature_unit(hass):
@@ -3,9 +3,12 @@
 import asyncio
 from datetime import datetime, timedelta
 import functools
+import json
 import logging
 import os
 from tempfile import TemporaryDirectory
+import threading
+from types import MappingProxyType
 from unittest.mock import MagicMock, Mock, PropertyMock, patch
 
 import pytest
@@ -34,21 +37,30 @@ from homeassistant.const import (
 )
 import homeassistant.core as ha
 from homeassistant.exceptions import (
+    HomeAssistantError,
     InvalidEntityFormatError,
     InvalidStateError,
     ServiceNotFound,
 )
 import homeassistant.util.dt as dt_util
+from homeassistant.util.job_stats import JobStats, current_integration
 from homeassistant.util.unit_system import METRIC_SYSTEM
 
-from tests.common import async_capture_events, async_mock_service
+from tests.common import (
+    async_capture_events,
+    async_fire_time_changed,
+    async_mock_service,
+)
 
 PST = pytz.timezone("America/Los_Angeles")
 
 
 def test_split_entity_id():
     """Test split_entity_id."""
-    assert ha.split_entity_id("domain.object_id") == ["domain", "object_id"]
+    assert ha.split_entity_id("domain.object_id") == ("domain", "object_id")
+    assert ha.split_entity_id("domain.object_id") is ha.split_entity_id(
+        "domain.object_id"
+    )
 
 
 def test_async_add_hass_job_schedule_callback():
@@ -76,7 +88,7 @@ def test_async_add_hass_job_schedule_partial_callback():
 
 def test_async_add_hass_job_schedule_coroutinefunction(loop):
     """Test that we schedule coroutines and add jobs to the job pool."""
-    hass = MagicMock(loop=MagicMock(wraps=loop))
+    hass = MagicMock(loop=MagicMock(wraps=loop), job_stats=None)
 
     async def job():
         pass
@@ -89,7 +101,7 @@ def test_async_add_hass_job_schedule_coroutinefunction(loop):
 
 def test_async_add_hass_job_schedule_partial_coroutinefunction(loop):
     """Test that we schedule partial coros and add jobs to the job pool."""
-    hass = MagicMock(loop=MagicMock(wraps=loop))
+    hass = MagicMock(loop=MagicMock(wraps=loop), job_stats=None)
 
     async def job():
         pass
@@ -104,7 +116,7 @@ def test_async_add_hass_job_schedule_partial_coroutinefunction(loop):
 
 def test_async_add_job_add_hass_threaded_job_to_pool():
     """Test that we schedule coroutines and add jobs to the job pool."""
-    hass = MagicMock()
+    hass = MagicMock(job_stats=None, config=MagicMock(executor_limits={}))
 
     def job():
         pass
@@ -130,7 +142,7 @@ def test_async_create_task_schedule_coroutine(loop):
 
 def test_async_run_hass_job_calls_callback():
     """Test that the callback annotation is respected."""
-    hass = MagicMock()
+    hass = MagicMock(job_stats=None)
     calls = []
 
     def job():
@@ -355,6 +367,331 @@ async def test_eventbus_add_remove_listener(hass):
     unsub()
 
 
+async def test_eventbus_filtered_listener(hass):
+    """Test a listener only runs for the events passing its filter."""
+    calls = []
+
+    @ha.callback
+    def listener(event):
+        """Mock listener."""
+        calls.append(event)
+
+    @ha.callback
+    def event_filter(event):
+        """Mock filter."""
+        return event.data["test"] == 1
+
+    unsub = hass.bus.async_listen("test", listener, event_filter)
+
+    with patch.object(hass, "async_add_hass_job") as mock_add_job:
+        hass.bus.async_fire("test", {"test": 0})
+    assert not mock_add_job.called
+
+    hass.bus.async_fire("test", {"test": 1})
+    await hass.async_block_till_done()
+    assert [event.data["test"] for event in calls] == [1]
+
+    unsub()
+    hass.bus.async_fire("test", {"test": 1})
+    await hass.async_block_till_done()
+    assert len(calls) == 1
+
+
+async def test_eventbus_filter_errors(hass, caplog):
+    """Test a failing filter is logged and a filter must be a callback."""
+    calls = []
+
+    @ha.callback
+    def event_filter(event):
+        """Mock filter."""
+        raise ValueError("boom")
+
+    hass.bus.async_listen("test", calls.append, event_filter)
+    hass.bus.async_fire("test")
+    await hass.async_block_till_done()
+    assert not calls
+    assert "Error in event filter" in caplog.text
+
+    with pytest.raises(HomeAssistantError):
+        hass.bus.async_listen("test", calls.append, lambda event: True)
+
+
+async def test_eventbus_run_immediately(hass, caplog):
+    """Test listeners that run immediately are isolated from each other."""
+    calls = []
+
+    @ha.callback
+    def failing_listener(event):
+        """Mock failing listener."""
+        raise ValueError("boom")
+
+    @ha.callback
+    def listener(event):
+        """Mock listener."""
+        calls.append(event)
+
+    hass.bus.async_listen("test", failing_listener, run_immediately=True)
+    unsub = hass.bus.async_listen("test", listener, run_immediately=True)
+
+    with patch.object(hass, "async_add_hass_job") as mock_add_job:
+        hass.bus.async_fire("test")
+    assert not mock_add_job.called
+    assert len(calls) == 1
+    assert "Error running job" in caplog.text
+
+    unsub()
+    hass.bus.async_fire("test")
+    assert len(calls) == 1
+
+    with pytest.raises(HomeAssistantError):
+        hass.bus.async_listen("test", lambda event: None, run_immediately=True)
+
+
+async def test_eventbus_run_immediately_after_scheduling(hass):
+    """Test events fired by an immediate listener reach others in order."""
+    order = []
+
+    @ha.callback
+    def fire_other(event):
+        """Fire another event while handling the first."""
+        if event.data["idx"] == 0:
+            hass.bus.async_fire("test", {"idx": 1})
+
+    @ha.callback
+    def listener(event):
+        """Mock listener."""
+        order.append(event.data["idx"])
+
+    hass.bus.async_listen("test", fire_other, run_immediately=True)
+    hass.bus.async_listen("test", listener)
+
+    hass.bus.async_fire("test", {"idx": 0})
+    await hass.async_block_till_done()
+    assert order == [0, 1]
+
+
+async def test_eventbus_listen_batch(hass):
+    """Test events are passed to a batch listener once per loop iteration."""
+    batches = []
+
+    @ha.callback
+    def listener(events):
+        """Mock batch listener."""
+        batches.append([event.data["idx"] for event in events])
+
+    unsub = hass.bus.async_listen_batch(
+        "test", listener, event_filter=ha.callback(lambda event: event.data["idx"])
+    )
+
+    for idx in range(4):
+        hass.bus.async_fire("test", {"idx": idx})
+    await hass.async_block_till_done()
+    assert batches == [[1, 2, 3]]
+
+    hass.bus.async_fire("test", {"idx": 4})
+    await hass.async_block_till_done()
+    assert batches == [[1, 2, 3], [4]]
+
+    unsub()
+    hass.bus.async_fire("test", {"idx": 5})
+    await hass.async_block_till_done()
+    assert len(batches) == 2
+    assert "test" not in hass.bus.async_listeners()
+
+
+async def test_eventbus_listen_batch_interval(hass):
+    """Test a batch listener with an interval and events left when removed."""
+    batches = []
+
+    @ha.callback
+    def listener(events):
+        """Mock batch listener."""
+        batches.append([event.data["idx"] for event in events])
+
+    unsub = hass.bus.async_listen_batch("test", listener, interval=5)
+
+    hass.bus.async_fire("test", {"idx": 0})
+    await hass.async_block_till_done()
+    hass.bus.async_fire("test", {"idx": 1})
+    await hass.async_block_till_done()
+    assert batches == []
+
+    async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=5))
+    await hass.async_block_till_done()
+    assert batches == [[0, 1]]
+
+    hass.bus.async_fire("test", {"idx": 2})
+    await hass.async_block_till_done()
+    unsub()
+    await hass.async_block_till_done()
+    assert batches == [[0, 1], [2]]
+
+
+async def test_job_stats(hass):
+    """Test jobs are recorded when the job stats are enabled."""
+    hass.job_stats = JobStats(hass.loop)
+
+    @ha.callback
+    def listener(event):
+        """Mock callback listener."""
+
+    async def async_listener(event):
+        """Mock coroutine listener."""
+        await asyncio.sleep(0)
+
+    hass.bus.async_listen("test", listener)
+    hass.bus.async_listen("test", async_listener)
+    hass.bus.async_listen("test", listener, run_immediately=True)
+    hass.services.async_register("test_domain", "test_service", async_listener)
+
+    hass.bus.async_fire("test")
+    await hass.services.async_call("test_domain", "test_service", blocking=True)
+    await hass.async_block_till_done()
+
+    assert hass.job_stats.as_dict()["integrations"][__name__]["calls"] == 4
+
+    hass.job_stats = None
+    hass.bus.async_fire("test")
+    await hass.async_block_till_done()
+
+
+async def test_executor_limits(hass):
+    """Test executor jobs are limited and recorded by integration."""
+    hass.config.executor_limits = {__name__: 1}
+    hass.job_stats = JobStats(hass.loop)
+    release = threading.Event()
+    running = []
+    max_running = 0
+
+    def job(value):
+        """Block an executor thread."""
+        nonlocal max_running
+        running.append(value)
+        max_running = max(max_running, len(running))
+        release.wait(5)
+        running.remove(value)
+        return value
+
+    tasks = [hass.async_add_executor_job(job, idx) for idx in range(3)]
+    await asyncio.sleep(0.05)
+
+    executor = hass.job_stats.as_dict()["executor"][__name__]
+    assert executor["in_flight"] == 1
+    assert executor["queued"] == 2
+
+    release.set()
+    assert await asyncio.gather(*tasks) == [0, 1, 2]
+    assert max_running == 1
+
+    executor = hass.job_stats.as_dict()["executor"][__name__]
+    assert executor["calls"] == 3
+    assert executor["in_flight"] == 0
+    assert executor["queued"] == 0
+    assert executor["wait_time"] > 0
+    assert executor["max_run_time"] <= executor["run_time"]
+
+    # Other integrations are not limited
+    hass.job_stats = None
+    hass.config.executor_limits = {"other": 1}
+    release.clear()
+    tasks = [hass.async_add_executor_job(job, idx) for idx in range(2)]
+    await asyncio.sleep(0.05)
+    assert len(running) == 2
+    release.set()
+    await asyncio.gather(*tasks)
+
+
+async def test_executor_jobs_charged_to_current_integration(hass):
+    """Test executor jobs are charged to the integration running the caller."""
+    hass.config.executor_limits = {"caller": 1}
+    hass.job_stats = JobStats(hass.loop)
+
+    async def async_run_nested_job():
+        """Submit a library function from the event loop."""
+        return await hass.async_add_executor_job(json.dumps, {})
+
+    def job():
+        """Wait for the library function."""
+        return asyncio.run_coroutine_threadsafe(
+            async_run_nested_job(), hass.loop
+        ).result(5)
+
+    token = current_integration.set("caller")
+    try:
+        assert await hass.async_add_executor_job(job) == "{}"
+    finally:
+        current_integration.reset(token)
+
+    executor = hass.job_stats.as_dict()["executor"]
+    assert list(executor) == ["caller"]
+    assert executor["caller"]["calls"] == 2
+    hass.job_stats = None
+
+
+async def test_executor_limits_cancelled_while_waiting(hass):
+    """Test a job cancelled while waiting for its limit is no longer queued."""
+    hass.config.executor_limits = {__name__: 1}
+    hass.job_stats = JobStats(hass.loop)
+    release = threading.Event()
+
+    def job():
+        """Block an executor thread."""
+        release.wait(5)
+
+    blocking = hass.async_add_executor_job(job)
+    waiting = hass.async_add_executor_job(job)
+    await asyncio.sleep(0.05)
+    assert hass.job_stats.as_dict()["executor"][__name__]["queued"] == 1
+
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    assert hass.job_stats.as_dict()["executor"][__name__]["queued"] == 0
+
+    release.set()
+    await blocking
+    executor = hass.job_stats.as_dict()["executor"][__name__]
+    assert executor["calls"] == 1
+    assert executor["queued"] == 0
+    hass.job_stats = None
+
+
+async def test_executor_limits_nested_job(hass):
+    """Test a job waiting for another job of its integration does not deadlock."""
+    hass.config.executor_limits = {__name__: 1}
+
+    def nested_job():
+        """Run while the outer job holds the limit."""
+        return "nested"
+
+    async def async_run_nested_job():
+        """Submit the nested job from the event loop."""
+        return await hass.async_add_executor_job(nested_job)
+
+    def job():
+        """Wait for the nested job."""
+        return asyncio.run_coroutine_threadsafe(
+            async_run_nested_job(), hass.loop
+        ).result(5)
+
+    assert await hass.async_add_executor_job(job) == "nested"
+
+    # Jobs submitted from the event loop still wait for the limit
+    release = threading.Event()
+
+    def blocking_job():
+        """Block an executor thread."""
+        release.wait(5)
+
+    blocking = hass.async_add_executor_job(blocking_job)
+    waiting = hass.async_add_executor_job(nested_job)
+    await asyncio.sleep(0.05)
+    assert not waiting.done()
+    release.set()
+    await blocking
+    assert await waiting == "nested"
+
+
 async def test_eventbus_unsubscribe_listener(hass):
     """Test unsubscribe listener from returned function."""
     calls = []
@@ -480,6 +817,18 @@ def test_state_init():
         ha.State("domain.long_state", "t" * 256)
 
 
+def test_state_from_trusted():
+    """Test creating a state from trusted values."""
+    now = dt_util.utcnow()
+    context = ha.Context()
+    attributes = MappingProxyType({"attr": 1})
+    state = ha.State.from_trusted("light.bowl", "on", attributes, now, now, context)
+    assert state == ha.State("light.bowl", "on", {"attr": 1}, now, now, context)
+    assert state.attributes is attributes
+    assert (state.domain, state.object_id) == ("light", "bowl")
+    assert state.as_dict()["state"] == "on"
+
+
 def test_state_domain():
     """Test domain."""
     state = ha.State("some_domain.hello", "world")
@@ -528,6 +877,46 @@ def test_state_dict_conversion_with_wrong_data():
     assert wrong_context.context.id == "123"
 
 
+async def test_statemachine_snapshot(hass):
+    """Test the snapshot is shared until a state changes."""
+    hass.states.async_set("light.bowl", "on")
+    snapshot = hass.states.async_snapshot()
+    assert [state.entity_id for state in snapshot] == ["light.bowl"]
+    assert len(snapshot) == 1
+    assert hass.states.async_snapshot() is snapshot
+
+    calls = []
+    assert snapshot.cached("key", lambda: calls.append(1) or "value") == "value"
+    assert snapshot.cached("key", lambda: calls.append(1) or "other") == "value"
+    assert len(calls) == 1
+
+    # Setting the same state does not change the states
+    hass.states.async_set("light.bowl", "on")
+    assert hass.states.async_snapshot() is snapshot
+
+    hass.states.async_set("light.bowl", "off")
+    changed = hass.states.async_snapshot()
+    assert changed is not snapshot
+    assert changed.version > snapshot.version
+    assert [state.state for state in changed] == ["off"]
+    assert [state.state for state in snapshot] == ["on"]
+
+    hass.states.async_remove("light.bowl")
+    assert len(hass.states.async_snapshot()) == 0
+
+
+def test_state_cached():
+    """Test values derived from a state are created once."""
+    state = ha.State.from_trusted(
+        "light.bowl", "on", MappingProxyType({}), None, None, ha.Context()
+    )
+    calls = []
+    assert state.cached("key", lambda: calls.append(1) or "value") == "value"
+    assert state.cached("key", lambda: calls.append(1) or "other") == "value"
+    assert len(calls) == 1
+    assert ha.State("light.bowl", "on").cached("key", lambda: "other") == "other"
+
+
 def test_state_repr():
     """Test state.repr."""
     assert (
@@ -623,6 +1012,25 @@ async def test_statemachine_last_changed_not_updated_on_same_state(hass):
     assert state.last_changed == state2.last_changed
 
 
+async def test_statemachine_reuses_attributes(hass):
+    """Test unchanged attributes are shared by the new state."""
+    hass.states.async_set("light.bowl", "on", {"attr": 1})
+    old_state = hass.states.get("light.bowl")
+
+    hass.states.async_set("light.bowl", "off", {"attr": 1})
+    state = hass.states.get("light.bowl")
+    assert state.attributes is old_state.attributes
+    assert state.last_changed == state.last_updated
+
+    hass.states.async_set("light.bowl", "off", {"attr": 2})
+    new_state = hass.states.get("light.bowl")
+    assert new_state.attributes == {"attr": 2}
+    assert new_state.last_changed == state.last_changed
+
+    with pytest.raises(InvalidStateError):
+        hass.states.async_set("light.bowl", "t" * 256)
+
+
 async def test_statemachine_force_update(hass):
     """Test force update option."""
     hass.states.async_set("light.bowl", "on", {})
@@ -957,6 +1365,7 @@ async def test_bad_timezone_raises_value_error(hass):
 def test_create_timer(mock_monotonic, loop):
     """Test create timer."""
     hass = MagicMock()
+    hass.bus._listeners = {EVENT_TIME_CHANGED: [Mock()]}
     funcs = []
     orig_callback = ha.callback
 
@@ -972,8 +1381,8 @@ def test_create_timer(mock_monotonic, loop):
     ):
         ha._async_create_timer(hass)
 
-    assert len(funcs) == 2
-    fire_time_event, stop_timer = funcs
+    assert len(funcs) == 3
+    fire_time_event, _, stop_timer = funcs
 
     assert len(hass.loop.call_later.mock_calls) == 1
     delay, callback, target = hass.loop.call_later.mock_calls[0][1]
@@ -1009,6 +1418,7 @@ def test_create_timer(mock_monotonic, loop):
 def test_timer_out_of_sync(mock_monotonic, loop):
     """Test create timer."""
     hass = MagicMock()
+    hass.bus._listeners = {EVENT_TIME_CHANGED: [Mock()]}
     funcs = []
     orig_callback = ha.callback
 
@@ -1047,8 +1457,8 @@ def test_timer_out_of_sync(mock_monotonic, loop):
 
         assert event_context_0 == event_context_1
 
-        assert len(funcs) == 2
-        fire_time_event, _ = funcs
+        assert len(funcs) == 3
+        fire_time_event, _, _ = funcs
 
     assert len(hass.loop.call_later.mock_calls) == 2
 
@@ -1058,6 +1468,62 @@ def test_timer_out_of_sync(mock_monotonic, loop):
     assert abs(target - 14.2) < 0.001
 
 
+@patch("homeassistant.core.monotonic")
+def test_timer_sleeps_without_listeners(mock_monotonic, loop):
+    """Test the timer stops ticking without listeners and wakes up again."""
+    hass = MagicMock()
+    hass.bus._listeners = {}
+    mock_monotonic.return_value = 10.2
+
+    with patch(
+        "homeassistant.core.dt_util.utcnow",
+        return_value=datetime(2018, 12, 31, 3, 4, 5, 333333),
+    ):
+        ha._async_create_timer(hass)
+
+    _, callback, target = hass.loop.call_later.mock_calls[0][1]
+    callback(target)
+    assert not hass.bus.async_fire.called
+    assert len(hass.loop.call_later.mock_calls) == 1
+
+    wake_timer = hass.bus._async_time_changed_listened
+    wake_timer()
+    assert len(hass.loop.call_later.mock_calls) == 2
+    # Already ticking
+    wake_timer()
+    assert len(hass.loop.call_later.mock_calls) == 2
+
+    hass.bus._listeners[EVENT_TIME_CHANGED] = [Mock()]
+    _, callback, target = hass.loop.call_later.mock_calls[1][1]
+    callback(target)
+    assert hass.bus.async_fire.mock_calls[0][1][0] == EVENT_TIME_CHANGED
+    assert len(hass.loop.call_later.mock_calls) == 3
+    # The listeners of all event types are not counted on each tick
+    assert not hass.bus.async_listeners.called
+
+
+async def test_time_changed_listener_wakes_timer(hass):
+    """Test the first time changed listener wakes the timer up."""
+    wake_timer = Mock()
+    hass.bus._async_time_changed_listened = wake_timer
+
+    unsub = hass.bus.async_listen(EVENT_TIME_CHANGED, lambda event: None)
+    hass.bus.async_listen(EVENT_TIME_CHANGED, lambda event: None)
+    assert len(wake_timer.mock_calls) == 1
+    unsub()
+
+
+async def test_time_changed_not_sent_to_match_all(hass):
+    """Test time changed events only go to their own listeners."""
+    events = async_capture_events(hass, MATCH_ALL)
+    time_events = async_capture_events(hass, EVENT_TIME_CHANGED)
+
+    hass.bus.async_fire(EVENT_TIME_CHANGED, {ATTR_NOW: dt_util.utcnow()})
+    await hass.async_block_till_done()
+    assert not events
+    assert len(time_events) == 1
+
+
 async def test_hass_start_starts_the_timer(loop):
     """Test when hass starts, it starts the timer."""
     hass = ha.HomeAssistant()
@@ -1462,6 +1928,67 @@ async def test_async_entity_ids_count(hass):
     assert hass.states.async_entity_ids_count("light") == 3
 
 
+async def test_domain_index_follows_set_and_remove(hass):
+    """Test the domain filters follow states being set and removed."""
+    hass.states.async_set("light.bowl", "on")
+    hass.states.async_set("switch.link", "on")
+    hass.states.async_set("light.frog", "on")
+
+    assert hass.states.async_entity_ids("LIGHT") == ["light.bowl", "light.frog"]
+    assert hass.states.async_entity_ids(["light", "light"]) == [
+        "light.bowl",
+        "light.frog",
+    ]
+
+    hass.states.async_set("light.bowl", "off")
+    assert [state.state for state in hass.states.async_all("light")] == ["off", "on"]
+
+    hass.states.async_remove("light.bowl")
+    hass.states.async_remove("switch.link")
+    assert hass.states.async_entity_ids(["light", "switch"]) == ["light.frog"]
+    assert hass.states.async_entity_ids_count("switch") == 0
+    assert hass.states.async_all("switch") == []
+
+    hass.states.async_set("switch.link", "off")
+    assert hass.states.async_entity_ids("switch") == ["switch.link"]
+
+
+async def test_domain_filters_keep_insertion_order(hass):
+    """Test filters on several domains return the states in insertion order."""
+    hass.states.async_set("light.bowl", "on")
+    hass.states.async_set("switch.link", "on")
+    hass.states.async_set("sensor.temperature", "20")
+    hass.states.async_set("light.frog", "on")
+    hass.states.async_set("switch.link", "off")
+
+    assert hass.states.async_entity_ids(["switch", "light"]) == [
+        "light.bowl",
+        "switch.link",
+        "light.frog",
+    ]
+    assert [
+        state.entity_id for state in hass.states.async_all(("light", "switch"))
+    ] == [
+        "light.bowl",
+        "switch.link",
+        "light.frog",
+    ]
+
+    # Removed and added again goes last, like in all states
+    hass.states.async_remove("light.bowl")
+    hass.states.async_set("light.bowl", "on")
+    assert hass.states.async_entity_ids(["light", "switch"]) == [
+        "switch.link",
+        "light.frog",
+        "light.bowl",
+    ]
+    assert [
+        entity_id
+        for entity_id in hass.states.async_entity_ids()
+        if not entity_id.startswith("sensor.")
+    ] == hass.states.async_entity_ids(["light", "switch"])
+
+
 async def test_hassjob_forbid_coroutine():
     """Test hassjob forbids coroutines."""
 
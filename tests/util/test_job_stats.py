@@ -0,0 +1,178 @@
+"""Test the loop lag and job time instrumentation."""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from homeassistant.util.job_stats import JobStats, integration_from_module
+
+
+def test_integration_from_module():
+    """Test modules are grouped by integration."""
+    assert integration_from_module("homeassistant.components.hue.light") == "hue"
+    assert integration_from_module("homeassistant.components.hue") == "hue"
+    assert integration_from_module("custom_components.foo.sensor") == "foo"
+    assert integration_from_module("homeassistant.helpers.event") == (
+        "homeassistant.helpers.event"
+    )
+
+
+async def test_run_callback():
+    """Test callbacks are counted without the time of nested jobs."""
+    stats = JobStats(asyncio.get_running_loop())
+
+    def inner():
+        """Hold the loop."""
+        time.sleep(0.02)
+        return "inner"
+
+    def outer():
+        """Run another job."""
+        return stats.run_callback(inner)
+
+    with patch(
+        "homeassistant.util.job_stats.integration_from_target",
+        side_effect=lambda target: "inner" if target is inner else "outer",
+    ):
+        assert stats.run_callback(outer) == "inner"
+        assert stats.run_callback(outer) == "inner"
+
+    integrations = stats.as_dict()["integrations"]
+    assert list(integrations) == ["inner", "outer"]
+    assert integrations["inner"]["calls"] == 2
+    assert integrations["outer"]["calls"] == 2
+    assert integrations["inner"]["time"] >= 0.04
+    assert integrations["inner"]["max_time"] >= 0.02
+    assert integrations["outer"]["time"] < 0.02
+
+
+async def test_wrap_coroutine():
+    """Test coroutines are timed without the time they await."""
+    stats = JobStats(asyncio.get_running_loop())
+
+    async def job(value):
+        """Await something."""
+        await asyncio.sleep(0.05)
+        time.sleep(0.01)
+        return value
+
+    assert await stats.wrap_coroutine(job, job(1)) == 1
+    stats_job = stats.as_dict()["integrations"][__name__]
+    assert stats_job["calls"] == 1
+    assert 0.01 <= stats_job["time"] < 0.05
+
+
+async def test_wrap_coroutine_errors():
+    """Test exceptions and cancellation reach the coroutine."""
+    stats = JobStats(asyncio.get_running_loop())
+    cancelled = False
+
+    async def fails():
+        """Raise an error."""
+        await asyncio.sleep(0)
+        raise ValueError
+
+    async def waits():
+        """Wait until cancelled."""
+        nonlocal cancelled
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+
+    with pytest.raises(ValueError):
+        await stats.wrap_coroutine(fails, fails())
+
+    task = asyncio.get_running_loop().create_task(stats.wrap_coroutine(waits, waits()))
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert cancelled
+    assert stats.as_dict()["integrations"][__name__]["calls"] == 2
+
+
+def test_executor_job():
+    """Test executor jobs record their wait and run time."""
+    stats = JobStats(None)
+    started = threading.Event()
+    release = threading.Event()
+
+    def job(value):
+        """Block until released."""
+        started.set()
+        release.wait(5)
+        return value
+
+    run = stats.executor_job("test", job)
+    assert stats.as_dict()["executor"]["test"]["queued"] == 1
+
+    thread = threading.Thread(target=run, args=(1,))
+    thread.start()
+    started.wait(5)
+    executor = stats.as_dict()["executor"]["test"]
+    assert executor["queued"] == 0
+    assert executor["in_flight"] == 1
+    assert executor["calls"] == 0
+
+    release.set()
+    thread.join()
+    assert stats.executor_job("test", job)(2) == 2
+    executor = stats.as_dict()["executor"]["test"]
+    assert executor["in_flight"] == 0
+    assert executor["calls"] == 2
+    assert executor["run_time"] >= executor["max_run_time"] > 0
+    assert executor["wait_time"] >= executor["max_wait_time"] > 0
+
+
+async def test_loop_lag():
+    """Test the loop lag is sampled."""
+    stats = JobStats(asyncio.get_running_loop())
+    assert stats.as_dict()["loop_lag"] == {"last": None, "mean": None, "max": None}
+
+    with patch("homeassistant.util.job_stats.LAG_INTERVAL", 0.01):
+        stats.async_start()
+        await asyncio.sleep(0)
+        time.sleep(0.05)
+        await asyncio.sleep(0.02)
+        stats.async_stop()
+
+    loop_lag = stats.as_dict()["loop_lag"]
+    assert loop_lag["max"] >= 0.03
+    assert loop_lag["mean"] <= loop_lag["max"]
+
+
+async def test_executor_job_cancelled_while_queued():
+    """Test a job cancelled before it starts is no longer queued."""
+    loop = asyncio.get_running_loop()
+    stats = JobStats(loop)
+    started = threading.Event()
+    release = threading.Event()
+
+    def block():
+        """Hold the only executor thread."""
+        started.set()
+        release.wait(5)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        blocking = loop.run_in_executor(executor, stats.executor_job("test", block))
+        started.wait(5)
+        job = stats.executor_job("test", lambda: None)
+        future = loop.run_in_executor(executor, job)
+        future.add_done_callback(job.discard)
+        assert stats.as_dict()["executor"]["test"]["queued"] == 1
+
+        future.cancel()
+        await asyncio.sleep(0)
+        assert stats.as_dict()["executor"]["test"]["queued"] == 0
+        release.set()
+        await blocking
+
+    executor_stats = stats.as_dict()["executor"]["test"]
+    assert executor_stats["queued"] == 0
+    assert executor_stats["in_flight"] == 0
+    assert executor_stats["calls"] == 1